@@ -0,0 +1,7 @@
+"""
+בקטסט walk-forward לאסטרטגיות התחזית של bot.py: עוברים על ההיסטוריה הגרלה אחר הגרלה,
+מחשבים תחזית רק מההגרלות שלפני, ובודקים כמה קלפים פגעו בכל עמודה בתוצאה בפועל.
+
+    python -m backtest --csv Chance.csv --last 10000
+    python -m backtest --strategies hot,sets --windows 50,200,1000,all --curves curves.csv
+"""
@@ -0,0 +1,201 @@
+"""
+מנוע ה־walk-forward והאסטרטגיות.
+
+תחזית היא מטריצה (k, 4) של דרגות 0–7, ו־-1 = אין בחירה בעמודה הזאת:
+    hot    – top_n הקלפים החמים בחלון (get_hot_cards) – כל קלף שורה עם עמודה אחת
+    sets   – num_sets צירופים מלאים (score_combinations + top_combinations, כמו suggest_4_sets,
+             עם החלון הקצר RECENT_WINDOW)
+    cold   – top_n הקלפים שהכי הרבה זמן לא יצאו בעמודה שלהם (GapStats.coldest)
+    random – num_sets צירופים אקראיים – קו הבסיס (1/8 לכל עמודה)
+
+אסטרטגיה חדשה = מחלקה עם windows / uses_gaps / predict(counters) ורישום ב־STRATEGIES.
+
+המונים (SlidingWindowCounts / GapIndex של bot) מתעדכנים בכל צעד ב־O(1) להגרלה,
+כך שצעד עולה כמו חישוב תחזית אחד – בלי לספור מחדש את החלון או את ההיסטוריה.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+import bot
+
+BASELINE_HIT_RATE = 1 / bot.NUM_RANKS   # סיכוי של בחירה אקראית לפגוע בעמודה
+
+
+@dataclass(frozen=True)
+class Config:
+    strategy: str
+    window: Optional[int] = bot.STATS_WINDOW   # None = כל ההיסטוריה עד הצעד
+    top_n: int = 3
+    num_sets: int = 3
+    seed: int = 1
+
+    @property
+    def label(self) -> str:
+        cls = STRATEGIES[self.strategy]
+        parts = [self.strategy]
+        if cls.uses_window:
+            parts.append(f"w={self.window or 'all'}")
+        parts.append(f"n={self.num_sets if cls.full_sets else self.top_n}")
+        return " ".join(parts)
+
+
+# === מונים חיים ===
+
+class Counters:
+    """המונים שכל האסטרטגיות קוראות מהם, מעודכנים הגרלה אחר הגרלה."""
+
+    def __init__(self, windows: Iterable[Optional[int]], total: int, gaps: bool):
+        # חלון None = כל ההיסטוריה: חלון בגודל כל הקובץ, שאף פעם לא מתמלא
+        self.windows = {window: bot.SlidingWindowCounts(window or total) for window in windows}
+        self.gaps = bot.GapIndex() if gaps else None
+
+    def extend(self, cards: np.ndarray):
+        for counts in self.windows.values():
+            counts.extend(cards)
+        if self.gaps is not None:
+            self.gaps.extend(cards)
+
+    def push(self, row):
+        for counts in self.windows.values():
+            counts.push(row)
+        if self.gaps is not None:
+            self.gaps.push(row)
+
+    def stats(self, window: Optional[int], pairs: bool = False) -> bot.CardStats:
+        counts = self.windows[window]
+        return bot.CardStats(
+            per_column=counts.counts, n_draws=counts.n_draws, pairs=counts.pairs if pairs else None
+        )
+
+
+# === אסטרטגיות ===
+
+def picks_from_cards(cards) -> np.ndarray:
+    """HotCard / ColdCard -> שורה לכל קלף, עם בחירה רק בעמודה שלו."""
+    picks = np.full((len(cards), bot.NUM_COLUMNS), -1, dtype=np.int8)
+    for row, card in enumerate(cards):
+        picks[row, card.column] = bot.RANK_INDEX[card.rank]
+    return picks
+
+
+class Strategy:
+    uses_window = False    # האם window של Config משנה משהו
+    uses_gaps = False
+    full_sets = False      # צירופים מלאים (num_sets) או קלפים בודדים (top_n)
+
+    def __init__(self, config: Config):
+        self.config = config
+
+    @property
+    def windows(self) -> List[Optional[int]]:
+        return [self.config.window] if self.uses_window else []
+
+    def predict(self, counters: Counters) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HotCards(Strategy):
+    uses_window = True
+
+    def predict(self, counters: Counters) -> np.ndarray:
+        stats = counters.stats(self.config.window)
+        return picks_from_cards(bot.get_hot_cards(stats, self.config.top_n))
+
+
+class HotSets(Strategy):
+    uses_window = True
+    full_sets = True
+
+    @property
+    def windows(self) -> List[Optional[int]]:
+        return [self.config.window, bot.RECENT_WINDOW]
+
+    def predict(self, counters: Counters) -> np.ndarray:
+        stats = counters.stats(self.config.window, pairs=True)
+        recent = counters.stats(bot.RECENT_WINDOW)
+        scores = bot.score_combinations(stats, recent)
+        return np.array(bot.top_combinations(scores, self.config.num_sets), dtype=np.int8)
+
+
+class ColdCards(Strategy):
+    uses_gaps = True
+
+    def predict(self, counters: Counters) -> np.ndarray:
+        return picks_from_cards(counters.gaps.export().coldest(self.config.top_n))
+
+
+class RandomSets(Strategy):
+    full_sets = True
+
+    def __init__(self, config: Config):
+        super().__init__(config)
+        self.rng = np.random.default_rng(config.seed)
+
+    def predict(self, counters: Counters) -> np.ndarray:
+        return self.rng.integers(0, bot.NUM_RANKS, size=(self.config.num_sets, bot.NUM_COLUMNS), dtype=np.int8)
+
+
+STRATEGIES = {"hot": HotCards, "sets": HotSets, "cold": ColdCards, "random": RandomSets}
+
+
+# === walk-forward ===
+
+@dataclass
+class Result:
+    config: Config
+    numbers: np.ndarray    # מספר ההגרלה בכל צעד
+    picks: np.ndarray      # (צעדים, 4) – כמה בחירות היו בכל עמודה
+    hits: np.ndarray       # (צעדים, 4) – כמה מהן פגעו
+    best: np.ndarray       # (צעדים,) – הכי הרבה עמודות שפגעו בשורה אחת של התחזית
+    seconds: float
+
+    @property
+    def steps(self) -> int:
+        return len(self.numbers)
+
+
+def walk_forward(cards: np.ndarray, numbers: np.ndarray, config: Config, start: int) -> Result:
+    """
+    לכל הגרלה t מ־start והלאה: תחזית מהמונים (שמכילים רק את ההגרלות 0..t-1),
+    ניקוד מול cards[t], ורק אז cards[t] נכנסת למונים.
+    """
+    strategy = STRATEGIES[config.strategy](config)
+    counters = Counters(strategy.windows, len(cards), strategy.uses_gaps)
+    counters.extend(cards[:start])
+
+    steps = len(cards) - start
+    picks = np.zeros((steps, bot.NUM_COLUMNS), dtype=np.int16)
+    hits = np.zeros((steps, bot.NUM_COLUMNS), dtype=np.int16)
+    best = np.zeros(steps, dtype=np.int8)
+    rows = cards[start:].tolist()
+
+    began = time.perf_counter()
+    for step, row in enumerate(rows):
+        prediction = strategy.predict(counters)
+        chosen = prediction >= 0
+        matched = chosen & (prediction == cards[start + step])
+        picks[step] = chosen.sum(axis=0)
+        hits[step] = matched.sum(axis=0)
+        best[step] = matched.sum(axis=1).max()
+        counters.push(row)
+
+    return Result(config, numbers[start:], picks, hits, best, time.perf_counter() - began)
+
+
+# === process pool ===
+# ההיסטוריה עוברת לכל worker פעם אחת (initializer) ולא עם כל משימה.
+
+_history: Dict[str, np.ndarray] = {}
+
+
+def init_worker(cards: np.ndarray, numbers: np.ndarray):
+    _history["cards"] = cards
+    _history["numbers"] = numbers
+
+
+def run_config(config: Config, start: int) -> Result:
+    return walk_forward(_history["cards"], _history["numbers"], config, start)
@@ -0,0 +1,207 @@
+"""
+CLI לבקטסט: טוען את ההיסטוריה, מריץ רשת של (אסטרטגיה × חלון) במקביל ב־ProcessPoolExecutor
+ומדפיס טבלת סיכום ועקומות פגיעה.
+
+    python -m backtest [--csv Chance.csv | --synthetic 100k] [--last 10000]
+                       [--strategies hot,sets,cold,random] [--windows 50,200,1000,all]
+                       [--top-n 3] [--sets 3] [--jobs N] [--points 12] [--curves curves.csv]
+
+בטבלה, לכל תצורה:
+    hit%    – כמה מהבחירות פגעו (בחירה = קלף אחד בעמודה אחת); קו הבסיס הוא 12.5%
+    lift    – hit% חלקי 12.5%
+    z       – כמה סטיות תקן מעל/מתחת לניחוש אקראי (|z| < 2 – אין הבדל מובהק)
+    c1..c4  – hit% לכל עמודה (♠️ ♥️ ♦️ ♣️)
+    ≥2 / ≥3 / =4 – באיזה חלק מההגרלות שורה אחת של התחזית פגעה בלפחות 2 / 3 / כל 4 העמודות
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from backtest.engine import BASELINE_HIT_RATE, STRATEGIES, Config, Result, bot, init_worker, run_config
+from benchmarks.generate import generate, parse_size
+
+DEFAULT_LAST = 10_000        # כמה הגרלות אחרונות נבדקות (כל מה שלפניהן הוא היסטוריה התחלתית)
+MIN_HISTORY = 1_000          # לפחות כמה הגרלות לפני התחזית הראשונה
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def load_history(args) -> Tuple[np.ndarray, np.ndarray]:
+    """(cards, numbers) בסדר כרונולוגי, דרך DrawStore של הבוט (אותו פענוח בדיוק)."""
+    if not args.synthetic:
+        return read_history(args.csv)
+    # הקובץ הסינתטי נחוץ רק לטעינה – המערכים נשארים בזיכרון, התיקייה נמחקת
+    with tempfile.TemporaryDirectory(prefix="backtest-") as work:
+        path = generate(Path(work) / "Chance.csv", args.synthetic, seed=args.seed)
+        return read_history(path)
+
+
+def read_history(path: Path) -> Tuple[np.ndarray, np.ndarray]:
+    snapshot = bot.DrawStore(path, None).snapshot()
+    if not snapshot.count:
+        raise SystemExit(f"no draws in {path}")
+    return np.ascontiguousarray(snapshot.cards), np.asarray(snapshot.numbers)
+
+
+def parse_windows(text: str) -> List[Optional[int]]:
+    return [None if part == "all" else int(part) for part in text.split(",")]
+
+
+def build_grid(args) -> List[Config]:
+    configs = []
+    for name in args.strategies.split(","):
+        if name not in STRATEGIES:
+            raise SystemExit(f"unknown strategy {name!r} (known: {', '.join(STRATEGIES)})")
+        windows = parse_windows(args.windows) if STRATEGIES[name].uses_window else [None]
+        for window in windows:
+            configs.append(Config(name, window, args.top_n, args.sets, args.seed))
+    return configs
+
+
+def run_grid(cards: np.ndarray, numbers: np.ndarray, configs: List[Config], start: int, jobs: int) -> List[Result]:
+    if jobs <= 1:
+        init_worker(cards, numbers)
+        return [run_config(config, start) for config in configs]
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(cards, numbers)) as pool:
+        return list(pool.map(run_config, configs, [start] * len(configs)))
+
+
+# === סיכום ===
+
+def summarize(result: Result) -> dict:
+    picks = int(result.picks.sum())
+    hits = int(result.hits.sum())
+    rate = hits / picks if picks else 0.0
+    expected = picks * BASELINE_HIT_RATE
+    spread = math.sqrt(picks * BASELINE_HIT_RATE * (1 - BASELINE_HIT_RATE)) or 1.0
+    column_picks = result.picks.sum(axis=0)
+    column_hits = result.hits.sum(axis=0)
+    return {
+        "label": result.config.label,
+        "draws": result.steps,
+        "picks_per_draw": picks / result.steps,
+        "hit_rate": rate,
+        "lift": rate / BASELINE_HIT_RATE,
+        "z": (hits - expected) / spread,
+        "columns": [h / p if p else float("nan") for h, p in zip(column_hits, column_picks)],
+        "best_2": float(np.mean(result.best >= 2)),
+        "best_3": float(np.mean(result.best >= 3)),
+        "best_4": float(np.mean(result.best == 4)),
+        "seconds": result.seconds,
+    }
+
+
+def print_summary(rows: List[dict]):
+    print(
+        f"\n{'strategy':22} {'draws':>7} {'picks':>5} {'hit%':>6} {'lift':>5} {'z':>6}  "
+        f"{'c1':>5} {'c2':>5} {'c3':>5} {'c4':>5}  {'≥2':>6} {'≥3':>6} {'=4':>6} {'sec':>6}"
+    )
+    for r in sorted(rows, key=lambda r: -r["lift"]):
+        columns = " ".join("    -" if math.isnan(c) else f"{c * 100:5.1f}" for c in r["columns"])
+        print(
+            f"{r['label']:22} {r['draws']:7d} {r['picks_per_draw']:5.1f} {r['hit_rate'] * 100:6.2f} "
+            f"{r['lift']:5.2f} {r['z']:6.2f}  {columns}  "
+            f"{r['best_2'] * 100:5.2f}% {r['best_3'] * 100:5.2f}% {r['best_4'] * 100:5.3f}% {r['seconds']:6.1f}"
+        )
+    print(f"\nbaseline: {BASELINE_HIT_RATE * 100:.1f}% per pick (1 of {bot.NUM_RANKS} ranks)")
+
+
+def hit_curve(result: Result, points: int) -> List[Tuple[int, int, float, float]]:
+    """
+    העקומה ב־points נקודות: (צעד, מספר הגרלה, hit% מצטבר, hit% בבלוק האחרון).
+    """
+    bounds = np.linspace(0, result.steps, points + 1).astype(int)[1:]
+    picks = np.cumsum(result.picks.sum(axis=1))
+    hits = np.cumsum(result.hits.sum(axis=1))
+    curve = []
+    previous_picks = previous_hits = 0
+    for end in bounds:
+        if not end:
+            continue
+        total_picks, total_hits = int(picks[end - 1]), int(hits[end - 1])
+        block_picks = total_picks - previous_picks
+        block_hits = total_hits - previous_hits
+        curve.append((
+            int(end),
+            int(result.numbers[end - 1]),
+            total_hits / total_picks if total_picks else 0.0,
+            block_hits / block_picks if block_picks else 0.0,
+        ))
+        previous_picks, previous_hits = total_picks, total_hits
+    return curve
+
+
+def sparkline(values: List[float], low: float, high: float) -> str:
+    span = (high - low) or 1.0
+    return "".join(SPARK[min(len(SPARK) - 1, max(0, int((v - low) / span * len(SPARK))))] for v in values)
+
+
+def print_curves(curves: List[Tuple[str, list]]):
+    """hit% לכל בלוק, על סקאלה משותפת לכל האסטרטגיות – כך שרואים גם מגמה וגם הבדלים."""
+    values = [block for _, curve in curves for *_, block in curve]
+    low, high = min(values), max(values)
+    print(f"\nhit% per block (scale {low * 100:.1f}%–{high * 100:.1f}%)")
+    for label, curve in curves:
+        blocks = [block for *_, block in curve]
+        numbers = " ".join(f"{b * 100:4.1f}" for b in blocks)
+        print(f"{label:22} {sparkline(blocks, low, high)}  {numbers}")
+
+
+def write_curves(path: Path, curves: List[Tuple[str, list]]):
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["strategy", "step", "draw_number", "cumulative_hit_rate", "block_hit_rate"])
+        for label, curve in curves:
+            for step, number, cumulative, block in curve:
+                writer.writerow([label, step, number, f"{cumulative:.5f}", f"{block:.5f}"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="walk-forward backtest of the prediction strategies")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--csv", type=Path, default=bot.DATA_FILE, help="draw history (default Chance.csv)")
+    source.add_argument(
+        "--synthetic", type=parse_size, help="generate a synthetic history of this size instead (5k/100k/1.5m/...)"
+    )
+    parser.add_argument("--last", type=int, default=DEFAULT_LAST, help="backtest the last N draws (0 = all)")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--windows", default=f"50,{bot.STATS_WINDOW},1000,all")
+    parser.add_argument("--top-n", type=int, default=3, help="cards per prediction for hot/cold")
+    parser.add_argument("--sets", type=int, default=3, help="combinations per prediction for sets/random")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--points", type=int, default=12, help="points on each hit-rate curve")
+    parser.add_argument("--curves", type=Path, help="write the hit-rate curves as CSV")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    cards, numbers = load_history(args)
+    start = max(MIN_HISTORY, len(cards) - args.last) if args.last else MIN_HISTORY
+    if start >= len(cards):
+        raise SystemExit(f"need more than {start} draws, got {len(cards)}")
+    configs = build_grid(args)
+    print(
+        f"{len(cards)} draws, backtesting {len(cards) - start} "
+        f"(#{numbers[start]}–#{numbers[-1]}), {len(configs)} configurations on {args.jobs} processes",
+        flush=True,
+    )
+
+    results = run_grid(cards, numbers, configs, start, args.jobs)
+    print_summary([summarize(result) for result in results])
+    curves = [(result.config.label, hit_curve(result, args.points)) for result in results]
+    print_curves(curves)
+    if args.curves:
+        write_curves(args.curves, curves)
+        print(f"\ncurves written to {args.curves}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+"""
+מדידות ביצועים ל־bot.py: מחולל היסטוריית צ'אנס סינתטית (generate) ומדידות זמן/זיכרון (run).
+
+    python -m benchmarks.generate 100k Chance.csv
+    python -m benchmarks                 # כל המדידות, השוואה ל־benchmarks/baseline.json
+"""
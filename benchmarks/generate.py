@@ -0,0 +1,85 @@
+"""
+מחולל Chance.csv סינתטי באותו פורמט בדיוק כמו קובץ הייצוא של מפעל הפיס:
+
+    date,draw_number,card1,card2,card3,card4,
+    27/11/2025,52009,8,9,9,Q,
+
+החדשה ביותר למעלה, פסיק בסוף כל שורה. הקלפים אחידים ובלתי תלויים (כמו בהגרלה אמיתית),
+ויש DRAWS_PER_DAY הגרלות ביום שמסתיימות היום. קבצים גדולים מדי בשביל הקצב הזה
+(1M הגרלות הן מאות שנים) נדחסים ליותר הגרלות ביום, כדי שכל התאריכים יישארו בטווח
+שהבוט מקבל (1970–2149).
+
+    python -m benchmarks.generate 5k|1.5m|<n> <path> [--seed N]
+"""
+
+import argparse
+import math
+import random
+from datetime import date, timedelta
+from pathlib import Path
+
+RANKS = ["7", "8", "9", "10", "J", "Q", "K", "A"]
+DRAWS_PER_DAY = 7            # צ'אנס מוגרל כל שעתיים, 9:00–21:00
+FIRST_DAY = date(1970, 1, 1)
+LAST_DRAW_NUMBER = 52009     # כמו בקובץ האמיתי; בקבצים גדולים יותר המספרים ממשיכים למעלה
+
+SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text: str) -> int:
+    """
+    "5k" / "2.5m" / "20_000" / "1000" -> מספר הגרלות. זורק ArgumentTypeError,
+    כך שאפשר להעביר אותה ישר כ־type= של argparse.
+    """
+    value = text.strip().lower().replace("_", "")
+    scale = SUFFIXES.get(value[-1:], 1)
+    if scale != 1:
+        value = value[:-1]
+    try:
+        n = float(value) * scale
+    except ValueError:
+        n = float("nan")
+    if not (math.isfinite(n) and n >= 1 and n.is_integer()):
+        raise argparse.ArgumentTypeError(f"invalid size {text!r}: expected a positive count like 5000, 5k or 1.5m")
+    return int(n)
+
+
+def draw_rows(n: int, seed: int = 1, end: date = None):
+    """מחזיר את השורות (כולל \\n), מהחדשה לישנה."""
+    end = end or date.today()
+    per_day = max(DRAWS_PER_DAY, math.ceil(n / ((end - FIRST_DAY).days + 1)))
+    first_number = max(1, LAST_DRAW_NUMBER - n + 1)
+    rng = random.Random(seed)
+    choice = rng.choice
+
+    rows = []
+    for i in range(n):
+        # i = 0 היא ההגרלה החדשה ביותר
+        day = end - timedelta(days=i // per_day)
+        number = first_number + n - 1 - i
+        rows.append(
+            f"{day:%d/%m/%Y},{number},{choice(RANKS)},{choice(RANKS)},{choice(RANKS)},{choice(RANKS)},\n"
+        )
+    return rows
+
+
+def generate(path: Path, n: int, seed: int = 1, end: date = None) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="") as f:
+        f.writelines(draw_rows(n, seed, end))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="synthetic Chance.csv generator")
+    parser.add_argument("size", type=parse_size, help="number of draws, with an optional k/m suffix (5k, 1.5m)")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.path, args.size, args.seed)
+    print(f"{args.size} draws written to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+מדידות זמן וזיכרון לנתיבים החמים של bot.py, על היסטוריות סינתטיות בגדלים 1k / 100k / 1m
+ועל 10k / 100k / 1m מנויים:
+
+    load_draws.csv     – טעינה קרה של Chance.csv (פענוח + בניית המונים), בלי ארכיון
+    load_draws.archive – עלייה מהארכיון הבינארי (Chance.bin)
+    load_draws         – load_draws(200) מ־snapshot חם
+    calc_card_stats    – סטטיסטיקה על כל ההיסטוריה
+    get_hot_cards / suggest_4_sets – מעל סטטיסטיקה של STATS_WINDOW
+    load_subscribers   – SubscriberStore.load() מ־STATE_DB
+    save_subscribers   – 1000 מנויים חדשים + כתיבה אחת (write_pending)
+    is_subscriber      – חיפוש בודד (חצי פגיעות, חצי החטאות)
+
+לכל מדידה: median/min של זמן (בלי tracemalloc) ושיא זיכרון בהרצה נפרדת תחת tracemalloc.
+התוצאות נכתבות ל־JSON ומושוות ל־benchmarks/baseline.json – יחס מעל --threshold מסומן כרגרסיה.
+
+    python -m benchmarks [--quick] [--repeat N] [--output PATH]
+                         [--save-baseline] [--fail-on-regression] [--threshold 1.25]
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from benchmarks.generate import generate, parse_size
+
+HERE = Path(__file__).resolve().parent
+DATA_DIR = HERE / "data"                 # קבצי CSV שנוצרו – נשמרים בין הרצות (ב־.gitignore)
+BASELINE_FILE = HERE / "baseline.json"
+RESULTS_FILE = HERE / "results.json"
+
+DRAW_SIZES = ("1k", "100k", "1m")
+SUBSCRIBER_SIZES = ("10k", "100k", "1m")
+QUICK_SIZES = ("1k", "10k")              # --quick: רק הגדלים הקטנים, לבדיקה מהירה
+SEED = 1
+NEW_SUBSCRIBERS = 1_000                  # כמה מנויים נוספים בכל מדידת save_subscribers
+LOOKUPS = 100_000                        # כמה חיפושים בכל מדידת is_subscriber
+REGRESSION_THRESHOLD = 1.25
+MEMORY_FLOOR_KB = 256                    # שיא זיכרון קטן מזה לא נבדק ליחס (רעש של מטמונים פנימיים)
+
+
+class Case(NamedTuple):
+    name: str
+    run: Callable[[object], object]       # הפעולה הנמדדת; מקבלת את מה ש־setup החזיר
+    setup: Optional[Callable[[], object]] = None   # הכנה לכל חזרה – לא נכנסת לזמן
+    ops: int = 1                          # כמה פעולות run מבצע (לחישוב זמן לפעולה)
+
+
+def measure(case: Case, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        state = case.setup() if case.setup else None
+        gc.collect()
+        start = time.perf_counter()
+        case.run(state)
+        times.append(time.perf_counter() - start)
+
+    # שיא הזיכרון בהרצה נפרדת – tracemalloc מאט את הקוד הנמדד
+    state = case.setup() if case.setup else None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        case.run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(times)
+    return {
+        "median_s": median,
+        "min_s": min(times),
+        "per_op_ns": median / case.ops * 1e9,
+        "peak_kb": peak / 1024,
+        "ops": case.ops,
+        "repeat": repeat,
+    }
+
+
+# === הכנת נתונים ===
+
+def draws_csv(size: str) -> Path:
+    path = DATA_DIR / f"Chance-{size}.csv"
+    if not path.exists():
+        print(f"generating {path.name} ...", flush=True)
+        generate(path, parse_size(size), seed=SEED)
+    return path
+
+
+def subscriber_entries(size: str):
+    n = parse_size(size)
+    rng = np.random.default_rng(SEED)
+    # מזהים שונים מ־1 עד 50n, בלי לבנות את כל הטווח בזיכרון (400MB במיליון מנויים)
+    uids = rng.choice(50 * n - 1, size=n, replace=False) + 1
+    now = int(time.time())
+    expiries = rng.integers(now + 86_400, now + 365 * 86_400, size=n, dtype=np.int64)
+    return uids, expiries
+
+
+# === המדידות ===
+
+def draw_cases(bot, size: str, work: Path) -> List[Case]:
+    csv_path = draws_csv(size)
+    archive = work / f"Chance-{size}.bin"
+    archive.unlink(missing_ok=True)
+    bot.DrawStore(csv_path, archive).snapshot()   # בונה את הארכיון פעם אחת
+
+    store = bot.DrawStore(csv_path, None)
+    snapshot = store.snapshot()
+    stats = snapshot.stats(window=bot.STATS_WINDOW)
+    recent = snapshot.stats(window=bot.RECENT_WINDOW)
+
+    def use_store():
+        bot.draw_store = store
+
+    return [
+        Case(f"load_draws.csv[{size}]", lambda _: bot.DrawStore(csv_path, None).snapshot()),
+        Case(f"load_draws.archive[{size}]", lambda _: bot.DrawStore(csv_path, archive).snapshot()),
+        Case(f"load_draws[{size}]", lambda _: [bot.load_draws(200) for _ in range(100)], setup=use_store, ops=100),
+        Case(f"calc_card_stats[{size}]", lambda _: bot.calc_card_stats(snapshot.cards)),
+        Case(f"get_hot_cards[{size}]", lambda _: [bot.get_hot_cards(stats) for _ in range(1000)], ops=1000),
+        Case(f"suggest_4_sets[{size}]", lambda _: [bot.suggest_4_sets(stats, 3, recent) for _ in range(10)], ops=10),
+    ]
+
+
+def subscriber_cases(bot, size: str, work: Path) -> List[Case]:
+    uids, expiries = subscriber_entries(size)
+    state = bot.SharedState(work / f"subscribers-{size}.db")
+    state.open()
+    state.import_subscribers(dict(zip(uids.tolist(), expiries.tolist())))
+    rng = random.Random(SEED)
+
+    def fresh_store():
+        store = bot.SubscriberStore(state)
+        store.load()
+        bot.subscribers = store
+        return store
+
+    async def grant_and_save(store):
+        # בתוך לולאת אירועים grant רק נכנס לתור (כמו בבוט), והכתיבה היא טרנזקציה אחת
+        base = int(uids.max()) + 1 + rng.randrange(1 << 30)
+        expires_at = time.time() + 86_400
+        for uid in range(base, base + NEW_SUBSCRIBERS):
+            store.grant(uid, expires_at)
+        store.write_pending()
+
+    def grant_batch(store):
+        asyncio.run(grant_and_save(store))
+
+    hits = rng.choices(uids.tolist(), k=LOOKUPS // 2)
+    misses = [-uid for uid in hits]     # user_id שלילי אף פעם לא נמצא בטבלה
+    lookups = hits + misses
+    rng.shuffle(lookups)
+
+    def lookup_all(_):
+        is_subscriber = bot.is_subscriber
+        for uid in lookups:
+            is_subscriber(uid)
+
+    return [
+        Case(f"load_subscribers[{size}]", lambda _: fresh_store()),
+        Case(f"save_subscribers[{size}]", grant_batch, setup=fresh_store, ops=NEW_SUBSCRIBERS),
+        Case(f"is_subscriber[{size}]", lookup_all, setup=fresh_store, ops=LOOKUPS),
+    ]
+
+
+# === דוח והשוואה ===
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    """מדפיס טבלה מול ה־baseline ומחזיר את שמות המדידות שהואטו / תפחו מעבר ל־threshold."""
+    regressions = []
+    print(f"\n{'benchmark':32} {'median':>11} {'per op':>11} {'peak':>10} {'time x':>7} {'mem x':>7}")
+    for name, r in results.items():
+        base = baseline.get(name)
+        time_ratio = r["median_s"] / base["median_s"] if base and base["median_s"] else None
+        mem_ratio = r["peak_kb"] / base["peak_kb"] if base and base["peak_kb"] >= MEMORY_FLOOR_KB else None
+        flag = ""
+        if (time_ratio or 0) > threshold or (mem_ratio or 0) > threshold:
+            regressions.append(name)
+            flag = "  <-- regression"
+        print(
+            f"{name:32} {r['median_s'] * 1e3:9.2f}ms {format_ns(r['per_op_ns']):>11} "
+            f"{r['peak_kb'] / 1024:8.1f}MB {format_ratio(time_ratio):>7} {format_ratio(mem_ratio):>7}{flag}"
+        )
+    return regressions
+
+
+def format_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f}ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f}us"
+    return f"{ns:.0f}ns"
+
+
+def format_ratio(ratio: Optional[float]) -> str:
+    return "-" if ratio is None else f"{ratio:.2f}"
+
+
+def environment() -> dict:
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="bot.py micro-benchmarks")
+    parser.add_argument("--quick", action="store_true", help="small sizes only")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run only benchmarks whose name contains this text")
+    parser.add_argument("--output", type=Path, default=RESULTS_FILE)
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit 1 if anything regressed")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    draw_sizes = QUICK_SIZES[:1] if args.quick else DRAW_SIZES
+    subscriber_sizes = QUICK_SIZES[1:] if args.quick else SUBSCRIBER_SIZES
+
+    with tempfile.TemporaryDirectory(prefix="bot-bench-") as tmp:
+        work = Path(tmp)
+        # SubscriberStore.load() קורא את קבצי המנויים הישנים מהתיקייה הנוכחית
+        cwd = os.getcwd()
+        os.chdir(work)
+        try:
+            import bot
+
+            results: Dict[str, dict] = {}
+            groups = [(draw_cases, size) for size in draw_sizes]
+            groups += [(subscriber_cases, size) for size in subscriber_sizes]
+            for build, size in groups:
+                for case in build(bot, size, work):
+                    if args.only and args.only not in case.name:
+                        continue
+                    print(f"{case.name} ...", flush=True)
+                    results[case.name] = measure(case, args.repeat)
+            bot.io_executor.shutdown()
+        finally:
+            os.chdir(cwd)
+
+    report = {"meta": environment(), "results": results}
+    args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+    baseline = {}
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))["results"]
+    regressions = compare(results, baseline, args.threshold)
+    print(f"\nresults written to {args.output}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved to {args.baseline}")
+    if regressions:
+        print(f"{len(regressions)} regression(s) over x{args.threshold}: {', '.join(regressions)}")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,25 +1,72 @@
+import asyncio
+import bisect
+import codecs
 import csv
+import heapq
+import hmac
 import json
+import math
 import time
 import random
-
-from datetime import datetime
+import signal
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+from dataclasses import dataclass
+from functools import cached_property, wraps
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
+import numpy as np
 from telegram import Update, ReplyKeyboardMarkup, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
+    ApplicationHandlerStop,
+    BaseRateLimiter,
+    BaseUpdateProcessor,
+    CallbackQueryHandler,
     CommandHandler,
     MessageHandler,
     ContextTypes,
+    TypeHandler,
     filters,
 )
 
 # === הגדרות בסיס ===
 import os
-TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
+TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
+BOT_API_URL = os.environ.get("TELEGRAM_API_URL", "https://api.telegram.org")  # לשרת Bot API מקומי / בדיקות עומס
+
+# מצב קבלת עדכונים: polling (ברירת מחדל) או webhook
+BOT_MODE = os.environ.get("BOT_MODE", "polling")
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "")       # כתובת ציבורית לרישום מול טלגרם (ריק = בלי רישום)
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "")  # נבדק מול X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = int(os.environ.get("PORT", "8080"))
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_QUEUE_SIZE = 1000             # מעל כמה עדכונים פתוחים (בתור + בעיבוד) עונים 503 (טלגרם ישלח שוב)
+WEBHOOK_DEDUP_SIZE = 10_000           # כמה update_id אחרונים זוכרים לזיהוי כפילויות
+WEBHOOK_DRAIN_SECONDS = 20            # כמה זמן מחכים לסיום התור אחרי SIGTERM
+
+# עיבוד עדכונים במקביל (עדכונים מאותו צ'אט תמיד לפי הסדר)
+UPDATE_CONCURRENCY = 32               # כמה handlers רצים במקביל
+UPDATE_MAX_PENDING = 4096             # כמה עדכונים פתוחים (רצים + ממתינים לצ'אט שלהם) לכל היותר
+UPDATE_REPORT_SECONDS = 60            # כל כמה זמן מודפסת שורת עומס (רק כשהיה עומס)
 DATA_FILE = Path("Chance.csv")      # קובץ הנתונים של הצ'אנס
+ARCHIVE_FILE = Path("Chance.bin")   # ארכיון בינארי שנבנה מה־CSV (נטען ב־mmap)
+STATS_WINDOW = 200                  # כמה הגרלות אחרונות נכנסות לחישוב קלפים חמים / צירופים
+STATS_WINDOWS = (10, 50, STATS_WINDOW, 1000)  # חלונות שהמונים שלהם מתוחזקים חי בכל הגרלה חדשה
+HISTORY_PAGE_SIZE = 10              # כמה הגרלות בכל עמוד של /draws
+PREDICTION_INTERVAL = 2 * 60 * 60   # חישוב מחדש של התחזיות לפחות פעם בשעתיים
+PREDICTION_POLL_SECONDS = 60        # כל כמה זמן בודקים אם נכנסו הגרלות חדשות
 
 KNOWN_COMMANDS = {
     "/start",
@@ -30,37 +77,605 @@ KNOWN_COMMANDS = {
     "/terms",
     "/revoke",
     "/broadcast",
+    "/draw",
+    "/draws",
+    "/stats",
 }
 
 # אדמין – את זה להחליף ל-user_id שלך
 ADMIN_IDS = [812811431]
 
-# קובץ מנויים (user_id -> expiry_timestamp)
+# מצב משותף לכל תהליכי הבוט (מנויים, הגבלות קצב, תחזיות) – SQLite במצב WAL
+STATE_DB = Path(os.environ.get("STATE_DB", "state.db"))
+STATE_BUSY_TIMEOUT = 5.0              # כמה שניות מחכים לנעילה של תהליך אחר
+STATE_POLL_SECONDS = 1.0              # כל כמה זמן בודקים אם תהליך אחר שינה משהו
+STATE_PRUNE_SECONDS = 10 * 60         # כל כמה זמן מנקים את יומן השינויים ודליים ישנים
+STATE_CHANGES_KEEP = 100_000          # כמה שינויי מנויים אחרונים נשארים ביומן המשותף
+STATE_COOLDOWN_IDLE = 60 * 60         # דלי שלא נגעו בו כל כך הרבה זמן נמחק (הוא ממילא מלא)
+
+# קבצי המנויים בפורמט הקודם (user_id -> expiry_timestamp) – מיובאים פעם אחת ל־STATE_DB
 SUBSCRIBERS_FILE = Path("subscribers.json")
+SUBSCRIBERS_JOURNAL = Path("subscribers.journal")
+SUBSCRIBERS_WRITE_DELAY = 0.2         # שינויים שמגיעים בחלון הזה נכתבים בטרנזקציה אחת
+IO_WORKERS = 4                        # threads לגישה לקבצים (מחוץ ללולאת האירועים)
+EXPIRY_SWEEP_SECONDS = 30             # כל כמה זמן מוחקים מנויים שפג תוקפם
+EXPIRY_BATCH = 10_000                 # כמה מנויים לכל היותר נמחקים בכל מנה
+EXPIRY_NOTIFY = True                  # לשלוח למשתמש הודעה כשהמנוי שלו הסתיים
+
+# שידור למנויים (/broadcast)
+BROADCAST_DIR = Path("broadcast")     # מצב השידור הנוכחי – ממנו ממשיכים אחרי הפעלה מחדש
+BROADCAST_CONCURRENCY = 8             # כמה שליחות במקביל
+BROADCAST_RATE = 25                   # תקרה לשידור בתוך התקציב המשותף, כדי שתמיד יישאר מקום לתשובות
+BROADCAST_BURST = 5                   # כמה הודעות מותר לשלוח ברצף לפני שהקצב נאכף
+BROADCAST_MAX_ATTEMPTS = 5            # ניסיונות לכל נמען (RetryAfter / תקלת רשת)
+BROADCAST_PROGRESS_SECONDS = 3        # כל כמה זמן מתעדכנת הודעת ההתקדמות של האדמין
+
+# תקציב שליחה משותף לכל הבוט (כל ההודעות היוצאות)
+OUTBOUND_RATE = float(os.environ.get("OUTBOUND_RATE", "30"))  # הודעות לשנייה – המגבלה הכללית של טלגרם (מול שרת מקומי אפשר יותר)
+OUTBOUND_BURST = 10                   # כמה מותר ברצף לפני שהקצב נאכף
+OUTBOUND_WAIT_SAMPLES = 2048          # כמה זמני המתנה אחרונים נשמרים לכל מחלקה (p50/p99)
+
+# מדדים (GET /metrics בפורמט הטקסט של Prometheus, וסיכום ב־/stats לאדמין)
+METRICS_LISTEN = "127.0.0.1"          # רק מקומית – לא לחשוף החוצה
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9090"))  # 0 = בלי endpoint
+
+# יומן אירועים (לחיצות, פקודות, מנויים, שידורים) – קבצי JSONL לניתוח שימוש
+EVENT_LOG_DIR = Path(os.environ.get("EVENT_LOG_DIR", "events"))
+EVENT_QUEUE_SIZE = 50_000             # מעל זה אירועים חדשים נזרקים (ונספרים) – לעולם לא מחכים
+EVENT_BATCH = 1000                    # כמה אירועים לכל היותר בכתיבה אחת
+EVENT_FLUSH_SECONDS = 1.0             # כל כמה זמן נכתב מה שהצטבר (גם אם המנה לא מלאה)
+EVENT_ROTATE_BYTES = 64 * 1024 * 1024 # קובץ חדש כשהנוכחי גדל מעבר לזה
+EVENT_ROTATE_SECONDS = 24 * 60 * 60   # ...או כשהוא פתוח יותר מזה
 
 # פוטר קבוע לכל הודעה מהמערכת
 FOOTER = "\n\nלכל פנייה לגבי המערכת ומנויים שלחו הודעה ליוזר @eitayeliyahu"
 
-# קירור לקלף האוטומטי (user_id -> last_timestamp)
-auto_card_cooldowns: dict[int, float] = {}
 
+# === מדדים ===
+#
+# מונים והיסטוגרמות בזיכרון, בלי תלות חיצונית. observe הוא bisect על tuple קבוע ועוד
+# שלוש הוספות (~1 מיקרו־שנייה), ונקרא רק מלולאת האירועים – חוץ מהמדידה של DrawStore,
+# שרצה ב־io_executor תחת המנעול שלו ומפתחות משלה.
+# labels הם tuple של זוגות (שם, ערך), כדי שהמפתח יהיה hashable ונבנה פעם אחת.
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# שם -> (סוג, תיאור) – כל מדד שנרשם חייב להופיע כאן
+METRIC_HELP = {
+    "handler_seconds": ("histogram", "Handler latency (count = calls)"),
+    "handler_errors_total": ("counter", "Exceptions raised by handlers, by type"),
+    "io_seconds": ("histogram", "run_io calls including executor queueing, by function"),
+    "csv_parse_seconds": ("histogram", "Chance.csv parse time (full rebuild / appended tail)"),
+    "csv_rows_parsed_total": ("counter", "Rows read from Chance.csv"),
+    "subscriber_writes_total": ("counter", "Subscriber write transactions to STATE_DB"),
+    "subscriber_rows_written_total": ("counter", "Subscriber changes written to STATE_DB"),
+    "outbound_send_seconds": ("histogram", "Bot API call latency for outbound messages, by method"),
+    "outbound_wait_seconds": ("histogram", "Time waiting for the shared send budget, by priority"),
+    "outbound_errors_total": ("counter", "Failed outbound calls, by method and exception type"),
+    "uptime_seconds": ("gauge", "Seconds since the process started"),
+    "subscribers_active": ("gauge", "Subscribers currently in the local table"),
+    "draws_loaded": ("gauge", "Draws in the current snapshot"),
+    "state_db_bytes": ("gauge", "Size of STATE_DB including its WAL"),
+    "updates_pending": ("gauge", "Updates accepted but not finished"),
+    "outbound_queued": ("gauge", "Outbound calls waiting for the send budget"),
+    "events_written_total": ("counter", "Events written to the event log"),
+    "events_dropped_total": ("counter", "Events dropped (queue full or write error)"),
+    "events_queued": ("gauge", "Events waiting to be written"),
+}
 
-# === חלק 0: ניהול מנויים יומיים (24 שעות) ===
 
-def load_subscribers() -> dict:
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # האחרון = +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """הערכה מתוך הדליים – אינטרפולציה לינארית בתוך הדלי, כמו histogram_quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen, lower = 0, 0.0
+        for bound, n in zip(self.bounds, self.counts):
+            if n and seen + n >= rank:
+                return lower + (bound - lower) * (rank - seen) / n
+            seen += n
+            lower = bound
+        return self.bounds[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+
+    def inc(self, name: str, labels: tuple = (), amount: float = 1):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: tuple = ()):
+        histogram = self.histograms.get((name, labels))
+        if histogram is None:
+            histogram = self.histograms[(name, labels)] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        self.gauges[name] = func
+
+    def series(self, name: str):
+        """(labels, Histogram) לכל הסדרות של היסטוגרמה אחת."""
+        return [(labels, h) for (n, labels), h in list(self.histograms.items()) if n == name]
+
+    def totals(self, name: str):
+        return [(labels, value) for (n, labels), value in list(self.counters.items()) if n == name]
+
+    def render(self) -> str:
+        """כל המדדים בפורמט הטקסט של Prometheus (0.0.4)."""
+        lines = []
+        for name, (kind, text) in METRIC_HELP.items():
+            if kind == "histogram":
+                body = []
+                for labels, h in self.series(name):
+                    cumulative = 0
+                    for bound, n in zip(h.bounds + (float("inf"),), h.counts):
+                        cumulative += n
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        body.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                    body.append(f"{name}_sum{format_labels(labels)} {h.total!r}")
+                    body.append(f"{name}_count{format_labels(labels)} {h.count}")
+            elif kind == "counter":
+                body = [f"{name}{format_labels(labels)} {value}" for labels, value in self.totals(name)]
+            else:
+                func = self.gauges.get(name)
+                body = [f"{name} {func()}"] if func is not None else []
+            if body:
+                lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}", *body]
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+metrics = Metrics()
+metrics.gauge("uptime_seconds", lambda: round(time.time() - metrics.started, 3))
+
+
+def instrumented(callback):
+    """עוטף handler: היסטוגרמת זמן (שהיא גם מונה הקריאות) ושגיאות לפי סוג החריגה."""
+    labels = (("handler", callback.__name__),)
+
+    @wraps(callback)
+    async def wrapper(update, context):
+        start = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception as exc:
+            metrics.inc("handler_errors_total", labels + (("type", type(exc).__name__),))
+            raise
+        finally:
+            metrics.observe("handler_seconds", time.perf_counter() - start, labels)
+
+    return wrapper
+
+
+# === שכבת I/O ===
+#
+# כל גישה לקבצים (CSV / ארכיון, STATE_DB, מצב השידור) נעשית ב־io_executor ולא
+# בלולאת האירועים, כדי שדיסק איטי לא יעצור את כל המשתמשים.
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="io")
+
+
+async def run_io(func, *args):
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(io_executor, func, *args)
+    finally:
+        metrics.observe("io_seconds", time.perf_counter() - start, (("func", func.__qualname__),))
+
+
+# === יומן אירועים ===
+#
+# log() רק מוסיף dict לתור בזיכרון – בלי I/O, בלי await ובלי print בלולאת האירועים.
+# משימת רקע אחת אוספת מנות של עד EVENT_BATCH ומעבירה אותן ל־io_executor, שם הן
+# מקודדות לשורות JSON קומפקטיות ({"t":..., "e":"click", ...}) ונכתבות לקובץ
+# EVENT_LOG_DIR/events-<זמן פתיחה>-<pid>-<מספר>.jsonl (קובץ לכל תהליך, כך שכמה workers לא מתערבבים).
+# הקובץ מתחלף לפי EVENT_ROTATE_BYTES / EVENT_ROTATE_SECONDS.
+# תור מלא (הדיסק לא עומד בקצב) – האירוע החדש נזרק ונספר ב־events_dropped_total.
+#
+#     python -m eventstats events/   # לחיצות לכל כפתור לפי שעה
+
+
+class EventLog:
+    def __init__(self, directory: Path, max_queue: int = EVENT_QUEUE_SIZE):
+        self.directory = directory
+        self.max_queue = max_queue
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._file = None
+        self._size = 0
+        self._opened_at = 0.0
+        self._rotations = 0
+        self._write_lock = threading.Lock()   # flush של on_stop יכול לחפוף לכתיבה שכבר רצה
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def log(self, event: str, **fields):
+        if len(self._queue) >= self.max_queue:
+            metrics.inc("events_dropped_total")
+            return
+        self._queue.append({"t": time.time(), "e": event, **fields})
+        if len(self._queue) >= EVENT_BATCH:
+            self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), EVENT_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self._queue:
+            batch = [self._queue.popleft() for _ in range(min(EVENT_BATCH, len(self._queue)))]
+            try:
+                await run_io(self._write, batch)
+            except OSError as exc:
+                print("event log write failed:", repr(exc))
+                metrics.inc("events_dropped_total", (), len(batch))
+                return
+            metrics.inc("events_written_total", (), len(batch))
+
+    async def aclose(self):
+        await self.flush()
+        await run_io(self._close_file)
+
+    def _write(self, batch: List[dict]):
+        for event in batch:
+            event["t"] = round(event["t"], 3)   # אלפיות שנייה מספיקות, והשורה קצרה יותר
+        data = "".join(
+            json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n" for event in batch
+        ).encode("utf-8")
+        with self._write_lock:
+            if (
+                self._file is None
+                or (self._size and self._size + len(data) > EVENT_ROTATE_BYTES)
+                or time.time() - self._opened_at >= EVENT_ROTATE_SECONDS
+            ):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self._size += len(data)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._opened_at = time.time()
+        self._rotations += 1
+        stamp = datetime.fromtimestamp(self._opened_at)
+        name = f"events-{stamp:%Y%m%d-%H%M%S}-{os.getpid()}-{self._rotations}.jsonl"
+        self._file = open(self.directory / name, "ab")
+        self._size = self._file.tell()
+
+    def _close_file(self):
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+events = EventLog(EVENT_LOG_DIR)
+metrics.gauge("events_queued", lambda: len(events))
+
+
+# === מצב משותף בין תהליכים (SQLite) ===
+#
+# כמה מופעים של הבוט (למשל כמה webhook workers) חולקים קובץ STATE_DB אחד במצב WAL:
+# • subscribers + subscriber_changes – המנויים, ויומן שינויים ממוספר (seq) שממנו כל
+#   תהליך מעדכן את המטמון המקומי שלו בלי לטעון הכל מחדש.
+# • cooldowns – דליי האסימונים של הגבלת הקצב, כדי שהמגבלה תחול על כל התהליכים יחד. כל תהליך
+#   מחליט מקומית (ActionLimiter) ומתחשבן מול הטבלה רק במנות, פעם ב־STATE_POLL_SECONDS.
+# • snapshots – התחזיות המחושבות, כדי שרק תהליך אחד יחשב אותן.
+# • meta – מונה גרסה לכל אחד מהם. כל תהליך בודק רק את המונים (ו־PRAGMA data_version,
+#   שלא משתנה אם אף אחד אחר לא כתב) ומושך נתונים רק כשמשהו באמת השתנה.
+# כל כתיבה היא BEGIN IMMEDIATE – SQLite נועל בין תהליכים, ו־busy timeout מחכה לנעילה.
+# הקובץ נפתח רק ב־open() (ב־on_startup), לא ב־import – כלים שמייבאים את bot לא נוגעים בו.
+
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscribers (
+    uid INTEGER PRIMARY KEY,
+    expiry INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS subscriber_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid INTEGER NOT NULL,
+    expiry INTEGER            -- NULL = המנוי הוסר
+);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    uid INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    tokens REAL NOT NULL,
+    stamp REAL NOT NULL,
+    PRIMARY KEY (uid, action)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    name TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    computed_at REAL NOT NULL,
+    payload TEXT NOT NULL
+);
+"""
+
+
+class SharedState:
     """
-    טוען מנויים מהקובץ בפורמט:
-    {
-        "123456789": 1732664100.0,  # timestamp של תוקף
-        "987654321": 1732667890.0
-    }
+    שני חיבורים לכל תהליך, כל אחד מוגן ב־threading.Lock (נקראים מה־threads של io_executor):
+    • _db – מנויים ו־snapshots, synchronous=FULL: מה שאושר לאדמין שורד גם נפילת חשמל.
+    • _volatile – cooldowns, synchronous=OFF: כתיבה בכל סבב סנכרון, ואיבוד שלהן לא מזיק.
     """
-    if not SUBSCRIBERS_FILE.exists():
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._volatile: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._volatile_lock = threading.Lock()
+        self._data_version = None
+        self._versions: Dict[str, int] = {}
+
+    def open(self):
+        """פותח (ויוצר אם צריך) את הקובץ. נקרא פעם אחת, לפני כל שימוש אחר."""
+        with self._lock, self._volatile_lock:
+            if self._db is not None:
+                return
+            self._db = self._connect("FULL")
+            self._db.executescript(STATE_SCHEMA)
+            self._volatile = self._connect("OFF")
+
+    def _connect(self, synchronous: str) -> sqlite3.Connection:
+        db = sqlite3.connect(
+            self.path, timeout=STATE_BUSY_TIMEOUT, isolation_level=None, check_same_thread=False
+        )
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA synchronous={synchronous}")
+        return db
+
+    @contextmanager
+    def _transaction(self, db: sqlite3.Connection, lock: threading.Lock, mode: str = "IMMEDIATE"):
+        with lock:
+            db.execute(f"BEGIN {mode}")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def close(self):
+        with self._lock, self._volatile_lock:
+            if self._db is None:
+                return
+            self._db.close()
+            self._volatile.close()
+            self._db = self._volatile = None
+
+    def size_bytes(self) -> int:
+        """גודל הקובץ ביחד עם ה־WAL שלו (מה שבאמת תופס דיסק)."""
+        total = 0
+        for path in (self.path, self.path.with_name(self.path.name + "-wal")):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
+
+    # --- מוני גרסה ---
+
+    def versions(self) -> Dict[str, int]:
+        """key -> version. קריאה אחת ל־data_version כשאף תהליך אחר לא כתב מאז הפעם הקודמת."""
+        with self._lock:
+            data_version = self._db.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._versions = dict(self._db.execute("SELECT key, version FROM meta"))
+                self._data_version = data_version
+            return self._versions
+
+    @staticmethod
+    def _set_version(db: sqlite3.Connection, key: str, version: Optional[int] = None):
+        if version is None:
+            db.execute(
+                "INSERT INTO meta (key, version) VALUES (?, 1) "
+                "ON CONFLICT (key) DO UPDATE SET version = version + 1",
+                (key,),
+            )
+        else:
+            db.execute(
+                "INSERT INTO meta (key, version) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET version = excluded.version",
+                (key, version),
+            )
+
+    # --- מנויים ---
+
+    @staticmethod
+    def _imported(db: sqlite3.Connection) -> bool:
+        # מפתח subscribers ב־meta – המסד כבר החזיק מנויים, גם ממסדים שנוצרו לפני legacy_imported
+        return db.execute(
+            "SELECT 1 FROM meta WHERE key IN ('legacy_imported', 'subscribers')"
+        ).fetchone() is not None
+
+    def legacy_imported(self) -> bool:
+        with self._lock:
+            return self._imported(self._db)
+
+    def load_subscribers(self) -> Tuple[np.ndarray, np.ndarray, int]:
+        """כל המנויים (uids, expiries) וה־seq שהם משקפים – באותה טרנזקציית קריאה."""
+        with self._transaction(self._db, self._lock, "DEFERRED") as db:
+            rows = db.execute("SELECT uid, expiry FROM subscribers").fetchall()
+            seq = db.execute("SELECT COALESCE(MAX(seq), 0) FROM subscriber_changes").fetchone()[0]
+        table = np.array(rows, dtype=np.int64).reshape(-1, 2)
+        return table[:, 0].copy(), table[:, 1].astype(np.uint32), seq
+
+    def import_subscribers(self, entries: Dict[int, int]) -> bool:
+        """
+        ייבוא חד־פעמי למסד ריק. legacy_imported נכתב באותה טרנזקציה, כך שגם אחרי שכל
+        המנויים פגו או בוטלו הייבוא לא רץ שוב. False – כבר יובא (אולי בתהליך אחר).
+        """
+        with self._transaction(self._db, self._lock) as db:
+            if self._imported(db):
+                return False
+            db.executemany("INSERT OR REPLACE INTO subscribers (uid, expiry) VALUES (?, ?)", entries.items())
+            self._set_version(db, "subscribers", 0)
+            self._set_version(db, "legacy_imported", 1)
+        return True
+
+    def _log_changes(self, db: sqlite3.Connection, changes) -> Tuple[int, int]:
+        """רושם שינויים ביומן ומעדכן את מונה הגרסה. מחזיר (seq לפני, seq אחרי)."""
+        before = db.execute("SELECT COALESCE(MAX(seq), 0) FROM subscriber_changes").fetchone()[0]
+        db.executemany("INSERT INTO subscriber_changes (uid, expiry) VALUES (?, ?)", changes)
+        after = db.execute("SELECT COALESCE(MAX(seq), 0) FROM subscriber_changes").fetchone()[0]
+        self._set_version(db, "subscribers", after)
+        return before, after
+
+    def write_subscribers(self, changes: List[Tuple[int, Optional[int]]]) -> Tuple[int, int]:
+        """(uid, expiry) – expiry None = הסרה. הכל בטרנזקציה אחת."""
+        with self._transaction(self._db, self._lock) as db:
+            db.executemany(
+                "INSERT OR REPLACE INTO subscribers (uid, expiry) VALUES (?, ?)",
+                [(uid, expiry) for uid, expiry in changes if expiry is not None],
+            )
+            db.executemany(
+                "DELETE FROM subscribers WHERE uid = ?",
+                [(uid,) for uid, expiry in changes if expiry is None],
+            )
+            return self._log_changes(db, changes)
+
+    def expire_subscribers(self, candidates: List[Tuple[int, int]]) -> Tuple[List[int], int, int]:
+        """
+        מוחק מנויים שפגו – רק אם התוקף בטבלה עדיין זה שפג (אף תהליך לא חידש בינתיים).
+        מחזיר רק את מי שנמחק כאן, כך שרק תהליך אחד ישלח הודעת סיום לכל משתמש.
+        """
+        with self._transaction(self._db, self._lock) as db:
+            expired = [
+                uid for uid, expiry in candidates
+                if db.execute("DELETE FROM subscribers WHERE uid = ? AND expiry = ?", (uid, expiry)).rowcount
+            ]
+            before, after = self._log_changes(db, [(uid, None) for uid in expired])
+        return expired, before, after
+
+    def subscriber_changes(self, since: int) -> Optional[List[Tuple[int, int, Optional[int]]]]:
+        """שינויים אחרי seq נתון, או None אם חלקם כבר נמחקו מהיומן (צריך טעינה מלאה)."""
+        with self._lock:
+            oldest = self._db.execute("SELECT MIN(seq) FROM subscriber_changes").fetchone()[0]
+            if oldest is not None and since < oldest - 1:
+                return None
+            return self._db.execute(
+                "SELECT seq, uid, expiry FROM subscriber_changes WHERE seq > ? ORDER BY seq", (since,)
+            ).fetchall()
+
+    # --- הגבלת קצב ---
+
+    def spend_tokens(self, spent: List[Tuple[int, str, float, int, int]], now: float) -> List[Tuple[int, str, float]]:
+        """
+        (uid, action, rate, burst, כמה נוצל) – מוריד מהדליים המשותפים את מה שהתהליך הזה
+        אישר מאז הסבב הקודם, בטרנזקציה אחת לכל המנה. מחזיר (uid, action, יתרה) לכל דלי,
+        כולל מה שתהליכים אחרים ניצלו בינתיים.
+        """
+        balances = []
+        with self._transaction(self._volatile, self._volatile_lock) as db:
+            for uid, action, rate, burst, count in spent:
+                row = db.execute(
+                    "SELECT tokens, stamp FROM cooldowns WHERE uid = ? AND action = ?", (uid, action)
+                ).fetchone()
+                tokens = float(burst) if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                tokens = max(0.0, tokens - count)
+                db.execute(
+                    "INSERT OR REPLACE INTO cooldowns (uid, action, tokens, stamp) VALUES (?, ?, ?, ?)",
+                    (uid, action, tokens, now),
+                )
+                balances.append((uid, action, tokens))
+        return balances
+
+    # --- snapshots ---
+
+    def load_snapshot(self, name: str) -> Optional[Tuple[str, float, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT source, computed_at, payload FROM snapshots WHERE name = ?", (name,)
+            ).fetchone()
+
+    def store_snapshot(self, name: str, source: str, computed_at: float, payload: str):
+        with self._transaction(self._db, self._lock) as db:
+            db.execute(
+                "INSERT OR REPLACE INTO snapshots (name, source, computed_at, payload) VALUES (?, ?, ?, ?)",
+                (name, source, computed_at, payload),
+            )
+            self._set_version(db, name)
+
+    # --- תחזוקה ---
+
+    def prune(self, now: float):
+        """מקצר את יומן השינויים ומוחק דליים שלא נגעו בהם מזמן (הם ממילא מלאים)."""
+        with self._transaction(self._db, self._lock) as db:
+            db.execute(
+                "DELETE FROM subscriber_changes WHERE seq <= "
+                "(SELECT COALESCE(MAX(seq), 0) FROM subscriber_changes) - ?",
+                (STATE_CHANGES_KEEP,),
+            )
+        with self._transaction(self._volatile, self._volatile_lock) as db:
+            db.execute("DELETE FROM cooldowns WHERE stamp < ?", (now - STATE_COOLDOWN_IDLE,))
+
+
+shared_state = SharedState(STATE_DB)    # נפתח ב־on_startup
+metrics.gauge("state_db_bytes", shared_state.size_bytes)
+
+
+# === חלק 0: ניהול מנויים יומיים (24 שעות) ===
+#
+# המנויים נשמרים בטבלת subscribers ב־STATE_DB (ראו SharedState), user_id -> timestamp של תוקף.
+# בזיכרון כל תהליך מחזיק מטמון: טבלת hash קומפקטית (SubscriptionTable) ולצידה heap של
+# תוקפים (ExpiryHeap). is_subscriber רק קורא מהטבלה; משימת רקע (expire_subscribers)
+# מרוקנת מה־heap את מי שפג תוקפו, במנות, עם טרנזקציה אחת לכל מנה.
+#
+# הפורמט הקודם – subscribers.json (snapshot) + subscribers.journal (שורת JSON לכל שינוי:
+# ["grant", "123456789", 1732664100] / ["revoke", "123456789"] / ["expire", "123456789"]) –
+# נקרא פעם אחת בעלייה הראשונה ומיובא ל־STATE_DB (meta: legacy_imported).
+
+def _read_snapshot(path: Path) -> dict:
+    if not path.exists():
         return {}
     try:
-        with SUBSCRIBERS_FILE.open("r", encoding="utf-8") as f:
+        with path.open("r", encoding="utf-8") as f:
             data = json.load(f)
-    except (json.JSONDecodeError, OSError):
+    except (json.JSONDecodeError, OSError) as exc:
+        print("subscribers snapshot unreadable:", repr(exc))
         return {}
     if isinstance(data, list):
         # אם פעם היה פורמט ישן של רשימה – נתחיל מחדש
@@ -68,126 +683,1977 @@ def load_subscribers() -> dict:
     return data
 
 
-def save_subscribers():
-    with SUBSCRIBERS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(subscribers, f, ensure_ascii=False, indent=2)
+def _replay_journal(path: Path, data: dict) -> int:
+    """מריץ את היומן על data במקום. מחזיר כמה אירועים הורצו."""
+    if not path.exists():
+        return 0
+    applied = 0
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                op, uid, *rest = json.loads(line)
+            except (json.JSONDecodeError, ValueError, TypeError):
+                # שורה אחרונה חלקית (קריסה באמצע כתיבה) – מדלגים
+                continue
+            if op == "grant" and rest:
+                data[uid] = rest[0]
+            elif op in ("revoke", "expire"):
+                data.pop(uid, None)
+            applied += 1
+    return applied
+
+
+def _write_snapshot(path: Path, data: dict):
+    """כתיבה אטומית: קובץ זמני + fsync + os.replace – אין מצב של קובץ חצי כתוב."""
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        # dumps (המקודד ב־C) ולא dump, שעובר על המבנה בפייתון – משמעותי במיליון מנויים
+        f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load_subscribers() -> dict:
+    """
+    טוען מנויים מהפורמט הקודם: snapshot מ־subscribers.json ועליו כל האירועים שביומן.
+    """
+    data = _read_snapshot(SUBSCRIBERS_FILE)
+    _replay_journal(SUBSCRIBERS_JOURNAL, data)
+    return data
+
+
+class SubscriptionTable:
+    """
+    user_id -> expiry (שניות שלמות מ־1970) בטבלת hash פתוחה (linear probing) על שני
+    array.array: מפתחות int64 וערכים uint32 – 12 בתים לתא, ~24 בתים למנוי בעומס של חצי,
+    במקום מאות בתים ל־dict של str->float. חיפוש O(1) בממוצע, בלי הקצאות.
+    """
+
+    EMPTY = 0        # user_id של טלגרם תמיד חיובי
+    DELETED = -1     # מצבה – החיפוש ממשיך לעבור דרכה
+
+    def __init__(self, capacity: int = 1024):
+        self._allocate(max(8, 1 << (capacity - 1).bit_length()))
+
+    def _allocate(self, capacity: int):
+        self._keys = array("q", bytes(8 * capacity))
+        self._values = array("I", bytes(4 * capacity))
+        self._mask = capacity - 1
+        self._size = 0
+        self._used = 0  # כולל מצבות
+
+    @classmethod
+    def from_entries(cls, uids: np.ndarray, expiries: np.ndarray) -> "SubscriptionTable":
+        """
+        בנייה בבת אחת ממערכי numpy (uids ייחודיים), בלי לולאת פייתון לכל מנוי:
+        בכל סבב כל מי שעוד לא שובץ מנסה את התא הנוכחי שלו; אחד לכל תא פנוי נכנס,
+        והשאר מתקדמים תא אחד – בדיוק המסלול ש־_slot עובר.
+        """
+        table = cls(2 * len(uids))
+        mask = np.uint64(table._mask)
+        keys = np.frombuffer(table._keys, dtype=np.int64)
+        values = np.frombuffer(table._values, dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            slots = ((uids.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)) >> np.uint64(32)) & mask
+        pending = np.arange(len(uids))
+        while len(pending):
+            free = keys[slots] == cls.EMPTY
+            _, first = np.unique(slots[free], return_index=True)
+            placed = np.flatnonzero(free)[first]
+            keys[slots[placed]] = uids[pending[placed]]
+            values[slots[placed]] = expiries[pending[placed]]
+            left = np.ones(len(pending), dtype=bool)
+            left[placed] = False
+            pending = pending[left]
+            slots = (slots[left] + np.uint64(1)) & mask
+        table._size = table._used = len(uids)
+        return table
+
+    def _slot(self, uid: int) -> int:
+        """האינדקס של uid, או התא הפנוי שבו הוא ייכנס (מצבה ראשונה בדרך, אם הייתה)."""
+        keys = self._keys
+        mask = self._mask
+        i = ((uid * 0x9E3779B97F4A7C15) >> 32) & mask
+        free = -1
+        while True:
+            key = keys[i]
+            if key == uid:
+                return i
+            if key == self.EMPTY:
+                return i if free < 0 else free
+            if key == self.DELETED and free < 0:
+                free = i
+            i = (i + 1) & mask
+
+    def get(self, uid: int) -> Optional[int]:
+        i = self._slot(uid)
+        return self._values[i] if self._keys[i] == uid else None
+
+    def set(self, uid: int, expiry: int):
+        i = self._slot(uid)
+        key = self._keys[i]
+        if key != uid:
+            if key == self.EMPTY:
+                self._used += 1
+            self._keys[i] = uid
+            self._size += 1
+        self._values[i] = expiry
+        if self._used * 2 > len(self._keys):
+            self._rehash()
+
+    def pop(self, uid: int) -> Optional[int]:
+        i = self._slot(uid)
+        if self._keys[i] != uid:
+            return None
+        self._keys[i] = self.DELETED
+        self._size -= 1
+        return self._values[i]
+
+    def _rehash(self):
+        # מגדילים רק אם רוב התאים באמת תפוסים; אחרת זה ניקוי מצבות באותו גודל
+        capacity = len(self._keys)
+        if self._size * 4 > capacity:
+            capacity *= 2
+        entries = list(self.items())
+        self._allocate(capacity)
+        for uid, expiry in entries:
+            self.set(uid, expiry)
+
+    def items(self):
+        values = self._values
+        for i, key in enumerate(self._keys):
+            if key > 0:
+                yield key, values[i]
+
+    def keys(self):
+        return (uid for uid, _ in self.items())
+
+    def __contains__(self, uid: int) -> bool:
+        return self._keys[self._slot(uid)] == uid
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class ExpiryHeap:
+    """
+    min-heap של (expiry, user_id) על שני array.array מקבילים (12 בתים לרשומה).
+    מחיקה היא "עצלה": רשומה שהמנוי שלה בוטל או חודש פשוט נזרקת כשהיא יוצאת מהראש,
+    כי התוקף שבה כבר לא תואם לטבלה.
+    """
+
+    def __init__(self):
+        self._expiry = array("I")
+        self._uid = array("q")
+
+    @classmethod
+    def from_entries(cls, expiries: np.ndarray, uids: np.ndarray) -> "ExpiryHeap":
+        """בנייה בבת אחת: מערך ממוין הוא כבר heap תקין (מיון ב־numpy, בלי לולאה)."""
+        heap = cls()
+        order = np.argsort(expiries, kind="stable")
+        heap._expiry.frombytes(np.ascontiguousarray(expiries[order], dtype=np.uint32).tobytes())
+        heap._uid.frombytes(np.ascontiguousarray(uids[order], dtype=np.int64).tobytes())
+        return heap
+
+    def __len__(self) -> int:
+        return len(self._expiry)
+
+    def peek(self) -> Optional[int]:
+        return self._expiry[0] if self._expiry else None
+
+    def push(self, expiry: int, uid: int):
+        exp, ids = self._expiry, self._uid
+        exp.append(expiry)
+        ids.append(uid)
+        i = len(exp) - 1
+        while i:
+            parent = (i - 1) >> 1
+            if exp[parent] <= expiry:
+                break
+            exp[i] = exp[parent]
+            ids[i] = ids[parent]
+            i = parent
+        exp[i] = expiry
+        ids[i] = uid
+
+    def pop(self) -> Tuple[int, int]:
+        exp, ids = self._expiry, self._uid
+        top = (exp[0], ids[0])
+        last_exp, last_uid = exp.pop(), ids.pop()
+        n = len(exp)
+        if n:
+            i = 0
+            while True:
+                child = 2 * i + 1
+                if child >= n:
+                    break
+                if child + 1 < n and exp[child + 1] < exp[child]:
+                    child += 1
+                if exp[child] >= last_exp:
+                    break
+                exp[i] = exp[child]
+                ids[i] = ids[child]
+                i = child
+            exp[i] = last_exp
+            ids[i] = last_uid
+        return top
+
+
+class SubscriberStore:
+    """
+    מטמון מקומי של המנויים (SubscriptionTable + ExpiryHeap) מעל טבלת subscribers ב־SharedState.
+    שינוי מתעדכן בזיכרון מיד ונכנס לתור; אחרי SUBSCRIBERS_WRITE_DELAY כל מה שהצטבר נכתב
+    בטרנזקציה אחת ב־io_executor. await flushed() חוזר כשכל מה ששונה עד הקריאה כבר נשמר.
+    שינויים של תהליכים אחרים נמשכים ב־sync() לפי subscriber_changes.
+    כתיבה ו־sync לא חופפות (_write_lock): כל מה ש־sync קורא נכתב או לפני הכתיבה שלנו
+    (ואז שינוי מקומי שעוד בתור גובר עליו) או אחריה (ואז הוא החדש יותר, והוא גובר).
+    """
+
+    def __init__(self, state: SharedState):
+        self.state = state
+        self.table = SubscriptionTable()
+        self.expiries = ExpiryHeap()
+        self.seq = 0        # עד איזה שינוי ב־subscriber_changes המטמון מעודכן
+        self._pending: Dict[int, Optional[int]] = {}   # uid -> expiry (None = הסרה), אחרון קובע
+        self._queued = 0    # כמה שינויים נכנסו לתור מאז העלייה
+        self._durable = 0   # כמה מהם כבר נשמרו
+        self._flusher: Optional[asyncio.Task] = None
+        self._flushed = asyncio.Condition()
+        self._write_lock = asyncio.Lock()
+
+    def load(self):
+        if not self.state.legacy_imported():
+            # מעבר חד־פעמי מ־subscribers.json + subscribers.journal
+            legacy = load_subscribers()
+            entries = {int(uid): math.ceil(exp) for uid, exp in legacy.items()}
+            if self.state.import_subscribers(entries) and entries:
+                print(f"imported {len(entries)} subscribers into {self.state.path}")
+        self._rebuild(*self.state.load_subscribers())
+
+    def _rebuild(self, uids: np.ndarray, expiries: np.ndarray, seq: int):
+        self.table = SubscriptionTable.from_entries(uids, expiries)
+        self.expiries = ExpiryHeap.from_entries(expiries, uids)
+        self.seq = seq
+
+    def get(self, uid: int) -> Optional[int]:
+        return self.table.get(uid)
+
+    def __contains__(self, uid: int) -> bool:
+        return uid in self.table
+
+    def __len__(self) -> int:
+        return len(self.table)
+
+    def keys(self):
+        return self.table.keys()
+
+    def grant(self, uid: int, expires_at: float):
+        expiry = math.ceil(expires_at)
+        self.table.set(uid, expiry)
+        self.expiries.push(expiry, uid)
+        self._queue(uid, expiry)
+
+    def revoke(self, uid: int) -> bool:
+        # הרשומה ב־heap נשארת ותיזרק כשתגיע לראש (כבר לא תואמת לטבלה)
+        if self.table.pop(uid) is None:
+            return False
+        self._queue(uid, None)
+        return True
+
+    async def expire_due(self, now: float, limit: int = EXPIRY_BATCH) -> List[int]:
+        """
+        מוציא מה־heap עד limit מנויים שפג תוקפם ומוחק אותם בטרנזקציה אחת.
+        המטמון מתעדכן רק אחרי שהמחיקה נשמרה; אם הכתיבה נכשלה המועמדים חוזרים ל־heap
+        (והשגיאה עולה הלאה), כך שהמטמון אף פעם לא מוחק מישהו שעדיין מנוי ב־STATE_DB.
+        מחזיר רק את מי שהתהליך הזה מחק (תהליך אחר אולי כבר מחק או חידש).
+        """
+        async with self._write_lock:
+            candidates: List[Tuple[int, int]] = []
+            while len(candidates) < limit and self.expiries and self.expiries.peek() < now:
+                expiry, uid = self.expiries.pop()
+                if self.table.get(uid) == expiry:
+                    candidates.append((uid, expiry))
+            if not candidates:
+                return []
+            try:
+                expired, before, after = await run_io(self.state.expire_subscribers, candidates)
+            except BaseException:
+                for uid, expiry in candidates:
+                    self.expiries.push(expiry, uid)
+                raise
+            for uid, expiry in candidates:
+                # מי שחודש מקומית בזמן הכתיבה נשאר (הרשומה הישנה כבר לא תואמת)
+                if self.table.get(uid) == expiry:
+                    self.table.pop(uid)
+            self._advance(before, after)
+        return expired
+
+    def _advance(self, before: int, after: int):
+        # אם אף תהליך אחר לא כתב לפנינו – המטמון כבר משקף גם את השינויים שלנו
+        if before == self.seq:
+            self.seq = after
+
+    async def sync(self):
+        """מושך שינויים של תהליכים אחרים (או טוען הכל מחדש אם היומן כבר קוצר)."""
+        async with self._write_lock:
+            rows = await run_io(self.state.subscriber_changes, self.seq)
+            if rows is None:
+                self._rebuild(*await run_io(self.state.load_subscribers))
+                # הטעינה המלאה לא כוללת את מה שעוד בתור – מחילים אותו מחדש
+                for uid, expiry in self._pending.items():
+                    self._apply(uid, expiry)
+                return
+            for seq, uid, expiry in rows:
+                # שינוי מקומי שעוד לא נכתב גובר – הוא ייכתב אחרי זה שקראנו, עם seq גבוה יותר
+                if uid not in self._pending:
+                    self._apply(uid, expiry)
+                self.seq = seq
+
+    def _apply(self, uid: int, expiry: Optional[int]):
+        if expiry is None:
+            self.table.pop(uid)
+        elif self.table.get(uid) != expiry:
+            self.table.set(uid, expiry)
+            self.expiries.push(expiry, uid)
+
+    def _queue(self, uid: int, expiry: Optional[int]):
+        self._pending[uid] = expiry
+        self._queued += 1
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # בלי לולאת אירועים (כלים, סקריפטים) – כותבים מיד
+            self.write_pending()
+            return
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    def write_pending(self):
+        """כתיבה סינכרונית של כל מה שממתין (בלי לולאת אירועים)."""
+        target = self._queued
+        if self._pending:
+            changes, self._pending = list(self._pending.items()), {}
+            self._advance(*self.state.write_subscribers(changes))
+            self._record_write(changes)
+        self._durable = target
+
+    @staticmethod
+    def _record_write(changes):
+        metrics.inc("subscriber_writes_total")
+        metrics.inc("subscriber_rows_written_total", (), len(changes))
+
+    async def _flush_later(self):
+        await asyncio.sleep(SUBSCRIBERS_WRITE_DELAY)
+        while self._pending:
+            async with self._write_lock:
+                target = self._queued
+                changes, self._pending = list(self._pending.items()), {}
+                try:
+                    self._advance(*await run_io(self.state.write_subscribers, changes))
+                except sqlite3.Error as exc:
+                    print("subscribers write failed, retrying:", repr(exc))
+                    # מחזירים לתור בלי לדרוס שינויים חדשים יותר שנכנסו בינתיים
+                    self._pending = {**dict(changes), **self._pending}
+                    failed = True
+                else:
+                    failed = False
+            if failed:
+                await asyncio.sleep(SUBSCRIBERS_WRITE_DELAY)
+                continue
+            self._record_write(changes)
+            async with self._flushed:
+                self._durable = target
+                self._flushed.notify_all()
+
+    async def flushed(self):
+        """מחכה עד שכל השינויים שנעשו עד עכשיו נשמרו ב־STATE_DB."""
+        target = self._queued
+        async with self._flushed:
+            await self._flushed.wait_for(lambda: self._durable >= target)
+
+    async def aclose(self):
+        await self.flushed()
 
 
 def is_subscriber(user_id: int) -> bool:
     """
     בדיקה אם משתמש נחשב מנוי:
-    • מנוי רק אם יש רשומה בתוקף בקובץ subscribers.json
+    • מנוי רק אם יש רשומה בתוקף בטבלת המנויים
     (אין יותר גישת מנוי אוטומטית לאדמין).
+    קריאה בלבד מהזיכרון – מחיקת מנויים שפגו נעשית ב־expire_subscribers.
     """
-    now = time.time()
-    uid = str(user_id)
+    expiry = subscribers.get(user_id)
+    return expiry is not None and time.time() <= expiry
 
-    expiry = subscribers.get(uid)
-    if not expiry:
-        return False
 
-    if now > expiry:
-        del subscribers[uid]
-        save_subscribers()
-        return False
+async def expire_subscribers(bot):
+    """
+    משימת רקע: כל EXPIRY_SWEEP_SECONDS מרוקנת מה־heap את המנויים שפגו,
+    במנות של EXPIRY_BATCH, ואם EXPIRY_NOTIFY – מודיעה לכל משתמש שהגישה הסתיימה.
+    """
+    while True:
+        await asyncio.sleep(EXPIRY_SWEEP_SECONDS)
+        try:
+            await sweep_expired(bot)
+        except sqlite3.Error as exc:
+            # למשל "database is locked" – המועמדים חזרו ל־heap וננסה שוב בסבב הבא
+            print("subscriber expiry failed:", repr(exc))
+
+
+async def sweep_expired(bot):
+    while True:
+        expired = await subscribers.expire_due(time.time())
+        if not expired:
+            break
+        events.log("expired", count=len(expired))
+        if EXPIRY_NOTIFY:
+            for uid in expired:
+                try:
+                    await bot.send_message(
+                        uid,
+                        "⌛ המנוי היומי שלך לבוט Chance Predictor הסתיים.\n"
+                        "אפשר לפתוח גישה ל־24 שעות נוספות דרך ״💳 רכישת מנוי״." + FOOTER,
+                        rate_limit_args=PRIORITY_BULK,
+                    )
+                except Exception:
+                    pass
+        if len(expired) < EXPIRY_BATCH:
+            break
+
+
+subscribers = SubscriberStore(shared_state)    # נטען ב־on_startup
+metrics.gauge("subscribers_active", lambda: len(subscribers))
+
+
+# === שליחה יוצאת: קצב משותף ועדיפויות ===
+#
+# כל קריאה לשליחה / עריכה עוברת דרך OutboundScheduler (rate limiter של PTB): יש תקציב
+# אחד לכל הבוט (OUTBOUND_RATE הודעות לשנייה), וכשהתקציב תפוס האסימון הבא הולך לממתין
+# עם העדיפות הגבוהה ביותר – תשובות למשתמשים לפני הודעות אדמין, והודעות אדמין לפני
+# שידורים. לכן שידור ארוך לא מעכב את מי שמחכה לקלפים החמים שלו.
+# את העדיפות מעבירים ב־rate_limit_args (ברירת מחדל: PRIORITY_INTERACTIVE).
+
+PRIORITY_INTERACTIVE = 0   # תשובות ישירות למשתמש (reply_text, עריכת עמודי היסטוריה)
+PRIORITY_ADMIN = 1         # הודעות שנשלחות בעקבות פעולת אדמין (/grant, /revoke, התקדמות שידור)
+PRIORITY_BULK = 2          # שידורים והודעות פקיעת מנוי
+PRIORITY_NAMES = ("interactive", "admin", "bulk")
+
+# רק שיטות ששולחות / עורכות הודעות נספרות בתקציב; getUpdates, answerCallbackQuery וכו' עוברות ישר
+OUTBOUND_METHOD_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+class TokenBucket:
+    """דלי אסימונים: עד burst שליחות ברצף, ובממוצע rate שליחות לשנייה."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._stamp = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    תור עדיפויות לפני ה־Bot API. משימת dispatch אחת לוקחת אסימון מהדלי המשותף
+    ומשחררת את הממתין הבכיר ביותר (עדיפות, ואז סדר הגעה).
+    זמני ההמתנה בתור נשמרים לכל מחלקה (OUTBOUND_WAIT_SAMPLES אחרונים) ל־p50/p99.
+    """
+
+    def __init__(self, rate: float = OUTBOUND_RATE, burst: int = OUTBOUND_BURST):
+        self._bucket = TokenBucket(rate, burst)
+        self._waiters: list = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._resume_at = 0.0
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.waits = [deque(maxlen=OUTBOUND_WAIT_SAMPLES) for _ in PRIORITY_NAMES]
+
+    async def initialize(self):
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def shutdown(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(OUTBOUND_METHOD_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        priority = PRIORITY_INTERACTIVE if rate_limit_args is None else rate_limit_args
+        future = asyncio.get_running_loop().create_future()
+        queued = time.monotonic()
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        self._seq += 1
+        self._wakeup.set()
+        await future
+        waited = time.monotonic() - queued
+        self.waits[priority].append(waited)
+        metrics.observe("outbound_wait_seconds", waited, (("class", PRIORITY_NAMES[priority]),))
+
+        labels = (("method", endpoint),)
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as exc:
+            if isinstance(exc, RetryAfter):
+                # טלגרם ביקש להאט – עוצרים את כל התור, לא רק את הבקשה הזו
+                self._resume_at = max(self._resume_at, time.monotonic() + exc.retry_after)
+            metrics.inc("outbound_errors_total", labels + (("type", type(exc).__name__),))
+            raise
+        finally:
+            metrics.observe("outbound_send_seconds", time.perf_counter() - start, labels)
+
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def _dispatch(self):
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            pause = self._resume_at - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._bucket.acquire()
+            # העדיפות נקבעת ברגע שיש אסימון, כך שמי שהגיע בזמן ההמתנה עוקף
+            while self._waiters:
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+                    break
+
+    def wait_summary(self) -> Dict[str, Tuple[float, float, int]]:
+        """מחלקה -> (p50, p99, כמות) של זמני ההמתנה בתור, בשניות."""
+        summary = {}
+        for name, samples in zip(PRIORITY_NAMES, self.waits):
+            if samples:
+                p50, p99 = np.percentile(np.fromiter(samples, dtype=np.float64), [50, 99])
+                summary[name] = (float(p50), float(p99), len(samples))
+            else:
+                summary[name] = (0.0, 0.0, 0)
+        return summary
+
+
+outbound = OutboundScheduler()
+metrics.gauge("outbound_queued", outbound.queued)
+
+
+# === שידור למנויים (משימת רקע) ===
+#
+# /broadcast לא מחכה יותר לשליחה עצמה: נוצרת "עבודת שידור" בתיקייה BROADCAST_DIR –
+# job.json (הטקסט + הודעת ההתקדמות של האדמין), recipients.npy (רשימת הנמענים ברגע
+# השידור) ו־status.bin (בית אחד לכל נמען: ממתין / נשלח / נכשל, ממופה ב־mmap ולכן
+# כל עדכון נשמר גם אם התהליך נופל). אחרי עלייה מחדש השידור ממשיך רק עם מי שעוד ממתין.
+
+BROADCAST_PENDING = 0
+BROADCAST_SENT = 1
+BROADCAST_FAILED = 2
+
+
+class Broadcast:
+    """עבודת שידור אחת: רשימת נמענים, סטטוס לכל נמען והודעת התקדמות אחת שמתעדכנת."""
+
+    def __init__(self, directory: Path, job: dict, recipients: np.ndarray, status: np.ndarray):
+        self.directory = directory
+        self.job = job
+        self.recipients = recipients
+        self.status = status
+        self.sent = int(np.count_nonzero(status == BROADCAST_SENT))
+        self.failed = int(np.count_nonzero(status == BROADCAST_FAILED))
+        self._reported = None
+
+    @classmethod
+    def create(cls, directory: Path, text: str, chat_id: int, message_id: int, recipients: np.ndarray) -> "Broadcast":
+        directory.mkdir(exist_ok=True)
+        np.save(directory / "recipients.npy", recipients)
+        status = np.memmap(directory / "status.bin", dtype=np.uint8, mode="w+", shape=(len(recipients),))
+        job = {"text": text, "chat_id": chat_id, "message_id": message_id, "started_at": time.time()}
+        # job.json נכתב אחרון – רק עבודה שלמה תזוהה בעלייה הבאה
+        _write_snapshot(directory / "job.json", job)
+        return cls(directory, job, recipients, status)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["Broadcast"]:
+        job_path = directory / "job.json"
+        if not job_path.exists():
+            return None
+        try:
+            job = json.loads(job_path.read_text(encoding="utf-8"))
+            recipients = np.load(directory / "recipients.npy")
+            status = np.memmap(directory / "status.bin", dtype=np.uint8, mode="r+")
+        except (OSError, ValueError) as exc:
+            print("broadcast state unreadable:", repr(exc))
+            return None
+        return cls(directory, job, recipients, status)
+
+    @property
+    def total(self) -> int:
+        return len(self.recipients)
+
+    def remove(self):
+        del self.status
+        for name in ("job.json", "recipients.npy", "status.bin"):
+            (self.directory / name).unlink(missing_ok=True)
+
+    async def run(self, bot):
+        pending = iter(np.flatnonzero(self.status == BROADCAST_PENDING).tolist())
+        bucket = TokenBucket(BROADCAST_RATE, BROADCAST_BURST)
+        started = time.monotonic()
+        done_before = self.sent + self.failed
+        reporter = asyncio.create_task(self._report_loop(bot, started, done_before))
+        try:
+            await asyncio.gather(*(
+                self._worker(bot, pending, bucket) for _ in range(BROADCAST_CONCURRENCY)
+            ))
+        finally:
+            reporter.cancel()
+            self.status.flush()
+        elapsed = time.monotonic() - started
+        print(f"broadcast done: {self.sent} sent, {self.failed} failed in {elapsed:.1f}s")
+        events.log("broadcast_done", sent=self.sent, failed=self.failed, seconds=round(elapsed, 1))
+        for name, (p50, p99, count) in outbound.wait_summary().items():
+            print(f"  outbound wait [{name}]: p50={p50 * 1000:.0f}ms p99={p99 * 1000:.0f}ms (n={count})")
+        await self._report(bot, self._progress_text(started, done_before, finished=True))
+        await run_io(self.remove)
+
+    async def _worker(self, bot, pending, bucket: TokenBucket):
+        # כל העובדים שולפים מאותו איטרטור – כל נמען נלקח פעם אחת בדיוק
+        for i in pending:
+            result = await self._deliver(bot, int(self.recipients[i]), bucket)
+            self.status[i] = result
+            if result == BROADCAST_SENT:
+                self.sent += 1
+            else:
+                self.failed += 1
+
+    async def _deliver(self, bot, chat_id: int, bucket: TokenBucket) -> int:
+        for attempt in range(BROADCAST_MAX_ATTEMPTS):
+            await bucket.acquire()
+            try:
+                await bot.send_message(chat_id=chat_id, text=self.job["text"], rate_limit_args=PRIORITY_BULK)
+                return BROADCAST_SENT
+            except RetryAfter as exc:
+                # טלגרם ביקש להמתין – רק הנמען הזה מחכה, שאר העובדים ממשיכים
+                await asyncio.sleep(exc.retry_after)
+            except (Forbidden, BadRequest):
+                # המשתמש חסם את הבוט / הצ'אט לא קיים – אין טעם לנסות שוב
+                return BROADCAST_FAILED
+            except NetworkError:
+                await asyncio.sleep(2 ** attempt)
+            except TelegramError:
+                return BROADCAST_FAILED
+        return BROADCAST_FAILED
+
+    def _progress_text(self, started: float, done_before: int, finished: bool = False) -> str:
+        done = self.sent + self.failed
+        elapsed = max(time.monotonic() - started, 1e-9)
+        title = "✅ השידור הסתיים" if finished else "📣 שידור למנויים בתהליך..."
+        return (
+            f"{title}\n"
+            f"נשלח: {self.sent} · נכשל: {self.failed} · סה״כ: {done}/{self.total}\n"
+            f"קצב: {(done - done_before) / elapsed:.1f} הודעות לשנייה" + FOOTER
+        )
+
+    async def _report_loop(self, bot, started: float, done_before: int):
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_SECONDS)
+            await run_io(self.status.flush)
+            await self._report(bot, self._progress_text(started, done_before))
+
+    async def _report(self, bot, text: str):
+        if text == self._reported:
+            return
+        try:
+            await bot.edit_message_text(
+                text,
+                chat_id=self.job["chat_id"],
+                message_id=self.job["message_id"],
+                rate_limit_args=PRIORITY_ADMIN,
+            )
+            self._reported = text
+        except TelegramError as exc:
+            print("broadcast progress edit failed:", repr(exc))
+
+
+# המשימה של השידור הנוכחי (שידור אחד בכל פעם)
+broadcast_task: Optional[asyncio.Task] = None
+
+
+def start_broadcast(bot, job: Broadcast):
+    global broadcast_task
+
+    async def runner():
+        try:
+            await job.run(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            print("broadcast failed:", repr(exc))
 
-    return True
+    broadcast_task = asyncio.create_task(runner())
 
 
-subscribers = load_subscribers()
+def broadcast_running() -> bool:
+    return broadcast_task is not None and not broadcast_task.done()
 
 
 # === חלק 1: עבודה עם נתונים ===
 
-def load_draws(limit: int = 200) -> List[Tuple[str, str, str, str]]:
+Draw = Tuple[str, str, str, str]
+
+# דרגות הקלפים (7–A, כמו בצ'אנס). בזיכרון כל דרגה נשמרת כאינדקס 0–7
+RANKS = ["7", "8", "9", "10", "J", "Q", "K", "A"]
+RANK_INDEX = {rank: i for i, rank in enumerate(RANKS)}
+NUM_RANKS = len(RANKS)
+
+# צורות לפי עמודות – משמאל לימין: עלה, לב, יהלום, תלתן
+SUITS = ["♠️", "♥️", "♦️", "♣️"]
+NUM_COLUMNS = len(SUITS)
+
+# היסט לכל עמודה, כדי לספור את כל 4 העמודות ב־bincount אחד (עמודה * 8 + דרגה)
+COLUMN_OFFSETS = np.arange(NUM_COLUMNS, dtype=np.intp) * NUM_RANKS
+_OFFSETS = tuple(COLUMN_OFFSETS.tolist())
+NUM_CELLS = NUM_COLUMNS * NUM_RANKS
+
+# כל 8⁴ = 4096 הצירופים האפשריים, שורה לכל צירוף – באותו סדר כמו tensor.ravel()
+ALL_COMBOS = np.indices((NUM_RANKS,) * NUM_COLUMNS).reshape(NUM_COLUMNS, -1).T.astype(np.uint8)
+COLUMN_PAIRS = [(i, j) for i in range(NUM_COLUMNS) for j in range(i + 1, NUM_COLUMNS)]
+
+# פרמטרים של דירוג הצירופים (ראו score_combinations)
+RECENT_WINDOW = 50        # החלון הקצר שמייצג "מה חם עכשיו"
+RECENCY_WEIGHT = 0.35     # המשקל של החלון הקצר מול החלון הארוך
+PAIR_WEIGHT = 0.5         # המשקל של הופעות משותפות בין עמודות
+MIN_SET_DISTANCE = 2      # בכמה עמודות לפחות כל שני צירופים מוצעים חייבים להיות שונים
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+MAX_DRAW_DAY = np.iinfo(np.uint16).max
+MAX_DRAW_NUMBER = np.iinfo(np.uint32).max
+
+# כמה בתים לפני ה־offset האחרון נשמרים כדי לזהות שהקובץ נכתב מחדש (ולא רק הוארך)
+FINGERPRINT_BYTES = 64
+
+
+class DrawRow(NamedTuple):
+    number: int
+    date: date
+    cards: Draw
+
+
+# הגרלה אחת כפי שמוצגת למשתמש (אותם שדות כמו DrawRow)
+DrawRecord = DrawRow
+
+
+def parse_date(text: str) -> date:
+    """
+    dd/mm/yyyy -> date. פירוק ידני – מהיר בהרבה מ־strptime על היסטוריה ארוכה.
+    זורק ValueError על תאריך לא תקין.
+    """
+    day, month, year = text.strip().split("/")
+    return date(int(year), int(month), int(day))
+
+
+def _parse_draw_row(row: List[str]) -> Optional[DrawRow]:
     """
-    קורא קובץ בפורמט:
+    שורה בפורמט:
     date,draw_number,card1,card2,card3,card4,empty
     לדוגמה:
     27/11/2025,52009,8,9,9,Q,
+    מחזיר None לשורה לא תקינה (כותרת, שורה ריקה, קלף לא מוכר וכו').
     """
-    draws = []
+    if len(row) < 6:
+        return None
 
-    if not DATA_FILE.exists():
-        return []
+    try:
+        draw_date = parse_date(row[0])
+        number = int(row[1].strip())
+    except ValueError:
+        return None
 
-    with DATA_FILE.open("r", encoding="utf-8") as f:
-        reader = csv.reader(f)
-        for row in reader:
-            if len(row) < 6:
-                continue
+    cards = (row[2].strip(), row[3].strip(), row[4].strip(), row[5].strip())
+    if not 0 < number <= MAX_DRAW_NUMBER or not all(card in RANK_INDEX for card in cards):
+        return None
+    # התאריך נשמר כ־uint16 של ימים מ־1970 (עד 2149)
+    if not 0 <= draw_date.toordinal() - EPOCH_ORDINAL <= MAX_DRAW_DAY:
+        return None
+
+    return DrawRow(number, draw_date, cards)
+
+
+def _parse_draw_lines(data: bytes) -> List[DrawRow]:
+    text = data.decode("utf-8-sig" if data.startswith(codecs.BOM_UTF8) else "utf-8")
+    rows = []
+    for row in csv.reader(text.splitlines()):
+        parsed = _parse_draw_row(row)
+        if parsed is not None:
+            rows.append(parsed)
+    return rows
+
+
+def encode_draws(draws: List[Draw]) -> np.ndarray:
+    """רשימת הגרלות (מחרוזות) -> מטריצה (n, 4) של אינדקסי דרגות 0–7."""
+    if not draws:
+        return np.empty((0, NUM_COLUMNS), dtype=np.uint8)
+    return np.array([[RANK_INDEX[card] for card in draw] for draw in draws], dtype=np.uint8)
+
+
+def decode_draw(row) -> Draw:
+    return tuple(RANKS[i] for i in row)
+
+
+def count_columns(cards: np.ndarray) -> np.ndarray:
+    """ספירה לכל עמודה ולכל דרגה במעבר אחד – מחזיר מערך (4, 8)."""
+    flat = (cards.astype(np.intp) + COLUMN_OFFSETS).ravel()
+    return np.bincount(flat, minlength=NUM_CELLS).reshape(NUM_COLUMNS, NUM_RANKS)
+
+
+def count_pairs(cards: np.ndarray) -> np.ndarray:
+    """
+    ספירת הופעות משותפות: pairs[i, j, a, b] = בכמה הגרלות דרגה a בעמודה i
+    יצאה יחד עם דרגה b בעמודה j. מחזיר מערך (4, 4, 8, 8).
+    """
+    return _pair_tensor(_pair_matrix(cards))
 
-            card1 = row[2].strip()
-            card2 = row[3].strip()
-            card3 = row[4].strip()
-            card4 = row[5].strip()
 
-            if card1 and card2 and card3 and card4:
-                draws.append((card1, card2, card3, card4))
+def _pair_matrix(cards: np.ndarray) -> np.ndarray:
+    """
+    מטריצה (32, 32) לפי תאים (עמודה * 8 + דרגה): בכמה הגרלות שני התאים יצאו יחד.
+    bincount אחד לכל זוג עמודות (קוד = דרגה_i * 8 + דרגה_j) – בלי מטריצת one-hot ענקית.
+    """
+    matrix = np.zeros((NUM_CELLS, NUM_CELLS), dtype=np.int64)
+    columns = [cards[:, col].astype(np.intp) for col in range(NUM_COLUMNS)]
+    for col in range(NUM_COLUMNS):
+        cells = slice(col * NUM_RANKS, (col + 1) * NUM_RANKS)
+        matrix[cells, cells] = np.diag(np.bincount(columns[col], minlength=NUM_RANKS))
+    for i, j in COLUMN_PAIRS:
+        block = np.bincount(columns[i] * NUM_RANKS + columns[j], minlength=NUM_RANKS * NUM_RANKS)
+        block = block.reshape(NUM_RANKS, NUM_RANKS)
+        matrix[i * NUM_RANKS:(i + 1) * NUM_RANKS, j * NUM_RANKS:(j + 1) * NUM_RANKS] = block
+        matrix[j * NUM_RANKS:(j + 1) * NUM_RANKS, i * NUM_RANKS:(i + 1) * NUM_RANKS] = block.T
+    return matrix
+
+
+def _pair_tensor(matrix: np.ndarray) -> np.ndarray:
+    return matrix.reshape(NUM_COLUMNS, NUM_RANKS, NUM_COLUMNS, NUM_RANKS).transpose(0, 2, 1, 3)
+
+
+class Partner(NamedTuple):
+    rank: str
+    column: int
+    count: int   # בכמה הגרלות יצאו יחד בחלון
+    lift: float  # פי כמה יותר (או פחות) ממה שהיה צפוי אילו העמודות היו בלתי תלויות
+
+    def __str__(self):
+        return f"{self.rank}{SUITS[self.column]}"
+
+
+class HotCard(NamedTuple):
+    rank: str
+    column: int
+    count: int
 
-    # לא הופכים את הרשימה — משאירים כמו בקובץ
-    return draws[:limit]
+    def __str__(self):
+        return f"{self.rank}{SUITS[self.column]}"
 
 
-def get_last_10_draws() -> List[Tuple[str, str, str, str]]:
+@dataclass(frozen=True)
+class CardStats:
+    """
+    תדירויות לכל עמודה (צורה) ולכל דרגה.
+    per_column[col, rank] = כמה פעמים הדרגה יצאה בעמודה הזאת בחלון.
+    pairs – ספירת הופעות משותפות (4, 4, 8, 8) באותו חלון, אם חושבה (ראו count_pairs).
+    """
+    per_column: np.ndarray
+    n_draws: int
+    pairs: Optional[np.ndarray] = None
+
+    @property
+    def overall(self) -> np.ndarray:
+        """ספירה כוללת לכל דרגה, בלי קשר לעמודה – מערך (8,)."""
+        return self.per_column.sum(axis=0)
+
+    def count(self, rank: str, column: int) -> int:
+        return int(self.per_column[column, RANK_INDEX[rank]])
+
+    def column_ranking(self, column: int) -> List[str]:
+        """הדרגות בעמודה מהחזקה לחלשה (בתיקו – הדרגה הנמוכה קודם)."""
+        order = np.argsort(-self.per_column[column], kind="stable")
+        return [RANKS[i] for i in order]
+
+    def probabilities(self) -> np.ndarray:
+        """שכיחות לכל עמודה ודרגה, עם החלקת לפלס – מערך (4, 8)."""
+        return (self.per_column + 1.0) / (self.n_draws + NUM_RANKS)
+
+    def lift(self) -> np.ndarray:
+        """
+        lift[i, j, a, b] = P(a בעמודה i וגם b בעמודה j) / (P(a בעמודה i) · P(b בעמודה j)),
+        עם החלקת לפלס. מעל 1 – יוצאים יחד יותר מהצפוי, מתחת ל־1 – פחות.
+        """
+        p = self.probabilities()
+        joint = (self.pairs + 1.0) / (self.n_draws + NUM_RANKS * NUM_RANKS)
+        return joint / (p[:, None, :, None] * p[None, :, None, :])
+
+    def pair_lift(self, rank_a: str, column_a: int, rank_b: str, column_b: int) -> float:
+        return float(self.lift()[column_a, column_b, RANK_INDEX[rank_a], RANK_INDEX[rank_b]])
+
+    def top_partners(self, rank: str, column: int, top_n: int = 3) -> List[Partner]:
+        """
+        הקלפים (בעמודות האחרות) שהכי הרבה פעמים יצאו באותה הגרלה עם rank בעמודה column.
+        בתיקו – ה־lift הגבוה קודם.
+        """
+        a = RANK_INDEX[rank]
+        lift = self.lift()[column, :, a, :]
+        together = self.pairs[column, :, a, :]
+        candidates = [
+            (col, b) for col in range(NUM_COLUMNS) if col != column for b in range(NUM_RANKS)
+        ]
+        candidates.sort(key=lambda cell: (-together[cell], -lift[cell]))
+        return [
+            Partner(RANKS[b], col, int(together[col, b]), float(lift[col, b]))
+            for col, b in candidates[:top_n]
+        ]
+
+
+class SlidingWindowCounts:
+    """
+    מונים חיים ל־size ההגרלות האחרונות.
+    ring buffer בגודל קבוע שומר את השורות שבחלון; כל הגרלה חדשה מוסיפה את השורה שלה
+    ומחסירה את השורה שיוצאת מהחלון – O(1) להגרלה, בלי לסרוק היסטוריה.
+
+    המונים נשמרים כרשימות שטוחות: 32 תאים (עמודה * 8 + דרגה) ו־32×32 זוגות תאים
+    להופעות משותפות. עדכון של 4 + 16 תאים בודדים ב־Python מהיר יותר מ־fancy indexing של numpy.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._flat = [0] * NUM_CELLS
+        self._pairs = [0] * (NUM_CELLS * NUM_CELLS)
+        self._ring: List[Tuple[int, ...]] = [()] * size
+        self._pos = 0
+        self._filled = 0
+
+    @property
+    def n_draws(self) -> int:
+        return self._filled
+
+    @property
+    def counts(self) -> np.ndarray:
+        return np.array(self._flat, dtype=np.int64).reshape(NUM_COLUMNS, NUM_RANKS)
+
+    @property
+    def pairs(self) -> np.ndarray:
+        return _pair_tensor(np.array(self._pairs, dtype=np.int64).reshape(NUM_CELLS, NUM_CELLS))
+
+    def push(self, row):
+        flat = self._flat
+        pairs = self._pairs
+        if self._filled == self.size:
+            old = self._ring[self._pos]
+            for i in old:
+                flat[i] -= 1
+                base = i * NUM_CELLS
+                for j in old:
+                    pairs[base + j] -= 1
+        else:
+            self._filled += 1
+        cells = tuple(offset + rank for offset, rank in zip(_OFFSETS, row))
+        for i in cells:
+            flat[i] += 1
+            base = i * NUM_CELLS
+            for j in cells:
+                pairs[base + j] += 1
+        self._ring[self._pos] = cells
+        self._pos = (self._pos + 1) % self.size
+
+    def extend(self, cards: np.ndarray):
+        # בלוק גדול מהחלון (טעינה ראשונית) – בונים ישר מהסוף שלו בפעולה וקטורית אחת
+        if len(cards) >= self.size:
+            block = cards[-self.size:]
+            self._ring = [tuple(cells) for cells in (block.astype(np.intp) + COLUMN_OFFSETS).tolist()]
+            self._flat = count_columns(block).ravel().tolist()
+            self._pairs = _pair_matrix(block).ravel().tolist()
+            self._pos = 0
+            self._filled = self.size
+            return
+        for row in cards.tolist():
+            self.push(row)
+
+
+class WindowSet:
+    """כמה SlidingWindowCounts במקביל – אחד לכל גודל חלון ב־STATS_WINDOWS."""
+
+    def __init__(self, sizes=STATS_WINDOWS):
+        self.windows = {size: SlidingWindowCounts(size) for size in sizes}
+
+    def extend(self, cards: np.ndarray):
+        for window in self.windows.values():
+            window.extend(cards)
+
+    def export(self) -> Dict[int, CardStats]:
+        return {
+            size: CardStats(per_column=window.counts, n_draws=window.n_draws, pairs=window.pairs)
+            for size, window in self.windows.items()
+        }
+
+
+class ColdCard(NamedTuple):
+    rank: str
+    column: int
+    streak: int      # כמה הגרלות ברצף הקלף לא יצא בעמודה הזאת
+    mean_gap: float  # ממוצע היסטורי של הפער בין הופעות
+    max_gap: int     # הפער הארוך ביותר שנמדד בהיסטוריה
+
+    def __str__(self):
+        return f"{self.rank}{SUITS[self.column]}"
+
+
+@dataclass(frozen=True)
+class GapStats:
+    """
+    מתי כל קלף יצא לאחרונה בכל עמודה, והתפלגות הפערים ההיסטורית שלו.
+    כל המערכים בצורה (4, 8); last_seen = מיקום ההגרלה האחרונה שבה יצא (-1 = אף פעם).
+    """
+    last_seen: np.ndarray
+    gap_count: np.ndarray
+    gap_sum: np.ndarray
+    gap_max: np.ndarray
+    n_draws: int
+
+    @property
+    def streak(self) -> np.ndarray:
+        """כמה הגרלות עברו מאז ההופעה האחרונה (קלף שלא יצא אף פעם – כל ההיסטוריה)."""
+        return np.where(self.last_seen >= 0, self.n_draws - 1 - self.last_seen, self.n_draws)
+
+    @property
+    def mean_gap(self) -> np.ndarray:
+        return self.gap_sum / np.maximum(self.gap_count, 1)
+
+    def coldest(self, top_n: int = 3) -> List[ColdCard]:
+        """הקלפים שהכי הרבה זמן לא יצאו בעמודה שלהם – 32 תאים, זמן קבוע."""
+        streak = self.streak
+        mean_gap = self.mean_gap
+        order = np.argsort(-streak.ravel(), kind="stable")[:top_n].tolist()
+        cold = []
+        for i in order:
+            col, rank = divmod(i, NUM_RANKS)
+            cold.append(ColdCard(
+                RANKS[rank], col, int(streak[col, rank]),
+                float(mean_gap[col, rank]), int(self.gap_max[col, rank]),
+            ))
+        return cold
+
+
+class GapIndex:
+    """
+    אינדקס "מתי יצא לאחרונה" לכל דרגה × עמודה.
+    כל הגרלה חדשה מעדכנת 4 תאים בלבד (O(1)): הפער מההופעה הקודמת נכנס
+    לספירה / לסכום / למקסימום, והמיקום הנוכחי נשמר כהופעה האחרונה.
+    """
+
+    def __init__(self):
+        size = NUM_CELLS
+        self.n_draws = 0
+        self._last = [-1] * size
+        self._count = [0] * size
+        self._sum = [0] * size
+        self._max = [0] * size
+
+    def push(self, row):
+        pos = self.n_draws
+        for offset, rank in zip(_OFFSETS, row):
+            i = offset + rank
+            last = self._last[i]
+            if last >= 0:
+                gap = pos - last
+                self._count[i] += 1
+                self._sum[i] += gap
+                if gap > self._max[i]:
+                    self._max[i] = gap
+            self._last[i] = pos
+        self.n_draws = pos + 1
+
+    def extend(self, cards: np.ndarray):
+        if len(cards) <= NUM_CELLS:
+            for row in cards.tolist():
+                self.push(row)
+            return
+
+        # בלוק גדול (טעינה ראשונית) – לכל תא: מיקומי ההופעות ו־np.diff ביניהם.
+        # מיון יציב של העמודה לפי דרגה מקבץ את המיקומים של כל דרגה, כבר בסדר עולה
+        base = self.n_draws
+        for col in range(NUM_COLUMNS):
+            column = cards[:, col]
+            order = np.argsort(column, kind="stable")
+            bounds = np.concatenate(([0], np.cumsum(np.bincount(column, minlength=NUM_RANKS))))
+            for rank in range(NUM_RANKS):
+                positions = order[bounds[rank]:bounds[rank + 1]] + base
+                if not len(positions):
+                    continue
+                i = col * NUM_RANKS + rank
+                gaps = np.diff(positions)
+                if self._last[i] >= 0:
+                    gaps = np.concatenate(([positions[0] - self._last[i]], gaps))
+                if len(gaps):
+                    self._count[i] += len(gaps)
+                    self._sum[i] += int(gaps.sum())
+                    self._max[i] = max(self._max[i], int(gaps.max()))
+                self._last[i] = int(positions[-1])
+        self.n_draws = base + len(cards)
+
+    def export(self) -> GapStats:
+        shape = (NUM_COLUMNS, NUM_RANKS)
+        return GapStats(
+            last_seen=np.array(self._last, dtype=np.int64).reshape(shape),
+            gap_count=np.array(self._count, dtype=np.int64).reshape(shape),
+            gap_sum=np.array(self._sum, dtype=np.int64).reshape(shape),
+            gap_max=np.array(self._max, dtype=np.int64).reshape(shape),
+            n_draws=self.n_draws,
+        )
+
+
+@dataclass(frozen=True)
+class DrawSnapshot:
+    """
+    תמונת מצב של ההגרלות, בסדר כרונולוגי (מהישנה לחדשה):
+    numbers – מספר ההגרלה, days – ימים מ־1970, cards – מטריצה (n, 4) של דרגות 0–7.
+    אלה views על מערכים שרק מתארכים, ולכן ה־snapshot לא מעתיק את ההיסטוריה.
+    signature = (inode, size, mtime_ns) של קובץ ה־CSV בזמן הטעינה ((0, 0, 0) אם אין קובץ).
+    """
+    numbers: np.ndarray
+    days: np.ndarray
+    cards: np.ndarray
+    column_counts: np.ndarray
+    pair_counts: np.ndarray
+    windows: Dict[int, CardStats]
+    gaps: GapStats
+    signature: Tuple[int, int, int]
+    version: int
+
+    @property
+    def count(self) -> int:
+        return len(self.numbers)
+
+    @property
+    def last_number(self) -> int:
+        return int(self.numbers[-1]) if self.count else 0
+
+    def latest(self, limit: int) -> List[Draw]:
+        """ההגרלות האחרונות – מהחדשה לישנה, כמו בקובץ של מפעל הפיס."""
+        block = self.cards[max(0, self.count - limit):][::-1]
+        return [decode_draw(row) for row in block.tolist()]
+
+    def record(self, pos: int) -> DrawRecord:
+        return DrawRecord(
+            number=int(self.numbers[pos]),
+            date=date.fromordinal(EPOCH_ORDINAL + int(self.days[pos])),
+            cards=decode_draw(self.cards[pos].tolist()),
+        )
+
+    def find_draw(self, number: int) -> Optional[int]:
+        """המיקום של הגרלה לפי מספר – חיפוש בינארי על numbers (ממוין). None אם אין כזאת."""
+        pos = int(np.searchsorted(self.numbers, number))
+        if pos < self.count and self.numbers[pos] == number:
+            return pos
+        return None
+
+    @cached_property
+    def _date_order(self) -> Optional[np.ndarray]:
+        """
+        אינדקס ממוין לפי תאריך. בדרך כלל מספרי ההגרלה והתאריכים עולים יחד
+        ואז days עצמו כבר ממוין (None); אחרת – argsort יציב, פעם אחת לכל snapshot.
+        """
+        if np.all(self.days[1:] >= self.days[:-1]):
+            return None
+        return np.argsort(self.days, kind="stable")
+
+    @cached_property
+    def _sorted_days(self) -> np.ndarray:
+        """days לפי סדר התאריכים – פעם אחת לכל snapshot, ולא בכל עמוד."""
+        order = self._date_order
+        return self.days if order is None else self.days[order]
+
+    def date_range(self, start: date, end: date, offset: int = 0, limit: Optional[int] = None) -> Tuple[np.ndarray, int]:
+        """
+        עמוד מתוך ההגרלות בין start ל־end (כולל), מהחדשה לישנה: limit מיקומים החל מ־offset,
+        ואיתם מספר ההגרלות בטווח כולו. שני חיפושים בינאריים על האינדקס, והעמוד נחתך
+        ישר מהגבולות – עמוד עולה כגודלו, לא כגודל הטווח.
+        """
+        days = self._sorted_days
+        lo = int(np.searchsorted(days, start.toordinal() - EPOCH_ORDINAL, side="left"))
+        hi = int(np.searchsorted(days, end.toordinal() - EPOCH_ORDINAL, side="right"))
+        total = max(hi - lo, 0)
+        stop = hi - min(max(offset, 0), total)
+        first = lo if limit is None else max(lo, stop - limit)
+        order = self._date_order
+        positions = np.arange(first, stop) if order is None else order[first:stop]
+        return positions[::-1], total
+
+    def stats(self, window: Optional[int] = None) -> CardStats:
+        """
+        סטטיסטיקה על כל ההיסטוריה או על window ההגרלות האחרונות.
+        חלונות מ־STATS_WINDOWS ומלוא ההיסטוריה מגיעים מהמונים החיים בלי סריקה.
+        """
+        if window in self.windows:
+            return self.windows[window]
+        if window is None or window >= self.count:
+            return CardStats(per_column=self.column_counts, n_draws=self.count, pairs=self.pair_counts)
+        return calc_card_stats(self.cards[self.count - window:])
+
+    def window_mismatches(self) -> List[int]:
+        """
+        בדיקת עקביות: משווה כל חלון חי לחישוב מלא מחדש על אותן הגרלות.
+        מחזיר את גדלי החלונות שלא תואמים (רשימה ריקה = הכל תקין).
+        """
+        bad = []
+        for size, stats in self.windows.items():
+            expected = calc_card_stats(self.cards[max(0, self.count - size):])
+            if (
+                stats.n_draws != expected.n_draws
+                or not np.array_equal(stats.per_column, expected.per_column)
+                or not np.array_equal(stats.pairs, expected.pairs)
+            ):
+                bad.append(size)
+        if (
+            not np.array_equal(self.column_counts, count_columns(self.cards))
+            or not np.array_equal(self.pair_counts, count_pairs(self.cards))
+        ):
+            bad.append(self.count)
+        return bad
+
+
+def _empty_snapshot() -> DrawSnapshot:
+    cards = np.empty((0, NUM_COLUMNS), dtype=np.uint8)
+    return DrawSnapshot(
+        numbers=np.empty(0, dtype=np.uint32),
+        days=np.empty(0, dtype=np.uint16),
+        cards=cards,
+        column_counts=count_columns(cards),
+        pair_counts=count_pairs(cards),
+        windows=WindowSet().export(),
+        gaps=GapIndex().export(),
+        signature=(0, 0, 0),
+        version=0,
+    )
+
+
+EMPTY_SNAPSHOT = _empty_snapshot()
+MISSING_SIGNATURE = EMPTY_SNAPSHOT.signature
+
+
+class DrawColumns:
+    """
+    עמודות numpy שגדלות בהכפלה (append ב־O(1) בממוצע).
+    כותבים רק מעבר לסוף, ולכן views שכבר נמסרו ל־snapshot לא משתנים;
+    כשמגדילים – מעתיקים למערכים חדשים וה־snapshot הישן נשאר עם הישנים.
+    הטיפוסים זהים לרשומה בארכיון הבינארי – 7 בתים להגרלה בזיכרון.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self.count = 0
+        self._numbers = np.empty(capacity, dtype=np.uint32)
+        self._days = np.empty(capacity, dtype=np.uint16)
+        self._cards = np.empty((capacity, NUM_COLUMNS), dtype=np.uint8)
+
+    def _grow(self, needed: int):
+        capacity = len(self._numbers)
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_numbers", "_days", "_cards"):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def append(self, numbers: np.ndarray, days: np.ndarray, cards: np.ndarray):
+        end = self.count + len(numbers)
+        if end > len(self._numbers):
+            self._grow(end)
+        self._numbers[self.count:end] = numbers
+        self._days[self.count:end] = days
+        self._cards[self.count:end] = cards
+        self.count = end
+
+    def views(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = self.count
+        return self._numbers[:n], self._days[:n], self._cards[:n]
+
+
+# === ארכיון בינארי של ההגרלות ===
+#
+# Chance.bin = כותרת באורך קבוע + רשומה של 8 בתים לכל הגרלה (little-endian):
+#   uint32 מספר הגרלה | uint16 ימים מ־1970 | uint16 ארבע דרגות של 3 ביטים (עמודה 1 בביטים הנמוכים)
+# הכותרת שומרת גם עד איפה ה־CSV כבר יובא (inode / גודל / mtime / offset וטביעות אצבע),
+# כדי שבעלייה הבאה יקראו מה־CSV רק שורות שנוספו אחרי ההמרה.
+
+ARCHIVE_MAGIC = b"CHNCBIN1"
+
+ARCHIVE_HEADER = np.dtype([
+    ("magic", "S8"),
+    ("count", "<u8"),
+    ("inode", "<u8"),
+    ("size", "<u8"),
+    ("mtime_ns", "<i8"),
+    ("offset", "<u8"),
+    ("head_len", "<u2"),
+    ("tail_len", "<u2"),
+    ("head", "u1", (FINGERPRINT_BYTES,)),
+    ("tail", "u1", (FINGERPRINT_BYTES,)),
+    ("reserved", "u1", (76,)),
+])
+
+ARCHIVE_RECORD = np.dtype([
+    ("number", "<u4"),
+    ("days", "<u2"),
+    ("cards", "<u2"),
+])
+
+_RANK_SHIFTS = np.arange(NUM_COLUMNS, dtype=np.uint16) * 3
+
+
+def pack_cards(cards: np.ndarray) -> np.ndarray:
+    """(n, 4) דרגות 0–7 -> uint16 אחד להגרלה."""
+    return (cards.astype(np.uint16) << _RANK_SHIFTS).sum(axis=1, dtype=np.uint16)
+
+
+def unpack_cards(packed: np.ndarray) -> np.ndarray:
+    return ((packed[:, None] >> _RANK_SHIFTS) & 0b111).astype(np.uint8)
+
+
+class SourceState(NamedTuple):
+    """עד איפה קובץ ה־CSV כבר נקרא, ואיך מזהים שהוא רק הוארך מאז."""
+    inode: int = 0
+    size: int = 0
+    mtime_ns: int = 0
+    offset: int = 0
+    head: bytes = b""
+    tail: bytes = b""
+
+
+class DrawArchive:
+    """
+    קריאה / כתיבה של Chance.bin.
+    הקריאה היא np.memmap – בלי פענוח שורה־שורה, ולכן עלייה כמעט מיידית גם על מיליון הגרלות.
+    הוספה כותבת רק את הרשומות החדשות ואז את הכותרת (count מתעדכן אחרון –
+    רשומות שנכתבו בלי כותרת מעודכנת פשוט יידרסו בהוספה הבאה).
+    בנייה מלאה נכתבת לקובץ זמני ומוחלפת ב־os.replace.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def load(self) -> Optional[Tuple[SourceState, np.ndarray, np.ndarray, np.ndarray]]:
+        try:
+            if self.path.stat().st_size < ARCHIVE_HEADER.itemsize:
+                return None
+            header = np.fromfile(self.path, dtype=ARCHIVE_HEADER, count=1)[0]
+        except OSError:
+            return None
+        if header["magic"] != ARCHIVE_MAGIC:
+            return None
+
+        count = int(header["count"])
+        source = SourceState(
+            inode=int(header["inode"]),
+            size=int(header["size"]),
+            mtime_ns=int(header["mtime_ns"]),
+            offset=int(header["offset"]),
+            head=header["head"][:header["head_len"]].tobytes(),
+            tail=header["tail"][:header["tail_len"]].tobytes(),
+        )
+        if not count:
+            empty = np.empty(0, dtype=ARCHIVE_RECORD)
+            return source, empty["number"], empty["days"], unpack_cards(empty["cards"])
+
+        records = np.memmap(
+            self.path, dtype=ARCHIVE_RECORD, mode="r", offset=ARCHIVE_HEADER.itemsize, shape=(count,)
+        )
+        return source, records["number"], records["days"], unpack_cards(records["cards"])
+
+    def rewrite(self, numbers: np.ndarray, days: np.ndarray, cards: np.ndarray, source: SourceState):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with tmp.open("wb") as f:
+            self._header(len(numbers), source).tofile(f)
+            self._records(numbers, days, cards).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def append(self, count: int, numbers: np.ndarray, days: np.ndarray, cards: np.ndarray,
+               source: SourceState):
+        """count – כמה רשומות כבר יש בארכיון (לפני ההוספה)."""
+        with self.path.open("r+b") as f:
+            f.seek(ARCHIVE_HEADER.itemsize + count * ARCHIVE_RECORD.itemsize)
+            self._records(numbers, days, cards).tofile(f)
+            f.truncate()
+            f.flush()
+            os.fsync(f.fileno())
+            f.seek(0)
+            self._header(count + len(numbers), source).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    @staticmethod
+    def _header(count: int, source: SourceState) -> np.ndarray:
+        header = np.zeros(1, dtype=ARCHIVE_HEADER)
+        header["magic"] = ARCHIVE_MAGIC
+        header["count"] = count
+        header["inode"] = source.inode
+        header["size"] = source.size
+        header["mtime_ns"] = source.mtime_ns
+        header["offset"] = source.offset
+        header["head_len"] = len(source.head)
+        header["tail_len"] = len(source.tail)
+        header["head"][0, :len(source.head)] = np.frombuffer(source.head, dtype=np.uint8)
+        header["tail"][0, :len(source.tail)] = np.frombuffer(source.tail, dtype=np.uint8)
+        return header
+
+    @staticmethod
+    def _records(numbers: np.ndarray, days: np.ndarray, cards: np.ndarray) -> np.ndarray:
+        records = np.empty(len(numbers), dtype=ARCHIVE_RECORD)
+        records["number"] = numbers
+        records["days"] = days
+        records["cards"] = pack_cards(cards)
+        return records
+
+
+class DrawStore:
+    """
+    מאגר הגרלות משותף לכל התהליך.
+    בעלייה נטען הארכיון הבינארי (אם קיים); קובץ ה־CSV הוא מקור הייבוא
+    ונבדק מחדש רק כשה־inode / הגודל / ה־mtime שלו משתנים:
+
+    • קובץ שרק הוארך – נקראות רק השורות החדשות מה־offset האחרון (tail)
+      ונוספות גם לסוף הארכיון
+    • קובץ שקוצר / הוחלף / נכתב מחדש – בנייה מלאה מאפס, והארכיון נכתב מחדש
+
+    כל רענון מפרסם snapshot חדש בהשמה אחת – handler אף פעם לא רואה רשימה חצי טעונה.
+    הארכיון הוא מטמון בלבד: כתיבה שנכשלה (דיסק מלא, תיקייה בלי הרשאה) נרשמת ב־archive_error
+    ולא מפילה את הקריאה, והכתיבה הבאה בונה אותו מחדש במלואו.
+    """
+
+    def __init__(self, path: Path, archive_path: Optional[Path] = None):
+        self.path = path
+        self.archive = DrawArchive(archive_path) if archive_path else None
+        self.archive_error: Optional[OSError] = None
+        self._snapshot = EMPTY_SNAPSHOT
+        self._lock = threading.Lock()
+        self._archive_loaded = False
+        self._reset()
+
+    def _reset(self):
+        self._columns = DrawColumns()
+        self._column_counts = np.zeros((NUM_COLUMNS, NUM_RANKS), dtype=np.int64)
+        self._pair_counts = np.zeros((NUM_COLUMNS, NUM_COLUMNS, NUM_RANKS, NUM_RANKS), dtype=np.int64)
+        self._windows = WindowSet()
+        self._gaps = GapIndex()
+        self._source = SourceState()
+
+    def _file_signature(self) -> Tuple[int, int, int]:
+        """(inode, size, mtime_ns) של ה־CSV; (0, 0, 0) אם הוא לא קיים."""
+        try:
+            st = self.path.stat()
+        except OSError:
+            return MISSING_SIGNATURE
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def snapshot(self) -> DrawSnapshot:
+        signature = self._file_signature()
+        current = self._snapshot
+        if current.version and current.signature == signature:
+            return current
+
+        # רק רענון אחד בכל פעם; מי שחיכה למנעול יקבל את ה־snapshot שכבר נטען
+        with self._lock:
+            current = self._snapshot
+            if current.version and current.signature == signature:
+                return current
+            if not self._archive_loaded:
+                self._archive_loaded = True
+                self._load_archive()
+            # בלי CSV ממשיכים להגיש את מה שכבר נטען (מהארכיון או מייבוא קודם)
+            if signature != MISSING_SIGNATURE:
+                # החתימה נלקחה לפני הקריאה – אם הקובץ ישתנה תוך כדי, הבדיקה הבאה תרענן שוב
+                self._refresh(signature)
+            numbers, days, cards = self._columns.views()
+            self._snapshot = DrawSnapshot(
+                numbers=numbers,
+                days=days,
+                cards=cards,
+                column_counts=self._column_counts.copy(),
+                pair_counts=self._pair_counts.copy(),
+                windows=self._windows.export(),
+                gaps=self._gaps.export(),
+                signature=signature,
+                version=current.version + 1,
+            )
+            return self._snapshot
+
+    def _load_archive(self):
+        loaded = self.archive.load() if self.archive else None
+        if loaded is None:
+            return
+        source, numbers, days, cards = loaded
+        self._append(numbers, days, cards)
+        self._source = source
+
+    def _refresh(self, signature: Tuple[int, int, int]):
+        inode, size, mtime_ns = signature
+        if (inode, size, mtime_ns) == self._source[:3]:
+            return
+
+        start = time.perf_counter()
+        with self.path.open("rb") as f:
+            if self._is_append(f, inode, size):
+                f.seek(self._source.offset)
+                count = self._columns.count
+                new_rows = self._read_complete_lines(f, self._source)
+                if self._fold(new_rows):
+                    self._source = self._source._replace(inode=inode, size=size, mtime_ns=mtime_ns)
+                    self._record_parse("tail", start, len(new_rows))
+                    self._save_archive(count)
+                    return
+
+            # קובץ חדש / נכתב מחדש / שורות ישנות שנוספו באמצע – בנייה מלאה
+            self._reset()
+            f.seek(0)
+            head = f.read(FINGERPRINT_BYTES)
+            f.seek(0)
+            rows = self._read_complete_lines(f, SourceState(head=head))
+            rows.sort(key=lambda r: r.number)
+            self._fold(rows)
+            self._source = self._source._replace(inode=inode, size=size, mtime_ns=mtime_ns)
+            self._record_parse("full", start, len(rows))
+            self._save_archive(None)
+
+    @staticmethod
+    def _record_parse(mode: str, start: float, rows: int):
+        metrics.observe("csv_parse_seconds", time.perf_counter() - start, (("mode", mode),))
+        metrics.inc("csv_rows_parsed_total", (), rows)
+
+    def _is_append(self, f, inode: int, size: int) -> bool:
+        """
+        הקובץ רק הוארך אם: אותו inode, לא קטן מה־offset שכבר עובד,
+        וגם תחילת הקובץ והבתים שלפני ה־offset לא השתנו.
+        """
+        source = self._source
+        if not source.offset or source.inode != inode or size < source.offset:
+            return False
+        f.seek(0)
+        if f.read(len(source.head)) != source.head:
+            return False
+        f.seek(source.offset - len(source.tail))
+        return f.read(len(source.tail)) == source.tail
+
+    def _read_complete_lines(self, f, source: SourceState) -> List[DrawRow]:
+        """
+        קורא מה־offset הנוכחי עד סוף השורה השלמה האחרונה.
+        שורה חלקית (באמצע כתיבה) תיקרא ברענון הבא.
+        """
+        start = f.tell()
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        data = data[:end]
+        self._source = source._replace(
+            offset=start + end,
+            tail=(source.tail + data[-FINGERPRINT_BYTES:])[-FINGERPRINT_BYTES:],
+        )
+        return _parse_draw_lines(data) if data else []
+
+    def _fold(self, new_rows: List[DrawRow]) -> bool:
+        """
+        מוסיף הגרלות חדשות (ממוינות לפי מספר) למאגר ולמונים.
+        מספרי הגרלה שכבר קיימים נזרקים. הגרלה ישנה יותר מהאחרונה שעדיין לא ראינו
+        (כלומר נכנסה באמצע ההיסטוריה) מחזירה False – צריך בנייה מלאה.
+        """
+        numbers, _, _ = self._columns.views()
+        last_number = int(numbers[-1]) if len(numbers) else 0
+        fresh = []
+        fresh_numbers = set()
+        for row in new_rows:
+            if row.number <= last_number:
+                if row.number in fresh_numbers:
+                    continue
+                pos = int(np.searchsorted(numbers, row.number))
+                if pos < len(numbers) and numbers[pos] == row.number:
+                    continue
+                return False
+            fresh.append(row)
+            fresh_numbers.add(row.number)
+            last_number = row.number
+
+        if fresh:
+            self._append(
+                np.array([row.number for row in fresh], dtype=np.uint32),
+                np.array([row.date.toordinal() - EPOCH_ORDINAL for row in fresh], dtype=np.uint16),
+                encode_draws([row.cards for row in fresh]),
+            )
+        return True
+
+    def _append(self, numbers: np.ndarray, days: np.ndarray, cards: np.ndarray):
+        self._columns.append(numbers, days, cards)
+        self._column_counts += count_columns(cards)
+        self._pair_counts += count_pairs(cards)
+        self._windows.extend(cards)
+        self._gaps.extend(cards)
+
+    def _save_archive(self, previous_count: Optional[int]):
+        """previous_count=None – לכתוב את כל הארכיון מחדש; אחרת להוסיף רק מה שנוסף מאז."""
+        if not self.archive:
+            return
+        numbers, days, cards = self._columns.views()
+        try:
+            # אחרי כתיבה שנכשלה לא ידוע מה יש בקובץ – רק בנייה מלאה
+            if previous_count is None or self.archive_error is not None or not self.archive.path.exists():
+                self.archive.rewrite(numbers, days, cards, self._source)
+            else:
+                start = previous_count
+                self.archive.append(start, numbers[start:], days[start:], cards[start:], self._source)
+        except OSError as exc:
+            print("draw archive write failed:", repr(exc))
+            self.archive_error = exc
+        else:
+            self.archive_error = None
+
+
+def build_archive(csv_path: Path = DATA_FILE, archive_path: Path = ARCHIVE_FILE) -> int:
+    """
+    ממיר את קובץ ה־CSV לארכיון הבינארי (בנייה מלאה). מחזיר כמה הגרלות נכתבו.
+    """
+    if archive_path.exists():
+        archive_path.unlink()
+    store = DrawStore(csv_path, archive_path)
+    count = store.snapshot().count
+    if store.archive_error is not None:
+        raise store.archive_error
+    return count
+
+
+draw_store = DrawStore(DATA_FILE, ARCHIVE_FILE)
+metrics.gauge("draws_loaded", lambda: draw_store._snapshot.count)
+
+
+def load_draws(limit: int = 200) -> List[Draw]:
+    """
+    מחזיר את ההגרלות האחרונות מתוך ה־draw_store (בלי לקרוא את הקובץ מחדש בכל לחיצה),
+    מהחדשה לישנה – כמו בקובץ.
+    """
+    return draw_store.snapshot().latest(limit)
+
+
+def get_last_10_draws() -> List[Draw]:
     draws = load_draws(limit=10)
     return draws
 
 
-def calc_card_stats(draws: List[Tuple[str, str, str, str]]):
+def calc_card_stats(draws) -> CardStats:
     """
-    פונקציה שתחשב סטטיסטיקות לכל קלף.
-    כרגע – ספירה פשוטה.
+    סטטיסטיקה לכל קלף לפי עמודה (צורה).
+    מקבל רשימת הגרלות או מטריצה (n, 4) מוכנה – הספירה נעשית ב־bincount אחד.
     """
-    stats = {}
-    for draw in draws:
-        for card in draw:
-            stats.setdefault(card, 0)
-            stats[card] += 1
-    return stats
+    cards = draws if isinstance(draws, np.ndarray) else encode_draws(draws)
+    return CardStats(per_column=count_columns(cards), n_draws=len(cards), pairs=count_pairs(cards))
 
 
-def suggest_4_sets(stats, num_sets: int = 3) -> List[List[str]]:
+def suggest_4_sets(
+    stats: CardStats,
+    num_sets: int = 3,
+    recent: Optional[CardStats] = None,
+    min_distance: int = MIN_SET_DISTANCE,
+) -> List[List[str]]:
     """
-    מחזיר 3 צירופים דומים מאוד של 4 קלפים,
-    על בסיס הקלפים הכי חזקים בסטטיסטיקה.
+    מחזיר num_sets צירופים של 4 קלפים (קלף לכל עמודה) –
+    הצירופים עם הציון הגבוה ביותר מתוך כל 4096 האפשרויות,
+    כשכל שני צירופים שונים זה מזה לפחות ב־min_distance עמודות.
     """
-    sorted_cards = [card for card, count in sorted(stats.items(), key=lambda x: x[1], reverse=True)]
+    scores = score_combinations(stats, recent)
+    return [list(decode_draw(combo)) for combo in top_combinations(scores, num_sets, min_distance)]
+
 
-    if len(sorted_cards) < 4:
-        return [sorted_cards[:4]]
+def score_combinations(
+    stats: CardStats,
+    recent: Optional[CardStats] = None,
+    recency_weight: float = RECENCY_WEIGHT,
+    pair_weight: float = PAIR_WEIGHT,
+) -> np.ndarray:
+    """
+    ציון לכל אחד מ־8⁴ = 4096 הצירופים (col1..col4), כטנזור (8, 8, 8, 8).
 
-    base = sorted_cards[:4]  # הסט הבסיסי – 4 הקלפים הכי חזקים
-    sets: List[List[str]] = []
+    ציון = Σ log p(עמודה, דרגה) + pair_weight · Σ log lift(זוג עמודות)
+    • p – שכיחות לכל עמודה (עם החלקת לפלס), מעורבבת עם השכיחות בחלון הקצר
+      recent לפי recency_weight – כך הגרלות אחרונות שוקלות יותר
+    • lift – כמה פעמים זוג הדרגות יצא יחד באותה הגרלה, ביחס למה שהיה
+      צפוי אילו העמודות היו בלתי תלויות (נדרש stats.pairs)
+
+    הכל בשידור (broadcasting) של numpy – בלי לולאה על הצירופים.
+    """
+    p = stats.probabilities()
+    if recent is not None and recent.n_draws:
+        p = (1 - recency_weight) * p + recency_weight * recent.probabilities()
+    log_p = np.log(p)
 
-    # סט 1 – הבסיס
-    sets.append(base)
+    scores = np.zeros((NUM_RANKS,) * NUM_COLUMNS)
+    for col in range(NUM_COLUMNS):
+        shape = [1] * NUM_COLUMNS
+        shape[col] = NUM_RANKS
+        scores += log_p[col].reshape(shape)
 
-    # סט 2 – מחליף קלף אחד בקלף הבא בתור
-    if len(sorted_cards) >= 5:
-        alt1 = base.copy()
-        alt1[-1] = sorted_cards[4]
-        sets.append(alt1)
+    if stats.pairs is not None and pair_weight:
+        log_lift = np.log(stats.lift())
+        for i, j in COLUMN_PAIRS:
+            shape = [1] * NUM_COLUMNS
+            shape[i] = shape[j] = NUM_RANKS
+            scores += pair_weight * log_lift[i, j].reshape(shape)
 
-    # סט 3 – מחליף קלף אחר בקלף הבא אחריו
-    if len(sorted_cards) >= 6:
-        alt2 = base.copy()
-        alt2[-2] = sorted_cards[5]
-        sets.append(alt2)
+    return scores
 
-    while len(sets) < num_sets:
-        sets.append(base)
 
-    return sets[:num_sets]
+def top_combinations(scores: np.ndarray, k: int = 3, min_distance: int = MIN_SET_DISTANCE) -> List[np.ndarray]:
+    """
+    k הצירופים הטובים ביותר, בבחירה חמדנית: אחרי כל בחירה נפסלים כל הצירופים
+    שמרחק ה־Hamming שלהם ממנה קטן מ־min_distance (מסכה וקטורית על 4096 שורות).
+    """
+    order = np.argsort(-scores.ravel(), kind="stable")
+    alive = np.ones(len(ALL_COMBOS), dtype=bool)
+    chosen = []
+    while len(chosen) < k:
+        candidates = order[alive[order]]
+        if not len(candidates):
+            break
+        combo = ALL_COMBOS[candidates[0]]
+        chosen.append(combo)
+        alive &= (ALL_COMBOS != combo).sum(axis=1) >= min_distance
+    return chosen
+
+
+def get_hot_cards(stats: CardStats, top_n: int = 6) -> List[HotCard]:
+    """הצירופים (דרגה, עמודה) עם הכי הרבה הופעות בחלון."""
+    flat = stats.per_column.ravel()
+    order = np.argsort(-flat, kind="stable")[:top_n].tolist()
+    return [
+        HotCard(RANKS[i % NUM_RANKS], i // NUM_RANKS, int(flat[i]))
+        for i in order
+    ]
+
+
+# === תחזיות מחושבות מראש ===
+
+def render_hot_cards(hot: List[HotCard]) -> str:
+    # כל קלף מוצג עם הצורה של העמודה שבה הוא באמת הופיע
+    cards_str = " | ".join(str(card) for card in hot)
+    text = (
+        "🔥 *3 קלפים חמים לפי הנתונים הקיימים:*\n\n"
+        f"{cards_str}\n\n"
+        "החום של הקלפים מבוסס על תדירות ההופעה שלהם בתקופה האחרונה.\n\n"
+        "⚠️ אין כאן הבטחה לזכייה. זה כלי עזר סטטיסטי בלבד."
+    )
+    return text + FOOTER
+
 
+def render_predictions(sets: List[List[str]]) -> str:
+    lines = []
+    for i, s in enumerate(sets, start=1):
+        # s הוא רשימה של 4 קלפים – נוסיף לכל עמודה את הסמל שלה
+        cards_with_suits = [
+            f"{card}{SUITS[idx]}" for idx, card in enumerate(s)
+        ]
+        cards_str = " | ".join(cards_with_suits)
+        lines.append(f"{i}. {cards_str}")
 
-def get_hot_cards(stats, top_n: int = 6) -> List[str]:
-    sorted_cards = sorted(stats.items(), key=lambda x: x[1], reverse=True)
-    return [card for card, count in sorted_cards[:top_n]]
+    text = (
+        "📊 *3 צירופים חמים להגרלה הקרובה (מתעדכן כל שעתיים אוטומטית):* 🔥\n\n"
+        + "\n".join(lines)
+        + "\n\n"
+        "הצירופים נבנים על בסיס קלפים בעלי הופעה גבוהה יותר,"
+        " עם שינויים קלים בין צירוף לצירוף כדי לשמור על גיוון.\n\n"
+        "⚠️ הבוט מציג תחזיות סטטיסטיות בלבד ואינו מבטיח זכייה. "
+        "השימוש הוא על אחריות המשתמש."
+    )
+    return text + FOOTER
+
+
+@dataclass(frozen=True)
+class PredictionSnapshot:
+    """
+    תוצאה מוכנה להגשה: קלפים חמים, צירופים והטקסטים המרונדרים (כולל FOOTER).
+    draws_version – גרסת ה־DrawSnapshot שממנה חושבה. אם אין נתונים – הטקסטים None.
+    """
+    version: int
+    draws_version: int
+    computed_at: float
+    hot_cards: Tuple[HotCard, ...]
+    sets: Tuple[Tuple[str, ...], ...]
+    hot_text: Optional[str]
+    predict_text: Optional[str]
+
+
+def compute_predictions(snapshot: DrawSnapshot, version: int) -> PredictionSnapshot:
+    if not snapshot.count:
+        return PredictionSnapshot(version, snapshot.version, time.time(), (), (), None, None)
+
+    stats = snapshot.stats(window=STATS_WINDOW)
+    hot = get_hot_cards(stats, top_n=3)
+    sets = suggest_4_sets(stats, num_sets=3, recent=snapshot.stats(window=RECENT_WINDOW))
+    return PredictionSnapshot(
+        version=version,
+        draws_version=snapshot.version,
+        computed_at=time.time(),
+        hot_cards=tuple(hot),
+        sets=tuple(tuple(s) for s in sets),
+        hot_text=render_hot_cards(hot),
+        predict_text=render_predictions(sets),
+    )
+
+
+def encode_predictions(prediction: PredictionSnapshot) -> str:
+    return json.dumps({
+        "hot_cards": prediction.hot_cards,
+        "sets": prediction.sets,
+        "hot_text": prediction.hot_text,
+        "predict_text": prediction.predict_text,
+    }, ensure_ascii=False)
+
+
+def decode_predictions(payload: str, version: int, draws_version: int, computed_at: float) -> PredictionSnapshot:
+    data = json.loads(payload)
+    return PredictionSnapshot(
+        version=version,
+        draws_version=draws_version,
+        computed_at=computed_at,
+        hot_cards=tuple(HotCard(*card) for card in data["hot_cards"]),
+        sets=tuple(tuple(s) for s in data["sets"]),
+        hot_text=data["hot_text"],
+        predict_text=data["predict_text"],
+    )
+
+
+class PredictionService:
+    """
+    מחשב את התחזיות ברקע ומפרסם PredictionSnapshot בלתי משתנה בהשמה אחת.
+    handlers רק קוראים את current – בלי גישה לקובץ ובלי חישוב בזמן הבקשה.
+
+    החישוב הראשון נעשה ב־on_startup (update() ב־io_executor), לפני שמתחילים לקבל עדכונים;
+    עד שהוא מסתיים current הוא None. run() בודק כל PREDICTION_POLL_SECONDS אם נכנסו
+    הגרלות חדשות (stat זול על הקובץ), ומחשב מחדש מיד כשכן – או בכל מקרה פעם ב־PREDICTION_INTERVAL.
+    """
+
+    def __init__(self, store: DrawStore, state: SharedState):
+        self.store = store
+        self.state = state
+        self._current: Optional[PredictionSnapshot] = None
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> Optional[PredictionSnapshot]:
+        return self._current
+
+    def refresh(self, force: bool = False) -> PredictionSnapshot:
+        """
+        אם תהליך אחר כבר חישב תחזיות מאותם נתונים (source זהה) – לוקחים אותן מ־STATE_DB
+        במקום לחשב; אחרת מחשבים ומפרסמים שם לשאר התהליכים.
+        """
+        with self._lock:
+            snapshot = self.store.snapshot()
+            current = self._current
+            version = current.version + 1 if current else 1
+            source = f"{snapshot.count}:{snapshot.last_number}"
+
+            shared = self.state.load_snapshot("predictions")
+            if shared is not None and shared[0] == source:
+                computed_at = shared[1]
+                fresh = not force or time.time() - computed_at < PREDICTION_INTERVAL
+                if fresh and (current is None or computed_at > current.computed_at):
+                    self._current = decode_predictions(shared[2], version, snapshot.version, computed_at)
+                    return self._current
+
+            if current is not None and not force and current.draws_version == snapshot.version:
+                return current
+            self._current = compute_predictions(snapshot, version)
+            self.state.store_snapshot("predictions", source, self._current.computed_at,
+                                      encode_predictions(self._current))
+            return self._current
+
+    async def update(self, force: bool = False):
+        try:
+            await run_io(self.refresh, force)
+        except Exception as exc:
+            print("prediction refresh failed:", repr(exc))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        last_full = loop.time()
+        while True:
+            await asyncio.sleep(PREDICTION_POLL_SECONDS)
+            force = loop.time() - last_full >= PREDICTION_INTERVAL
+            await self.update(force)
+            if force:
+                last_full = loop.time()
+
+
+predictions = PredictionService(draw_store, shared_state)
+
+# תשובה לבקשה שהגיעה לפני שהחישוב הראשון הסתיים (לא מחשבים בזמן הבקשה)
+PREDICTIONS_PENDING = "⏳ התחזיות מחושבות ממש עכשיו. נסו שוב בעוד כמה שניות."
 
 
 # === חלק 2: תפריט וכפתורים ===
 
+# הטקסטים של כפתורי התפריט – אותם טקסטים משמשים גם לבניית המקלדת וגם לטבלת הניתוב
+BTN_LAST_10 = "🎰 10 ההגרלות האחרונות"
+BTN_HOT_CARDS = "📊 3 קלפים חמים להגרלה הבאה"
+BTN_COLD_CARDS = "❄️ קלפים קרים"
+BTN_AUTO_CARD = "🃏 קלף אוטומטי"
+BTN_HISTORY = "🕒 היסטוריית תחזיות"
+BTN_ADVANTAGE = "🎯 מה היתרון של הבוט?"
+BTN_WHAT_YOU_GET = "💰 מה מקבלים במנוי?"
+BTN_WHY_SUB = "🔥 למה כדאי להיות מנוי?"
+BTN_INFO = "ℹ️ איך זה עובד"
+BTN_BUY = "💳 רכישת מנוי"
+
+# שתי המקלדות נבנות פעם אחת בעלייה – אותו אובייקט נשלח בכל תשובה
+SUBSCRIBER_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [BTN_LAST_10],
+        [BTN_HOT_CARDS],
+        [BTN_COLD_CARDS],
+        [BTN_AUTO_CARD],
+        [BTN_HISTORY],
+        [BTN_ADVANTAGE],
+        [BTN_WHAT_YOU_GET, BTN_WHY_SUB],
+        [BTN_INFO],
+    ],
+    resize_keyboard=True,
+)
+FREE_KEYBOARD = ReplyKeyboardMarkup(
+    [
+        [BTN_LAST_10],
+        [BTN_BUY],
+        [BTN_ADVANTAGE],
+        [BTN_WHAT_YOU_GET, BTN_WHY_SUB],
+        [BTN_INFO],
+    ],
+    resize_keyboard=True,
+)
+
+
 def get_main_keyboard(is_subscriber_flag: bool) -> ReplyKeyboardMarkup:
     """
     חינמי:
@@ -199,34 +2665,156 @@ def get_main_keyboard(is_subscriber_flag: bool) -> ReplyKeyboardMarkup:
     מנוי:
       • 10 ההגרלות האחרונות
       • 3 קלפים חמים
+      • קלפים קרים
       • קלף אוטומטי
       • היסטוריית תחזיות (כרגע סקיצה)
       • טקסטים שיווקיים
       • איך זה עובד
     """
-    if is_subscriber_flag:
-        keyboard = [
-            ["🎰 10 ההגרלות האחרונות"],
-            ["📊 3 קלפים חמים להגרלה הבאה"],
-            ["🃏 קלף אוטומטי"],
-            ["🕒 היסטוריית תחזיות"],
-            ["🎯 מה היתרון של הבוט?"],
-            ["💰 מה מקבלים במנוי?", "🔥 למה כדאי להיות מנוי?"],
-            ["ℹ️ איך זה עובד"],
-        ]
-    else:
-        keyboard = [
-            ["🎰 10 ההגרלות האחרונות"],
-            ["💳 רכישת מנוי"],
-            ["🎯 מה היתרון של הבוט?"],
-            ["💰 מה מקבלים במנוי?", "🔥 למה כדאי להיות מנוי?"],
-            ["ℹ️ איך זה עובד"],
-        ]
-    return ReplyKeyboardMarkup(keyboard, resize_keyboard=True)
+    return SUBSCRIBER_KEYBOARD if is_subscriber_flag else FREE_KEYBOARD
+
+
+class StaticReply(NamedTuple):
+    """מסך קבוע: הטקסט (כולל FOOTER) והכפתורים מוכנים מראש – שליחה בלי לבנות כלום."""
+    text: str
+    parse_mode: Optional[str] = None
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+
+    async def send(self, update: Update):
+        await update.message.reply_text(self.text, parse_mode=self.parse_mode, reply_markup=self.reply_markup)
 
 
 # === חלק 3: Handlers של הבוט ===
 
+# === הגבלת קצב לכל משתמש ===
+#
+# לפני כל handler (קבוצה -1) רץ rate_limit_gate: כל עדכון ממופה לפעולה (פקודה, כפתור
+# בתפריט, דפדוף בהיסטוריה), ולכל זוג (משתמש, פעולה) יש דלי אסימונים משלו לפי
+# RATE_LIMITS. מי שחורג נעצר כאן – לפני קריאת נתונים או חישוב – ומקבל הודעה אחת בלבד
+# עד שהבקשה הבאה שלו עוברת. הזיכרון חסום: ActionLimiter שומר לכל היותר
+# RATE_LIMIT_MAX_KEYS דליים ומוציא את זה שלא נגעו בו הכי הרבה זמן (LRU).
+# ההחלטה מקומית ובלי I/O; מה שאושר נצבר ב־take_spent() ומתחשבן מול הדליים המשותפים
+# (SharedState.spend_tokens) ב־sync_shared_state, ומשם חוזרת היתרה שכוללת את שאר התהליכים.
+
+# פעולה -> (אסימונים לשנייה, גודל הדלי)
+RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "auto_card": (1 / 5, 1),   # קלף אוטומטי – פעם ב־5 שניות
+    "menu": (1.0, 5),          # שאר כפתורי התפריט
+    "page": (2.0, 6),          # דפדוף בהיסטוריה (כפתורי inline)
+    "command": (0.5, 4),       # כל פקודה בנפרד (/draws, /subinfo, ...)
+}
+RATE_LIMIT_MAX_KEYS = 50_000
+
+LIMIT_MESSAGES = {
+    "auto_card": "⏳ אפשר לבקש קלף אוטומטי פעם ב־5 שניות. נסה שוב עוד כמה רגעים.",
+}
+DEFAULT_LIMIT_MESSAGE = "⏳ יותר מדי בקשות ברצף. נסה שוב עוד כמה שניות."
+
+
+class ActionLimiter:
+    """
+    דלי אסימונים לכל (user_id, פעולה) ב־OrderedDict בגודל חסום.
+    דלי שנזרק מה־LRU פשוט מתחיל מלא בפעם הבאה – כמו משתמש שלא לחץ זמן רב.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, int]], max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.limits = limits
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Tuple[int, str], list]" = OrderedDict()
+        self._spent: Dict[Tuple[int, str, str], int] = {}   # (uid, פעולה, מפתח) -> כמה אושרו מאז הסבב הקודם
+
+    def hit(self, uid: int, action: str, limit_key: Optional[str] = None) -> Tuple[bool, bool]:
+        """
+        רושם בקשה. מחזיר (מותר, להודיע) – להודיע רק בדחייה הראשונה ברצף,
+        כדי שהצפה לא תהפוך להצפה של תשובות.
+        """
+        rate, burst = self.limits[limit_key or action]
+        now = time.monotonic()
+        key = (uid, action)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(burst), now, False]
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            spent_key = (uid, action, limit_key or action)
+            self._spent[spent_key] = self._spent.get(spent_key, 0) + 1
+            return True, False
+
+        notify = not bucket[2]
+        bucket[2] = True
+        return False, notify
+
+    def take_spent(self) -> List[Tuple[int, str, float, int, int]]:
+        """(uid, פעולה, rate, burst, כמה אושרו) מאז הקריאה הקודמת – בשביל SharedState.spend_tokens."""
+        spent, self._spent = self._spent, {}
+        return [(uid, action, *self.limits[key], count) for (uid, action, key), count in spent.items()]
+
+    def merge(self, balances: List[Tuple[int, str, float]]):
+        """מקטין דליים מקומיים ליתרה המשותפת (מה שתהליכים אחרים ניצלו נספר גם כאן)."""
+        now = time.monotonic()
+        for uid, action, tokens in balances:
+            bucket = self._buckets.get((uid, action))
+            if bucket is not None and tokens < bucket[0]:
+                bucket[0] = tokens
+                bucket[1] = now
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+limiter = ActionLimiter(RATE_LIMITS)
+
+
+def update_action(update: Update) -> Optional[Tuple[str, str]]:
+    """(פעולה, מפתח ב־RATE_LIMITS) לעדכון, או None אם אין מה להגביל."""
+    if update.callback_query is not None:
+        return "page", "page"
+    message = update.message
+    if message is None or not message.text:
+        return None
+    text = message.text.strip()
+    if text.startswith("/"):
+        # פקודה לא מוכרת נספרת בדלי אחד – אחרת כל שם חדש (/x0, /x1, ...) הוא דלי מלא חדש
+        command = text.split()[0].split("@")[0].lower()
+        return (command if command in KNOWN_COMMANDS else "command"), "command"
+    route = resolve_menu(text)
+    action = route.action if route is not None else "menu"
+    return action, action
+
+
+async def rate_limit_gate(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user = update.effective_user
+    action = update_action(update)
+    if user is None or action is None:
+        return
+
+    # אדמין לא מוגבל: /grant ו־/revoke לסדרה של משתמשים נשלחים ברצף
+    allowed, notify = (True, False) if user.id in ADMIN_IDS else limiter.hit(user.id, *action)
+    if allowed:
+        if action[1] == "command":
+            events.log("command", uid=user.id, command=action[0])
+        return
+
+    events.log("limited", uid=user.id, action=action[0])
+
+    if notify:
+        text = LIMIT_MESSAGES.get(action[0], DEFAULT_LIMIT_MESSAGE)
+        if update.callback_query is not None:
+            await update.callback_query.answer(text)
+        else:
+            await update.message.reply_text(text + FOOTER)
+    raise ApplicationHandlerStop
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     is_sub = is_subscriber(user.id)
@@ -249,18 +2837,16 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def handle_last_10(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    draws = get_last_10_draws()
+    draws = await run_io(get_last_10_draws)
     if not draws:
         await update.message.reply_text("אין עדיין נתונים של הגרלות." + FOOTER)
         return
 
-    suits = ["♠️", "♥️", "♦️", "♣️"]  # משמאל לימין: עלה, לב, יהלום, תלתן
-
     lines = []
     for i, draw in enumerate(draws, start=1):
         # draw זה טפל של 4 קלפים: (card1, card2, card3, card4)
         cards_with_suits = [
-            f"{card}{suits[idx]}" for idx, card in enumerate(draw)
+            f"{card}{SUITS[idx]}" for idx, card in enumerate(draw)
         ]
         line = f"{i}. {'  |  '.join(cards_with_suits)}"
         lines.append(line)
@@ -269,6 +2855,131 @@ async def handle_last_10(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
 
 
+# === היסטוריה לפי מספר הגרלה / טווח תאריכים ===
+
+def format_draw_line(record: DrawRecord) -> str:
+    cards = " | ".join(f"{card}{SUITS[idx]}" for idx, card in enumerate(record.cards))
+    return f"{record.number} · {record.date:%d/%m/%Y} · {cards}"
+
+
+def render_draw(snapshot: DrawSnapshot, pos: int) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """הגרלה בודדת + כפתורים להגרלה הקודמת / הבאה (לפי מספר)."""
+    record = snapshot.record(pos)
+    cards = "  |  ".join(f"{card}{SUITS[idx]}" for idx, card in enumerate(record.cards))
+    text = (
+        f"🎰 *הגרלה מס׳ {record.number}* – {record.date:%d/%m/%Y}\n\n"
+        f"{cards}"
+    )
+
+    buttons = []
+    if pos > 0:
+        buttons.append(InlineKeyboardButton("◀️ הגרלה קודמת", callback_data=f"draw:{snapshot.numbers[pos - 1]}"))
+    if pos + 1 < snapshot.count:
+        buttons.append(InlineKeyboardButton("הגרלה הבאה ▶️", callback_data=f"draw:{snapshot.numbers[pos + 1]}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+def render_draws_page(
+    snapshot: DrawSnapshot, start: date, end: date, page: int
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """
+    עמוד אחד מתוך ההגרלות בטווח התאריכים (מהחדשה לישנה).
+    הטווח נשלף מהאינדקס בשני חיפושים בינאריים, וממנו רק HISTORY_PAGE_SIZE שורות מפוענחות.
+    """
+    _, total = snapshot.date_range(start, end, limit=0)
+    if not total:
+        return "לא נמצאו הגרלות בטווח התאריכים הזה.", None
+
+    pages = (total + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = min(max(page, 0), pages - 1)
+    chunk, _ = snapshot.date_range(start, end, page * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE)
+
+    lines = [format_draw_line(snapshot.record(pos)) for pos in chunk.tolist()]
+    text = (
+        f"📅 *הגרלות {start:%d/%m/%Y}–{end:%d/%m/%Y}*\n"
+        f"עמוד {page + 1}/{pages} · {total} הגרלות\n\n"
+        + "\n".join(lines)
+    )
+
+    # callback_data מוגבל ל־64 בתים – שומרים את הטווח כמספרי ימים מ־1970
+    span = f"{start.toordinal() - EPOCH_ORDINAL}:{end.toordinal() - EPOCH_ORDINAL}"
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️ הקודם", callback_data=f"draws:{span}:{page - 1}"))
+    if page + 1 < pages:
+        buttons.append(InlineKeyboardButton("הבא ▶️", callback_data=f"draws:{span}:{page + 1}"))
+    return text, InlineKeyboardMarkup([buttons]) if buttons else None
+
+
+async def cmd_draw(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /draw <מספר> – תוצאת הגרלה לפי מספר הגרלה.
+    """
+    try:
+        number = int(context.args[0])
+    except (IndexError, ValueError):
+        await update.message.reply_text("שימוש: /draw <מספר הגרלה>" + FOOTER)
+        return
+
+    snapshot = await run_io(draw_store.snapshot)
+    pos = snapshot.find_draw(number)
+    if pos is None:
+        await update.message.reply_text(f"הגרלה מס׳ {number} לא נמצאה בנתונים." + FOOTER)
+        return
+
+    text, reply_markup = render_draw(snapshot, pos)
+    await update.message.reply_text(text + FOOTER, parse_mode="Markdown", reply_markup=reply_markup)
+
+
+async def cmd_draws(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /draws <מתאריך> <עד תאריך> – כל ההגרלות בטווח (dd/mm/yyyy), בעמודים.
+    """
+    try:
+        start, end = (parse_date(arg) for arg in context.args[:2])
+    except ValueError:
+        await update.message.reply_text(
+            "שימוש: /draws <מתאריך> <עד תאריך>\n"
+            "לדוגמה: /draws 01/11/2025 27/11/2025" + FOOTER
+        )
+        return
+
+    if start > end:
+        start, end = end, start
+
+    snapshot = await run_io(draw_store.snapshot)
+    text, reply_markup = render_draws_page(snapshot, start, end, page=0)
+    await update.message.reply_text(text + FOOTER, parse_mode="Markdown", reply_markup=reply_markup)
+
+
+async def handle_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    כפתורי הקודם / הבא של /draw ו־/draws – עורך את אותה הודעה במקום לשלוח חדשה.
+    """
+    query = update.callback_query
+    kind, *args = query.data.split(":")
+    snapshot = await run_io(draw_store.snapshot)
+
+    try:
+        if kind == "draw":
+            pos = snapshot.find_draw(int(args[0]))
+            if pos is None:
+                await query.answer("ההגרלה לא נמצאה בנתונים.")
+                return
+            text, reply_markup = render_draw(snapshot, pos)
+        else:
+            start_day, end_day, page = (int(arg) for arg in args)
+            start = date.fromordinal(EPOCH_ORDINAL + start_day)
+            end = date.fromordinal(EPOCH_ORDINAL + end_day)
+            text, reply_markup = render_draws_page(snapshot, start, end, page)
+    except ValueError:
+        await query.answer()
+        return
+
+    await query.answer()
+    await query.edit_message_text(text + FOOTER, parse_mode="Markdown", reply_markup=reply_markup)
+
+
 async def handle_predict_4(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     כרגע לא מחובר לכפתור בתפריט, אבל נשמר לפיצ'ר צירופים חמים.
@@ -285,36 +2996,16 @@ async def handle_predict_4(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text + FOOTER, reply_markup=get_main_keyboard(False))
         return
 
-    draws = load_draws()
-    if not draws:
+    # התחזית כבר מחושבת ומרונדרת ברקע – כאן רק שולפים ושולחים
+    prediction = predictions.current
+    if prediction is None:
+        await update.message.reply_text(PREDICTIONS_PENDING + FOOTER)
+        return
+    if prediction.predict_text is None:
         await update.message.reply_text("אין מספיק נתונים לחישוב תחזיות." + FOOTER)
         return
 
-    stats = calc_card_stats(draws)
-    sets = suggest_4_sets(stats, num_sets=3)
-
-    suits = ["♠️", "♥️", "♦️", "♣️"]  # משמאל לימין: עלה, לב, יהלום, תלתן
-
-    lines = []
-    for i, s in enumerate(sets, start=1):
-        # s הוא רשימה של 4 קלפים – נוסיף לכל עמודה את הסמל שלה
-        cards_with_suits = [
-            f"{card}{suits[idx]}" for idx, card in enumerate(s)
-        ]
-        cards_str = " | ".join(cards_with_suits)
-        lines.append(f"{i}. {cards_str}")
-
-    text = (
-        "📊 *3 צירופים חמים להגרלה הקרובה (מתעדכן כל שעתיים אוטומטית):* 🔥\n\n"
-        + "\n".join(lines)
-        + "\n\n"
-        "הצירופים נבנים על בסיס קלפים בעלי הופעה גבוהה יותר,"
-        " עם שינויים קלים בין צירוף לצירוף כדי לשמור על גיוון.\n\n"
-        "⚠️ הבוט מציג תחזיות סטטיסטיות בלבד ואינו מבטיח זכייה. "
-        "השימוש הוא על אחריות המשתמש."
-    )
-
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    await update.message.reply_text(prediction.predict_text, parse_mode="Markdown")
 
 
 async def handle_hot_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -330,26 +3021,50 @@ async def handle_hot_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text + FOOTER, reply_markup=get_main_keyboard(False))
         return
 
-    draws = load_draws()
-    if not draws:
+    prediction = predictions.current
+    if prediction is None:
+        await update.message.reply_text(PREDICTIONS_PENDING + FOOTER)
+        return
+    if prediction.hot_text is None:
         await update.message.reply_text("אין מספיק נתונים לחישוב קלפים חמים." + FOOTER)
         return
 
-    stats = calc_card_stats(draws)
-    hot = get_hot_cards(stats, top_n=3)
+    await update.message.reply_text(prediction.hot_text, parse_mode="Markdown")
+
+
+async def handle_cold_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    קלפים קרים – הקלפים שהכי הרבה הגרלות לא יצאו בעמודה שלהם.
+    התשובה מגיעה ישר מאינדקס הפערים של ה־snapshot, בלי לסרוק היסטוריה אחורה.
+    """
+    user = update.effective_user
+    is_sub = is_subscriber(user.id)
+
+    if not is_sub:
+        text = (
+            "🔒 הפיצ׳ר הזה זמין למנויים יומיים בלבד.\n\n"
+            "כדי לראות אילו קלפים \"שקטים\" הכי הרבה זמן – "
+            "אפשר לפתוח מנוי יומי דרך ״💳 רכישת מנוי״."
+        )
+        await update.message.reply_text(text + FOOTER, reply_markup=get_main_keyboard(False))
+        return
 
-    # אמוג׳ים לפי עמודות: עלה, לב, יהלום, תלתן
-    suits = ["♠️", "♥️", "♦️", "♣️"]
+    snapshot = await run_io(draw_store.snapshot)
+    if not snapshot.count:
+        await update.message.reply_text("אין מספיק נתונים לחישוב קלפים קרים." + FOOTER)
+        return
 
-    hot_with_suits = [
-        f"{card}{suits[idx]}" for idx, card in enumerate(hot)
+    lines = [
+        f"{card} – לא יצא {card.streak} הגרלות "
+        f"(ממוצע: {card.mean_gap:.1f}, שיא: {card.max_gap})"
+        for card in snapshot.gaps.coldest(top_n=3)
     ]
 
-    cards_str = " | ".join(hot_with_suits)
     text = (
-        "🔥 *3 קלפים חמים לפי הנתונים הקיימים:*\n\n"
-        f"{cards_str}\n\n"
-        "החום של הקלפים מבוסס על תדירות ההופעה שלהם בתקופה האחרונה.\n\n"
+        "❄️ *3 קלפים קרים – הכי הרבה זמן לא יצאו:*\n\n"
+        + "\n".join(lines)
+        + "\n\n"
+        "הנתונים מחושבים לכל עמודה בנפרד, לפי כל ההיסטוריה הקיימת.\n\n"
         "⚠️ אין כאן הבטחה לזכייה. זה כלי עזר סטטיסטי בלבד."
     )
     await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
@@ -357,7 +3072,8 @@ async def handle_hot_cards(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_auto_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
-    כפתור קלף אוטומטי – מחזיר קלף רנדומלי (דרגה + צורה), עם קירור של 5 שניות לכל משתמש.
+    כפתור קלף אוטומטי – מחזיר קלף רנדומלי (דרגה + צורה).
+    הקירור של 5 שניות לכל משתמש נאכף ב־rate_limit_gate.
     """
     user = update.effective_user
     uid = user.id
@@ -371,25 +3087,8 @@ async def handle_auto_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(text + FOOTER, reply_markup=get_main_keyboard(False))
         return
 
-    now = time.time()
-    last_ts = auto_card_cooldowns.get(uid, 0)
-
-    # קירור של 5 שניות בין לחיצה ללחיצה
-    if now - last_ts < 5:
-        await update.message.reply_text(
-            "⏳ אפשר לבקש קלף אוטומטי פעם ב־5 שניות. נסה שוב עוד כמה רגעים."
-            + FOOTER
-        )
-        return
-
-    auto_card_cooldowns[uid] = now
-
-    # דרגות הקלפים (7–A, כמו בצ'אנס)
-    ranks = ["7", "8", "9", "10", "J", "Q", "K", "A"]
-    suits = ["♠️", "♥️", "♦️", "♣️"]  # אותו סדר שקבענו
-
-    rank = random.choice(ranks)
-    suit = random.choice(suits)
+    rank = random.choice(RANKS)
+    suit = random.choice(SUITS)
 
     text = (
         "🃏 *קלף אוטומטי להגרלה הקרובה:*\n\n"
@@ -425,8 +3124,8 @@ async def handle_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text + FOOTER)
 
 
-async def handle_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (
+INFO_SCREEN = StaticReply(
+    (
         "ℹ️ *איך זה עובד?*\n\n"
         "Chance Predictor הוא בוט ניתוח סטטיסטי להגרלות צ׳אנס.\n\n"
         "המערכת:\n"
@@ -437,14 +3136,19 @@ async def handle_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "המטרה היא לתת למשתמש תמונה סטטיסטית חדה יותר – "
         "ולא להבטיח זכייה או תוצאה כלשהי.\n\n"
         "⚠️ הבוט אינו ייעוץ השקעה או הימורים. כל שימוש במידע הוא באחריות המשתמש בלבד."
-    )
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
+
+
+async def handle_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await INFO_SCREEN.send(update)
 
 
 # === טקסטים שיווקיים ===
 
-async def handle_why_sub(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (
+WHY_SUB_SCREEN = StaticReply(
+    (
         "🔥 *למה כדאי להיות מנוי?*\n\n"
         "כי Chance Predictor נותן לך יתרון סטטיסטי על פני משחק אקראי.\n\n"
         "כמנוי יומי אתה:\n"
@@ -452,12 +3156,17 @@ async def handle_why_sub(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "• מקבל צירופים שהמערכת חישבה עבורך על בסיס נתונים\n"
         "• משחק בצורה יותר מודעת וחכמה\n\n"
         "המנוי היומי נותן לך גישה מלאה ל־24 שעות – ואתה בוחר מתי לנצל אותו."
-    )
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
 
 
-async def handle_bot_advantage(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (
+async def handle_why_sub(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await WHY_SUB_SCREEN.send(update)
+
+
+BOT_ADVANTAGE_SCREEN = StaticReply(
+    (
         "🎯 *מה היתרון של הבוט?*\n\n"
         "היתרון האמיתי של Chance Predictor הוא בנתונים.\n\n"
         "המערכת:\n"
@@ -466,12 +3175,17 @@ async def handle_bot_advantage(update: Update, context: ContextTypes.DEFAULT_TYP
         "• מזהה דפוסים ומגמות שחוזרות על עצמן\n\n"
         "במקום לשחק \"בעיניים עצומות\", הבוט נותן תמונה סטטיסטית חדה "
         "של מה חם, מה קר ואיפה ייתכן שיש הזדמנות."
-    )
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
 
 
-async def handle_what_you_get(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (
+async def handle_bot_advantage(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await BOT_ADVANTAGE_SCREEN.send(update)
+
+
+WHAT_YOU_GET_SCREEN = StaticReply(
+    (
         "💰 *מה מקבלים במנוי היומי?*\n\n"
         "כשתפתח מנוי יומי ל־Chance Predictor תקבל:\n\n"
         "• 🔥 3 תחזיות חמות בכל לחיצה\n"
@@ -479,94 +3193,128 @@ async def handle_what_you_get(update: Update, context: ContextTypes.DEFAULT_TYPE
         "• 📊 סטטיסטיקות מורחבות לפי הנתונים המעודכנים\n"
         "• ⚙️ גישה לכל פיצ׳ר חדש שייכנס במהלך תקופת הבטא\n\n"
         "המטרה: לתת לך יתרון סטטיסטי – לא הבטחה לזכייה, אלא משחק חכם יותר."
-    )
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
+
+
+async def handle_what_you_get(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await WHAT_YOU_GET_SCREEN.send(update)
+
+
+# הודעה אוטומטית שתופיע אצלך בצ'אט
+_PAYMENT_TEXT = (
+    "Hi%20Eitay,%20I%20want%20to%20purchase%20a%20daily%20subscription%20"
+    "to%20the%20Chance%20Predictor%20bot."
+)
+
+SUBSCRIPTION_SCREEN = StaticReply(
+    "💳 *מנוי יומי – Chance Predictor*\n\n"
+    "המנוי מעניק גישה מלאה לכלי הניתוח והתחזיות למשך 24 שעות מלאות 🔥\n\n"
+    "📌 *עלות המנוי:* 50 ₪ בלבד\n\n"
+    "איך מצטרפים?\n\n"
+    "שלחו הודעה בכפתור למטה!\n\n"
+    "✔️ לאחר הפעלת המנוי תקבל גישה מלאה לכל הפיצ׳רים.\n\n"
+    "לכל פנייה לגבי המערכת ומנויים שלחו הודעה ליוזר @eitayeliyahu",
+    parse_mode="Markdown",
+    reply_markup=InlineKeyboardMarkup([
+        [InlineKeyboardButton("💬 שליחת הודעה לתשלום", url=f"https://t.me/eitayeliyahu?text={_PAYMENT_TEXT}")],
+    ]),
+)
 
 
 async def handle_subscription_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     מסך רכישת המנוי – נוסח כפי שביקשת + כפתור לפתיחת צ'אט איתך בטלגרם.
     """
-    user = update.effective_user
-
-    text = (
-        "💳 *מנוי יומי – Chance Predictor*\n\n"
-        "המנוי מעניק גישה מלאה לכלי הניתוח והתחזיות למשך 24 שעות מלאות 🔥\n\n"
-        "📌 *עלות המנוי:* 50 ₪ בלבד\n\n"
-        "איך מצטרפים?\n\n"
-        "שלחו הודעה בכפתור למטה!\n\n"
-        "✔️ לאחר הפעלת המנוי תקבל גישה מלאה לכל הפיצ׳רים.\n\n"
-        "לכל פנייה לגבי המערכת ומנויים שלחו הודעה ליוזר @eitayeliyahu"
-    )
-
-    # הודעה אוטומטית שתופיע אצלך בצ'אט
-    encoded_text = (
-        "Hi%20Eitay,%20I%20want%20to%20purchase%20a%20daily%20subscription%20"
-        "to%20the%20Chance%20Predictor%20bot."
-    )
+    await SUBSCRIPTION_SCREEN.send(update)
 
-    telegram_url = f"https://t.me/eitayeliyahu?text={encoded_text}"
 
-    keyboard = [
-        [InlineKeyboardButton("💬 שליחת הודעה לתשלום", url=telegram_url)],
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+# === ניהול כפתורים / תפריט ===
 
-    await update.message.reply_text(text, parse_mode="Markdown", reply_markup=reply_markup)
+class MenuRoute(NamedTuple):
+    handler: Callable
+    action: str   # המפתח ב־RATE_LIMITS
+
+
+# טקסט כפתור מדויק -> handler. זה המסלול של כל לחיצה רגילה: חיפוש אחד במילון.
+MENU_ROUTES: Dict[str, MenuRoute] = {
+    BTN_LAST_10: MenuRoute(instrumented(handle_last_10), "menu"),
+    BTN_HOT_CARDS: MenuRoute(instrumented(handle_hot_cards), "menu"),
+    BTN_COLD_CARDS: MenuRoute(instrumented(handle_cold_cards), "menu"),
+    BTN_AUTO_CARD: MenuRoute(instrumented(handle_auto_card), "auto_card"),
+    BTN_HISTORY: MenuRoute(instrumented(handle_history), "menu"),
+    BTN_INFO: MenuRoute(instrumented(handle_info), "menu"),
+    BTN_BUY: MenuRoute(instrumented(handle_subscription_info), "menu"),
+    BTN_WHY_SUB: MenuRoute(instrumented(handle_why_sub), "menu"),
+    BTN_ADVANTAGE: MenuRoute(instrumented(handle_bot_advantage), "menu"),
+    BTN_WHAT_YOU_GET: MenuRoute(instrumented(handle_what_you_get), "menu"),
+}
 
+MIN_MENU_PREFIX = 4   # קידומת קצרה מזה לא נחשבת התאמה
+EMOJI_PRESENTATION = "\ufe0f"   # התו שלפניו מוצג כאימוג׳י (ℹ️, ❄️)
 
-# === ניהול כפתורים / תפריט ===
 
-async def handle_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def normalize_label(text: str) -> str:
     """
-    מטפל בכל לחיצות הכפתורים של התפריט הראשי (ReplyKeyboard).
-    בוחר את הפונקציה המתאימה לפי הטקסט שנשלח.
+    רק אותיות ומספרים (קטגוריות L* / N* של Unicode), רווח אחד בין מילים – כך שתוויות ישנות
+    וטקסט מוקלד בלי האימוג׳י עדיין מזוהים. isalnum לא מספיק: 'ℹ' היא אות (Ll), ולכן גם
+    תו שאחריו U+FE0F נזרק.
     """
-    if not update.message:
-        return
-
-    text = (update.message.text or "").strip()
-    print("USER CLICKED:", repr(text))
+    chars = []
+    for i, ch in enumerate(text):
+        keep = unicodedata.category(ch)[0] in "LN" and text[i + 1:i + 2] != EMOJI_PRESENTATION
+        chars.append(ch if keep else " ")
+    return " ".join("".join(chars).split())
 
-    # משותף - גם למנוי וגם לחינמי
-    if "10 ההגרלות האחרונות" in text:
-        await handle_last_10(update, context)
 
-    # כפתור 2 – 3 קלפים חמים (סטטיסטיקה)
-    elif "3 קלפים חמים להגרלה הבאה" in text:
-        await handle_hot_cards(update, context)
-
-    # כפתור 3 – קלף אוטומטי
-    elif "קלף אוטומטי" in text:
-        await handle_auto_card(update, context)
+def _menu_prefixes(routes: Dict[str, MenuRoute]) -> Dict[str, MenuRoute]:
+    """
+    כל קידומת (מ־MIN_MENU_PREFIX תווים) של כל תווית מנורמלת -> route,
+    רק כשהקידומת מובילה לכפתור אחד בלבד. נבנה פעם אחת, כדי שגם הפולבאק יהיה O(1).
+    """
+    table: Dict[str, Optional[MenuRoute]] = {}
+    for label, route in routes.items():
+        key = normalize_label(label)
+        for end in range(MIN_MENU_PREFIX, len(key) + 1):
+            prefix = key[:end]
+            table[prefix] = route if table.get(prefix, route) == route else None
+    return {prefix: route for prefix, route in table.items() if route is not None}
 
-    elif "היסטוריית תחזיות" in text:
-        await handle_history(update, context)
 
-    elif "איך זה עובד" in text:
-        await handle_info(update, context)
+MENU_PREFIXES = _menu_prefixes(MENU_ROUTES)
 
-    elif "רכישת מנוי" in text:
-        await handle_subscription_info(update, context)
 
-    elif "למה כדאי להיות מנוי" in text:
-        await handle_why_sub(update, context)
+def resolve_menu(text: str) -> Optional[MenuRoute]:
+    """התאמה מדויקת, ואם אין – לפי התחלה של התווית המנורמלת (לקוחות עם מקלדת ישנה)."""
+    route = MENU_ROUTES.get(text)
+    if route is None:
+        route = MENU_PREFIXES.get(normalize_label(text))
+    return route
 
-    elif "מה היתרון של הבוט" in text:
-        await handle_bot_advantage(update, context)
 
-    elif "מה מקבלים במנוי" in text:
-        await handle_what_you_get(update, context)
+async def handle_menu_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    מטפל בכל לחיצות הכפתורים של התפריט הראשי (ReplyKeyboard).
+    בוחר את הפונקציה המתאימה לפי הטקסט שנשלח (resolve_menu).
+    לא עטוף ב־instrumented: כל route (וגם fallback) כבר נמדד בשם שלו, אחרת כל לחיצה נספרת פעמיים.
+    """
+    if not update.message:
+        return
 
-    else:
+    route = resolve_menu(update.message.text or "")
+    if route is None:
         # כל טקסט אחר – פולבאק
         await fallback(update, context)
+        return
+    events.log("click", uid=update.effective_user.id, button=route.handler.__name__)
+    await route.handler(update, context)
 
 
 # === תנאי שימוש ===
 
-async def handle_terms(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = (
+TERMS_SCREEN = StaticReply(
+    (
         "📜 *תנאי שימוש – Chance Predictor*\n\n"
         "1. מהות השירות\n"
         "הבוט Chance Predictor הוא כלי לניתוח סטטיסטי של תוצאות הגרלות צ׳אנס. "
@@ -586,22 +3334,35 @@ async def handle_terms(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "6. גיל מינימלי\n"
         "השימוש בבוט מיועד לבגירים מעל גיל 18.\n\n"
         "*שימוש בבוט מהווה הסכמה לתנאי השימוש הללו.*"
-    )
-    await update.message.reply_text(text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
 
 
-async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    help_text = (
+async def handle_terms(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await TERMS_SCREEN.send(update)
+
+
+HELP_SCREEN = StaticReply(
+    (
         "📌 *רשימת פקודות:*\n\n"
         "/start – הפעלת הבוט\n"
         "/help – רשימת הפקודות המלאה\n"
         "/myid – הצגת ה־User ID שלך בטלגרם\n"
         "/grant – הענקת גישה למשתמש (למנהלים בלבד)\n"
         "/revoke – ביטול גישה למשתמש (למנהלים בלבד)\n"
+        "/stats – מדדי ביצועים ושגיאות (למנהלים בלבד)\n"
         "/subinfo – בדיקת מצב המנוי שלך\n"
+        "/draw <מספר> – תוצאת הגרלה לפי מספר\n"
+        "/draws <מתאריך> <עד תאריך> – הגרלות בטווח תאריכים (dd/mm/yyyy)\n"
         "/terms – תנאי שימוש\n"
-    )
-    await update.message.reply_text(help_text + FOOTER, parse_mode="Markdown")
+    ) + FOOTER,
+    parse_mode="Markdown",
+)
+
+
+async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await HELP_SCREEN.send(update)
 
 
 async def cmd_myid(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -653,14 +3414,17 @@ async def cmd_grant(update: Update, context: ContextTypes.DEFAULT_TYPE):
     now = time.time()
     expires_at = now + 24 * 60 * 60  # 24 שעות קדימה
 
-    subscribers[str(target_id)] = expires_at
-    save_subscribers()
+    subscribers.grant(target_id, expires_at)
+    events.log("grant", uid=target_id, admin=user.id, expires=int(expires_at))
+    # האישור לאדמין נשלח רק אחרי שהמנוי נשמר בדיסק
+    await subscribers.flushed()
 
     try:
         await context.bot.send_message(
             target_id,
             "✅ המנוי היומי שלך לבוט Chance Predictor הופעל.\n"
-            "יש לך גישה מלאה ל־24 השעות הקרובות 🔮" + FOOTER
+            "יש לך גישה מלאה ל־24 השעות הקרובות 🔮" + FOOTER,
+            rate_limit_args=PRIORITY_ADMIN,
         )
     except Exception:
         pass
@@ -696,16 +3460,16 @@ async def cmd_revoke(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("שימוש: /revoke <user_id> או בתגובה על הודעה של המשתמש." + FOOTER)
         return
 
-    uid = str(target_id)
-    if uid in subscribers:
-        del subscribers[uid]
-        save_subscribers()
+    if subscribers.revoke(target_id):
+        events.log("revoke", uid=target_id, admin=user.id)
+        await subscribers.flushed()
         await update.message.reply_text(f"הגישה של {target_id} בוטלה." + FOOTER)
         try:
             await context.bot.send_message(
                 target_id,
                 "הגישה שלך לבוט Chance Predictor בוטלה.\n"
-                "אם מדובר בטעות – אפשר לפנות למפעיל." + FOOTER
+                "אם מדובר בטעות – אפשר לפנות למפעיל." + FOOTER,
+                rate_limit_args=PRIORITY_ADMIN,
             )
         except Exception:
             pass
@@ -718,7 +3482,6 @@ async def cmd_subinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
     /subinfo – המשתמש יכול לבדוק אם יש לו מנוי פעיל ומתי הוא פג.
     """
     user = update.effective_user
-    uid = str(user.id)
     message = update.effective_message
 
     # אם זה אדמין – אפשר לתת לו תשובה מיוחדת (אבל בלי מנוי אוטומטי)
@@ -729,10 +3492,10 @@ async def cmd_subinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    expiry_ts = subscribers.get(uid)
+    expiry_ts = subscribers.get(user.id)
 
-    # אם אין רשומה בכלל – אין מנוי פעיל
-    if not expiry_ts:
+    # אם אין רשומה בתוקף – אין מנוי פעיל (רשומה שפגה נשארת עד הניקוי הבא)
+    if not expiry_ts or time.time() > expiry_ts:
         await message.reply_text(
             "כרגע אין לך מנוי יומי פעיל.\n\n"
             "אפשר לפתוח גישה ל־24 שעות מלאות דרך ״💳 רכישת מנוי״." + FOOTER
@@ -753,6 +3516,7 @@ async def cmd_subinfo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """
     /broadcast <הודעה> – שליחת הודעה לכל המנויים (שעדיין ברשימה).
+    השליחה רצה ברקע; ההתקדמות מתעדכנת בהודעה אחת אצל האדמין.
     """
     user = update.effective_user
     if user.id not in ADMIN_IDS:
@@ -762,24 +3526,78 @@ async def cmd_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("שימוש: /broadcast <הודעה לשליחה לכל המנויים>" + FOOTER)
         return
 
+    if broadcast_running():
+        await update.message.reply_text("כבר רץ שידור למנויים – אפשר לשלוח חדש כשהוא יסתיים." + FOOTER)
+        return
+
+    recipients = np.fromiter(subscribers.keys(), dtype=np.int64, count=len(subscribers))
+    if not len(recipients):
+        await update.message.reply_text("אין כרגע מנויים לשליחה." + FOOTER)
+        return
+
     message_text = " ".join(context.args) + FOOTER
+    progress = await update.message.reply_text(
+        f"📣 השידור מתחיל – {len(recipients)} מנויים ברשימה..." + FOOTER
+    )
+    job = await run_io(Broadcast.create, BROADCAST_DIR, message_text, progress.chat_id, progress.message_id, recipients)
+    events.log("broadcast_start", admin=user.id, recipients=len(recipients))
+    start_broadcast(context.bot, job)
 
-    sent = 0
-    failed = 0
 
-    for uid in list(subscribers.keys()):
-        try:
-            await context.bot.send_message(
-                chat_id=int(uid),
-                text=message_text
-            )
-            sent += 1
-        except Exception:
-            failed += 1
+STATS_TOP_N = 8   # כמה שורות לכל היותר בכל חלק של /stats
 
-    await update.message.reply_text(
-        f"הודעה נשלחה ל-{sent} מנויים. נכשלה עבור {failed}." + FOOTER
-    )
+
+def latency_lines(name: str, key: Callable[[Histogram], float]) -> List[str]:
+    """השורות הבולטות (לפי key) של היסטוגרמה: "• label – קריאות, p50/p99"."""
+    series = sorted(metrics.series(name), key=lambda item: key(item[1]), reverse=True)[:STATS_TOP_N]
+    return [
+        f"• {' '.join(str(value) for _, value in labels)} – {h.count}, "
+        f"{h.quantile(0.5) * 1e3:.1f}/{h.quantile(0.99) * 1e3:.1f}ms"
+        for labels, h in series
+    ]
+
+
+def error_lines(name: str) -> List[str]:
+    totals = sorted(metrics.totals(name), key=lambda item: item[1], reverse=True)[:STATS_TOP_N]
+    return [f"• {' '.join(str(value) for _, value in labels)}: {int(value)}" for labels, value in totals]
+
+
+def stats_text() -> str:
+    gauges = {name: func() for name, func in metrics.gauges.items()}
+    uptime = int(gauges["uptime_seconds"])
+    sections = [
+        (
+            "📈 מצב הבוט",
+            [
+                f"זמן ריצה: {uptime // 86400} ימים {uptime % 86400 // 3600:02d}:{uptime % 3600 // 60:02d}",
+                f"מנויים פעילים: {gauges['subscribers_active']} | הגרלות: {gauges['draws_loaded']}",
+                f"עדכונים בטיפול: {gauges['updates_pending']} | ממתינים לשליחה: {gauges['outbound_queued']}",
+                f"STATE_DB: {gauges['state_db_bytes'] / 1e6:.1f}MB",
+            ],
+        ),
+        ("⏱ handlers (קריאות, p50/p99)", latency_lines("handler_seconds", lambda h: h.count)),
+        ("❗ שגיאות handlers", error_lines("handler_errors_total")),
+        ("📤 שליחה (קריאות, p50/p99)", latency_lines("outbound_send_seconds", lambda h: h.count)),
+        ("⏳ המתנה לתקציב השליחה", latency_lines("outbound_wait_seconds", lambda h: h.count)),
+        ("❗ שגיאות שליחה", error_lines("outbound_errors_total")),
+        ("💾 I/O (לפי זמן כולל)", latency_lines("io_seconds", lambda h: h.total)),
+        ("📄 קריאת Chance.csv", latency_lines("csv_parse_seconds", lambda h: h.count)),
+    ]
+    writes = dict((name, value) for (name, _), value in metrics.counters.items()
+                  if name.startswith("subscriber_"))
+    sections.append((
+        "🗂 כתיבות מנויים",
+        [f"{int(writes.get('subscriber_writes_total', 0))} טרנזקציות, "
+         f"{int(writes.get('subscriber_rows_written_total', 0))} שינויים"],
+    ))
+    return "\n\n".join(title + "\n" + "\n".join(lines) for title, lines in sections if lines)
+
+
+async def cmd_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/stats – סיכום המדדים (למנהלים בלבד). המדדים המלאים: GET /metrics ב־METRICS_PORT."""
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+    await update.message.reply_text(stats_text() + FOOTER, rate_limit_args=PRIORITY_ADMIN)
 
 
 async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -796,6 +3614,7 @@ async def unknown_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # === fallback ===
 
+@instrumented   # נקרא רק מ־handle_menu_buttons, שלא נמדד בעצמו
 async def fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     is_sub = is_subscriber(user.id)
@@ -803,30 +3622,450 @@ async def fallback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text + FOOTER, reply_markup=get_main_keyboard(is_sub))
 
 
+# === עיבוד עדכונים במקביל, לפי סדר בכל צ'אט ===
+#
+# ברירת המחדל של PTB מטפלת בעדכון אחד בכל פעם – handler איטי אחד עוצר את כולם.
+# ChatOrderedProcessor מריץ עד UPDATE_CONCURRENCY עדכונים במקביל, אבל עדכונים מאותו
+# צ'אט עוברים דרך נעילה משותפת (asyncio.Lock שומר על סדר ההגעה), כך שלחיצה כפולה
+# או /grant ואחריו /revoke תמיד מטופלים בסדר שנשלחו.
+# הנעילה נלקחת לפני מקום במקביליות – עדכונים שמחכים לצ'אט שלהם לא תופסים מקום
+# שמשתמשים אחרים היו יכולים לקבל.
+
+class ChatOrderedProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent: int = UPDATE_CONCURRENCY):
+        # הסמפור של PTB רק חוסם את מספר המשימות הפתוחות; המקביליות עצמה נאכפת ב־_slots
+        super().__init__(max_concurrent_updates=UPDATE_MAX_PENDING)
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._chats: Dict[int, list] = {}   # chat_id -> [נעילה, כמה עדכונים ממתינים/רצים]
+        self.pending = 0
+        self.active = 0
+        self.processed = 0
+        self.peak_pending = 0
+        self.peak_backlog = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    @staticmethod
+    def order_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self.order_key(update)
+        entry = None
+        if key is not None:
+            entry = self._chats.get(key)
+            if entry is None:
+                entry = self._chats[key] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            self.peak_backlog = max(self.peak_backlog, entry[1])
+        self.pending += 1
+        self.peak_pending = max(self.peak_pending, self.pending)
+        try:
+            if entry is None:
+                await self._run(coroutine)
+            else:
+                async with entry[0]:
+                    await self._run(coroutine)
+        finally:
+            self.pending -= 1
+            if entry is not None:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chats[key]
+
+    async def _run(self, coroutine):
+        async with self._slots:
+            self.active += 1
+            try:
+                await coroutine
+            finally:
+                self.active -= 1
+                self.processed += 1
+
+    def backlog(self, top_n: int = 3) -> List[Tuple[int, int]]:
+        """הצ'אטים עם הכי הרבה עדכונים ממתינים: [(chat_id, כמות)]."""
+        return heapq.nlargest(top_n, ((chat, entry[1]) for chat, entry in self._chats.items()),
+                              key=lambda item: item[1])
+
+    async def run_report(self, app):
+        """משימת רקע: שורת מצב כל UPDATE_REPORT_SECONDS, רק אם היה עומס מאז הדיווח הקודם."""
+        while True:
+            await asyncio.sleep(UPDATE_REPORT_SECONDS)
+            if self.peak_pending <= 1:
+                continue
+            top = ", ".join(f"{chat}:{count}" for chat, count in self.backlog())
+            print(
+                f"updates: queue={app.update_queue.qsize()} pending={self.pending} "
+                f"active={self.active} peak_pending={self.peak_pending} "
+                f"peak_chat_backlog={self.peak_backlog} processed={self.processed}"
+                + (f" backlog=[{top}]" if top else "")
+            )
+            self.peak_pending = self.pending
+            self.peak_backlog = max((entry[1] for entry in self._chats.values()), default=0)
+
+
+dispatcher = ChatOrderedProcessor()
+metrics.gauge("updates_pending", lambda: dispatcher.pending)
+
+
+# === webhook: שרת HTTP פנימי ===
+#
+# במצב BOT_MODE=webhook טלגרם דוחף את העדכונים אלינו במקום שנמשוך אותם (run_polling):
+# פחות זמן בין הודעה לתשובה, ואפשר להריץ כמה מופעים מאחורי load balancer.
+# השרת הוא asyncio.start_server פשוט (HTTP/1.1 עם keep-alive) עם שני נתיבים:
+# • POST WEBHOOK_PATH – עדכון מטלגרם: בדיקת X-Telegram-Bot-Api-Secret-Token, דילוג על
+#   update_id שכבר התקבל (טלגרם שולח שוב אם לא ענינו בזמן), ו־503 כשיש יותר מדי עדכונים
+#   פתוחים או כשאנחנו בכיבוי – טלגרם ינסה שוב מאוחר יותר / במופע אחר.
+#   "פתוחים" = התור של PTB ועוד מה שכבר ב־ChatOrderedProcessor: PTB מרוקן את update_queue
+#   מיד למשימות, כך שעומק התור לבדו כמעט תמיד 0 גם כשאלפי עדכונים ממתינים לצ'אט שלהם.
+# • GET /healthz – מצב + מספר העדכונים הפתוחים, לבדיקות של הפלטפורמה.
+# ב־SIGTERM: מפסיקים לקבל חיבורים, מחכים (עד WEBHOOK_DRAIN_SECONDS) שהתור יתרוקן, ורק אז עוצרים.
+# לבדיקה מקומית: להריץ בלי WEBHOOK_URL (אין רישום מול טלגרם) ולשלוח עדכונים מוקלטים
+# ב־POST ל־http://localhost:PORT/telegram.
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 403: "Forbidden", 404: "Not Found",
+                413: "Payload Too Large", 503: "Service Unavailable"}
+MAX_WEBHOOK_BODY = 1024 * 1024
+
+
+class WebhookServer:
+    def __init__(self, app, processor: ChatOrderedProcessor, host: str, port: int, path: str, secret: str):
+        self.app = app
+        self.processor = processor
+        self.host = host
+        self.port = port
+        self.path = path
+        self.secret = secret.encode()
+        self.draining = False
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._seen: set = set()
+        self._seen_order: deque = deque()
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        print(f"webhook listening on {self.host}:{self.port}{self.path}")
+
+    async def drain(self, timeout: float = WEBHOOK_DRAIN_SECONDS):
+        """מפסיק לקבל עדכונים חדשים ומחכה שמה שכבר בתור יטופל."""
+        self.draining = True
+        if self._server is not None:
+            self._server.close()
+        try:
+            await asyncio.wait_for(self.app.update_queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"webhook drain timed out, {self.backlog()} updates left")
+
+    def backlog(self) -> int:
+        """עדכונים שהתקבלו ועוד לא טופלו: בתור של PTB, ממתינים לצ'אט שלהם או רצים."""
+        return self.app.update_queue.qsize() + self.processor.pending
+
+    def _is_duplicate(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            return True
+        self._seen.add(update_id)
+        self._seen_order.append(update_id)
+        if len(self._seen_order) > WEBHOOK_DEDUP_SIZE:
+            self._seen.discard(self._seen_order.popleft())
+        return False
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > MAX_WEBHOOK_BODY:
+                    await self._respond(writer, 413, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload = await self._handle(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and not self.draining
+                await self._respond(writer, status, payload, close=not keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle(self, method: str, target: str, headers: dict, body: bytes) -> Tuple[int, bytes]:
+        if method == "GET" and target == "/healthz":
+            status = "draining" if self.draining else "ok"
+            payload = {"status": status, "backlog": self.backlog(), "received": self.received}
+            return (503 if self.draining else 200), json.dumps(payload).encode()
+
+        if method != "POST" or target != self.path:
+            return 404, b""
+        if self.secret and not hmac.compare_digest(
+            headers.get("x-telegram-bot-api-secret-token", "").encode(), self.secret
+        ):
+            return 403, b""
+        if self.draining or self.backlog() >= WEBHOOK_QUEUE_SIZE:
+            self.rejected += 1
+            return 503, b""
+
+        try:
+            data = json.loads(body)
+            update_id = data["update_id"]
+        except (ValueError, KeyError, TypeError):
+            return 400, b""
+        if self._is_duplicate(update_id):
+            self.duplicates += 1
+            return 200, b""
+
+        self.received += 1
+        await self.app.update_queue.put(Update.de_json(data, self.app.bot))
+        return 200, b""
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, payload: bytes = b"", close: bool = False):
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + payload)
+        await writer.drain()
+
+
+async def run_webhook(app):
+    """מקבילה ל־app.run_polling() עבור מצב webhook, כולל post_init / post_stop."""
+    server = WebhookServer(app, dispatcher, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    await app.initialize()
+    if app.post_init:
+        await app.post_init(app)
+    if WEBHOOK_URL:
+        # כל המופעים רושמים את אותה כתובת; לא מוחקים אותה בכיבוי כדי לא לנתק מופעים אחרים
+        await app.bot.set_webhook(
+            url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    await app.start()
+    await server.start()
+    print("Bot is running (webhook)...")
+
+    try:
+        await stop.wait()
+        print("SIGTERM – draining webhook queue...")
+        await server.drain()
+    finally:
+        await app.stop()
+        if app.post_stop:
+            await app.post_stop(app)
+        await app.shutdown()
+        if app.post_shutdown:
+            await app.post_shutdown(app)
+
+
+# === מדדים: endpoint מקומי ===
+
+
+class MetricsServer:
+    """GET /metrics בפורמט הטקסט של Prometheus. בקשה אחת לכל חיבור – מספיק לסקרייפר."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        try:
+            self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        except OSError as exc:
+            # למשל כמה תהליכים על אותה מכונה – הראשון תופס את הפורט, השאר ממשיכים בלי
+            print(f"metrics endpoint disabled ({self.host}:{self.port}): {exc}")
+            return
+        print(f"metrics on http://{self.host}:{self.port}/metrics")
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split(" ")
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?", 1)[0] == "/metrics":
+                status, body = 200, metrics.render().encode()
+            else:
+                status, body = 404, b""
+            writer.write(
+                f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT)
+
+
 # === main ===
 
-def main():
-    app = ApplicationBuilder().token(TOKEN).build()
+async def sync_shared_state():
+    """
+    משימת רקע: מתחשבנת על הגבלות הקצב מול הדליים המשותפים, בודקת את מוני הגרסה ב־STATE_DB
+    ומרעננת מטמון מקומי רק כשמשהו השתנה – מנויים (שינויים של תהליכים אחרים) ותחזיות
+    (תהליך אחר חישב מנתונים חדשים).
+    מדי פעם גם מקצרת את יומן השינויים ומוחקת דליים ישנים.
+    """
+    loop = asyncio.get_running_loop()
+    last_prune = loop.time()
+    seen_predictions = None
+    while True:
+        await asyncio.sleep(STATE_POLL_SECONDS)
+        try:
+            spent = limiter.take_spent()
+            if spent:
+                limiter.merge(await run_io(shared_state.spend_tokens, spent, time.time()))
+            versions = await run_io(shared_state.versions)
+            if versions.get("subscribers", 0) > subscribers.seq:
+                await subscribers.sync()
+            if versions.get("predictions") != seen_predictions:
+                seen_predictions = versions.get("predictions")
+                await run_io(predictions.refresh)
+            if loop.time() - last_prune >= STATE_PRUNE_SECONDS:
+                await run_io(shared_state.prune, time.time())
+                last_prune = loop.time()
+        except Exception as exc:
+            # כל תקלה (נעילה, נתונים פגומים) – מדפיסים וממשיכים; המשימה הזאת לא אמורה למות
+            print("shared state sync failed:", repr(exc))
+
+
+# משימות רקע שרצות לאורך כל חיי הבוט (נעצרות ב־on_stop)
+background_tasks: List[asyncio.Task] = []
+
+
+async def on_startup(app):
+    await run_io(shared_state.open)
+    await run_io(subscribers.load)
+    await predictions.update()
+    background_tasks.append(asyncio.create_task(predictions.run()))
+    background_tasks.append(asyncio.create_task(expire_subscribers(app.bot)))
+    background_tasks.append(asyncio.create_task(dispatcher.run_report(app)))
+    background_tasks.append(asyncio.create_task(sync_shared_state()))
+    background_tasks.append(asyncio.create_task(events.run()))
+    if METRICS_PORT:
+        await metrics_server.start()
+
+    # שידור שנקטע (כיבוי / קריסה) ממשיך מאיפה שעצר
+    job = await run_io(Broadcast.load, BROADCAST_DIR)
+    if job is not None:
+        print(f"resuming broadcast: {job.sent + job.failed}/{job.total} done")
+        start_broadcast(app.bot, job)
+
+
+async def on_stop(app):
+    metrics_server.close()
+    if broadcast_task is not None:
+        background_tasks.append(broadcast_task)
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await subscribers.aclose()
+    await events.aclose()
+    await run_io(shared_state.close)
+
+
+def build_application():
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .base_url(BOT_API_URL + "/bot")
+        .rate_limiter(outbound)
+        .concurrent_updates(dispatcher)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .build()
+    )
+
+    # הגבלת קצב לפני כל שאר ה־handlers (מי שחורג לא מגיע אליהם בכלל)
+    app.add_handler(TypeHandler(Update, instrumented(rate_limit_gate)), group=-1)
 
     # פקודות
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("terms", handle_terms))
-    app.add_handler(CommandHandler("subinfo", cmd_subinfo))
-    app.add_handler(CommandHandler("grant", cmd_grant))
-    app.add_handler(CommandHandler("revoke", cmd_revoke))
-    app.add_handler(CommandHandler("broadcast", cmd_broadcast))
-    app.add_handler(CommandHandler("help", cmd_help))
-    app.add_handler(CommandHandler("myid", cmd_myid))
+    app.add_handler(CommandHandler("start", instrumented(start)))
+    app.add_handler(CommandHandler("terms", instrumented(handle_terms)))
+    app.add_handler(CommandHandler("subinfo", instrumented(cmd_subinfo)))
+    app.add_handler(CommandHandler("grant", instrumented(cmd_grant)))
+    app.add_handler(CommandHandler("revoke", instrumented(cmd_revoke)))
+    app.add_handler(CommandHandler("broadcast", instrumented(cmd_broadcast)))
+    app.add_handler(CommandHandler("help", instrumented(cmd_help)))
+    app.add_handler(CommandHandler("myid", instrumented(cmd_myid)))
+    app.add_handler(CommandHandler("draw", instrumented(cmd_draw)))
+    app.add_handler(CommandHandler("draws", instrumented(cmd_draws)))
+    app.add_handler(CommandHandler("stats", instrumented(cmd_stats)))
+
+    # דפדוף בהיסטוריה (כפתורי הקודם / הבא)
+    app.add_handler(CallbackQueryHandler(instrumented(handle_history_page), pattern=r"^(draw|draws):"))
 
     # פקודה לא מוכרת
-    app.add_handler(MessageHandler(filters.COMMAND, unknown_command))
+    app.add_handler(MessageHandler(filters.COMMAND, instrumented(unknown_command)))
 
     # כפתורים / טקסטים + כל טקסט שאינו פקודה
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_menu_buttons))
 
-    print("Bot is running...")
-    app.run_polling()
+    return app
+
+
+def main():
+    if not TOKEN:
+        raise SystemExit("חסר TELEGRAM_BOT_TOKEN במשתני הסביבה")
+
+    app = build_application()
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(app))
+    else:
+        print("Bot is running...")
+        app.run_polling()
 
 
 if __name__ == "__main__":
-    main()
+    # python3 bot.py --build-archive – המרה חד־פעמית של Chance.csv ל־Chance.bin
+    if sys.argv[1:] == ["--build-archive"]:
+        print(f"{build_archive()} הגרלות נכתבו ל־{ARCHIVE_FILE}")
+    # python3 bot.py --check – המונים החיים (חלונות + כל ההיסטוריה) מול חישוב מלא מחדש
+    elif sys.argv[1:] == ["--check"]:
+        snapshot = draw_store.snapshot()
+        bad = snapshot.window_mismatches()
+        print(f"{snapshot.count} הגרלות: " + (f"מונים לא תואמים בחלונות {bad}" if bad else "כל המונים תואמים"))
+        sys.exit(1 if bad else 0)
+    else:
+        main()
@@ -0,0 +1,6 @@
+"""
+סיכום יומן האירועים של הבוט (EVENT_LOG_DIR, ברירת מחדל events/) – לחיצות לכל כפתור לפי שעה.
+
+    python -m eventstats events/
+    python -m eventstats --from 2026-10-01 --hour-of-day --csv
+"""
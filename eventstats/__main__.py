@@ -0,0 +1,5 @@
+import sys
+
+from eventstats.run import main
+
+sys.exit(main())
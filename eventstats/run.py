@@ -0,0 +1,109 @@
+"""
+CLI לסיכום יומן האירועים: קורא את כל קבצי events-*.jsonl בזרימה, שורה אחר שורה,
+בלי לטעון אותם לזיכרון, וסופר לחיצות לכל כפתור לפי שעה.
+
+    python -m eventstats [events/] [--from 2026-10-01] [--to 2026-10-18]
+                         [--hour-of-day] [--commands] [--csv]
+
+--hour-of-day  – מקבץ את כל הימים לפי שעה ביממה (0–23), כדי לראות שיאים סביב שעות ההגרלות
+--commands     – סופר גם פקודות (/start, /draws ...) כאילו היו כפתורים
+--csv          – פלט hour,button,clicks במקום טבלה
+"""
+
+import argparse
+import csv
+import json
+import sys
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+
+def read_events(directory: Path):
+    for path in sorted(directory.glob("events-*.jsonl")):
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue      # שורה חלקית בסוף קובץ של תהליך שנפל
+
+
+def count_clicks(events, start: float, end: float, hour_of_day: bool, commands: bool) -> Counter:
+    """(שעה, כפתור) -> כמות. שעה = 'YYYY-MM-DD HH:00' או 'HH:00' עם hour_of_day."""
+    counts: Counter = Counter()
+    for event in events:
+        kind = event.get("e")
+        if kind == "click":
+            button = event.get("button")
+        elif kind == "command" and commands:
+            button = event.get("command")
+        else:
+            continue
+        t = event.get("t", 0)
+        if not start <= t < end:
+            continue
+        moment = datetime.fromtimestamp(t)
+        hour = f"{moment:%H}:00" if hour_of_day else f"{moment:%Y-%m-%d %H}:00"
+        counts[(hour, button)] += 1
+    return counts
+
+
+def print_table(counts: Counter):
+    if not counts:
+        print("no clicks in range")
+        return
+    hours = sorted({hour for hour, _ in counts})
+    by_button = Counter()
+    for (_, button), n in counts.items():
+        by_button[button] += n
+    buttons = [button for button, _ in by_button.most_common()]
+    per_hour = {hour: sum(counts[(hour, b)] for b in buttons) for hour in hours}
+
+    width = max(len(b) for b in buttons)
+    for hour in hours:
+        print(f"\n{hour}  ({per_hour[hour]} clicks)")
+        for button in buttons:
+            n = counts.get((hour, button))
+            if n:
+                print(f"  {button:{width}}  {n:7d}")
+
+    print("\ntotal per button")
+    for button, n in by_button.most_common():
+        print(f"  {button:{width}}  {n:7d}")
+    peak = max(hours, key=per_hour.get)
+    print(f"\npeak hour: {peak} ({per_hour[peak]} clicks)")
+
+
+def write_csv(counts: Counter):
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["hour", "button", "clicks"])
+    for (hour, button), n in sorted(counts.items()):
+        writer.writerow([hour, button, n])
+
+
+def day_start(text: str) -> float:
+    return datetime.combine(date.fromisoformat(text), datetime.min.time()).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="clicks per button per hour from the bot's event log")
+    parser.add_argument("directory", nargs="?", type=Path, default=Path("events"))
+    parser.add_argument("--from", dest="start", help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", help="last day, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--hour-of-day", action="store_true", help="fold all days into 24 hours")
+    parser.add_argument("--commands", action="store_true", help="count commands as buttons too")
+    parser.add_argument("--csv", action="store_true", help="hour,button,clicks on stdout")
+    args = parser.parse_args()
+
+    start = day_start(args.start) if args.start else 0.0
+    end = day_start(args.end) + timedelta(days=1).total_seconds() if args.end else float("inf")
+    counts = count_clicks(read_events(args.directory), start, end, args.hour_of_day, args.commands)
+    if args.csv:
+        write_csv(counts)
+    else:
+        print_table(counts)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+בדיקת עומס מקצה לקצה: bot.py רץ כתהליך אמיתי (main() – polling או webhook) מול שרת Bot API
+מקומי (fakeapi), ו־run מדמה אלפי משתמשים שלוחצים על כפתורי התפריט ושולחים פקודות
+עם זמני מחשבה. נמדד הזמן מהכנסת העדכון ועד שה־sendMessage הראשון לאותו צ'אט מגיע לשרת.
+הכל מקומי – בלי רשת ובלי טוקן אמיתי.
+
+    python -m loadtest --users 2000 --duration 60
+    python -m loadtest --mode webhook --outbound-rate 0   # בלי תקרת 30 הודעות לשנייה
+"""
@@ -0,0 +1,175 @@
+"""
+שרת Bot API מקומי לבדיקות עומס. מספיק ממנו בשביל python-telegram-bot:
+
+    getMe, getUpdates (long polling), setWebhook / deleteWebhook / getWebhookInfo,
+    sendMessage (וכל send* / edit* / answerCallbackQuery)
+
+עדכונים נכנסים ב־push() ומוגשים ל־getUpdates; כל הודעה יוצאת מדווחת ל־on_send(chat_id, method, params)
+כדי שהמדמה יוכל למדוד זמן תגובה. כל טוקן מתקבל.
+
+    python -m loadtest.fakeapi [--port 8081]    # שרת בלבד, לבדיקה ידנית
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter, deque
+from typing import Callable, Optional, Tuple
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Load Test", "username": "loadtest_bot"}
+MAX_UPDATES = 100            # כמו בטלגרם – הכי הרבה עדכונים בתשובה אחת ל־getUpdates
+
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081,
+                 on_send: Optional[Callable[[int, str, dict], None]] = None):
+        self.host = host
+        self.port = port
+        self.on_send = on_send
+        self.calls: Counter = Counter()      # method -> כמה קריאות
+        self.polls = 0                       # כמה getUpdates הגיעו (0 = הבוט עוד לא התחיל לקרוא)
+        self.webhook_url = ""
+        self._updates: deque = deque()
+        self._arrived = asyncio.Event()
+        self._message_id = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: set = set()      # משימות החיבורים הפתוחים – לסגירה מסודרת
+        self._closing = False
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+
+    async def close(self):
+        """סוגר את השרת ומשחרר getUpdates שממתינים, כדי שאף חיבור לא ייחתך באמצע."""
+        self._closing = True
+        self._arrived.set()
+        if self._server is not None:
+            self._server.close()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    def push(self, update: dict):
+        self._updates.append(update)
+        self._arrived.set()
+
+    # === HTTP ===
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while not self._closing:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                _, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = await reader.readexactly(length) if length else b""
+
+                method = target.rsplit("/", 1)[-1].split("?", 1)[0]
+                result = await self._call(method, self._params(headers, body))
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload)
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+            self._connections.discard(task)
+
+    @staticmethod
+    def _params(headers: dict, body: bytes) -> dict:
+        # PTB שולח form-urlencoded (ערכים שאינם מחרוזת מקודדים כ־JSON); לקוחות אחרים – JSON
+        if not body:
+            return {}
+        if headers.get("content-type", "").startswith("application/json"):
+            return json.loads(body)
+        return dict(parse_qsl(body.decode()))
+
+    # === שיטות ה־API ===
+
+    async def _call(self, method: str, params: dict):
+        self.calls[method] += 1
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getMe":
+            return BOT_USER
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+            return True
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        if method.startswith(("send", "edit")):
+            return self._message(method, params)
+        return True
+
+    async def _get_updates(self, params: dict):
+        self.polls += 1
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout and not self._closing:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        limit = min(int(params.get("limit") or MAX_UPDATES), MAX_UPDATES)
+        return [update for _, update in zip(range(limit), self._updates)]
+
+    def _message(self, method: str, params: dict) -> dict:
+        chat_id, message_id = self._target(params)
+        if self.on_send is not None:
+            self.on_send(chat_id, method, params)
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": params.get("text", ""),
+        }
+
+    def _target(self, params: dict) -> Tuple[int, int]:
+        if "message_id" in params:        # edit* – אותה הודעה
+            return int(params.get("chat_id") or 0), int(params["message_id"])
+        self._message_id += 1
+        return int(params.get("chat_id") or 0), self._message_id
+
+
+async def serve(port: int):
+    api = FakeBotAPI(port=port, on_send=lambda chat_id, method, params: print(method, chat_id, flush=True))
+    await api.start()
+    print(f"fake Bot API on {api.url} (TELEGRAM_API_URL={api.url})")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="local fake Telegram Bot API")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""
+מדמה עומס: מעלה את FakeBotAPI, מריץ את bot.py כתהליך נפרד מולו (TELEGRAM_API_URL) ומשחרר
+--users משתמשים בלולאה סגורה: לחיצה, המתנה לתשובה, זמן מחשבה (מעריכי, ממוצע --think), שוב.
+משתמש לא שולח פעולה שה־rate limit של הבוט היה דוחה (אותם RATE_LIMITS), כדי שכל עדכון
+יקבל תשובה ונמדד ממנו זמן.
+
+הזמן נמדד מהרגע שהעדכון נכנס לשרת (polling) / נשלח ב־POST (webhook) ועד שה־sendMessage
+הראשון לאותו צ'אט מגיע – כולל ה־long polling, התור, ה־handler והתקציב היוצא.
+תפוקה ואחוזונים מחושבים רק אחרי --ramp (חימום), פר פעולה ובסך הכל.
+
+    python -m loadtest [--users 2000] [--duration 60] [--ramp 10] [--think 3]
+                       [--mode polling|webhook] [--outbound-rate 30] [--output report.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import httpx
+import numpy as np
+
+from benchmarks.generate import generate, parse_size
+from loadtest.fakeapi import FakeBotAPI
+
+BOT_SCRIPT = Path(__file__).resolve().parent.parent / "bot.py"
+TOKEN = "123456:loadtest"
+FIRST_USER_ID = 10_000_000
+MIN_THINK = 0.3              # גם משתמש מהיר לא לוחץ מהר מזה
+COMMANDS = ["/start", "/help", "/myid", "/subinfo", "/terms"]
+COMMAND_SHARE = 0.15         # איזה חלק מהפעולות הן פקודות (השאר – כפתורי התפריט)
+STARTUP_TIMEOUT = 60
+STOP_TIMEOUT = 30
+WEBHOOK_RETRY_SECONDS = 0.5  # אחרי 503 – כמו טלגרם, שולחים שוב
+
+
+class Action(NamedTuple):
+    name: str          # מה יופיע בדוח
+    text: str          # מה המשתמש שולח
+    limit: str         # המפתח ב־RATE_LIMITS
+    bucket: str        # הדלי בבוט (פקודה – לכל פקודה בנפרד, תפריט – לפי הפעולה)
+
+
+class Sample(NamedTuple):
+    action: str
+    latency: float
+    finished: float
+
+
+def menu_actions(bot) -> List[Action]:
+    return [Action(label, label, route.action, route.action) for label, route in bot.MENU_ROUTES.items()]
+
+
+def command_actions() -> List[Action]:
+    return [Action(command, command, "command", command) for command in COMMANDS]
+
+
+class Driver:
+    def __init__(self, api: FakeBotAPI, bot, args):
+        self.api = api
+        self.args = args
+        self.limits = bot.RATE_LIMITS
+        self.limit_texts = tuple(bot.LIMIT_MESSAGES.values()) + (bot.DEFAULT_LIMIT_MESSAGE,)
+        self.menu = menu_actions(bot)
+        self.commands = command_actions()
+        self.samples: List[Sample] = []
+        self.timeouts: Counter = Counter()
+        self.sent = 0
+        self.extra = 0        # הודעות שלא חיכו להן (תשובה שנייה / תשובה שהגיעה אחרי timeout)
+        self.limited = 0      # תשובות "יותר מדי בקשות" – לא אמורות לקרות
+        self.rejected = 0     # 503 מה־webhook
+        self._update_id = 0
+        self._waiting: Dict[int, asyncio.Future] = {}
+        self._client = httpx.AsyncClient(timeout=args.timeout) if args.mode == "webhook" else None
+        api.on_send = self.on_send
+
+    # === הודעות יוצאות ===
+
+    def on_send(self, chat_id: int, method: str, params: dict):
+        future = self._waiting.pop(chat_id, None)
+        if future is None or future.done():
+            self.extra += 1
+            return
+        future.set_result((time.perf_counter(), params.get("text", "")))
+
+    # === עדכונים נכנסים ===
+
+    def make_update(self, uid: int, text: str) -> dict:
+        self._update_id += 1
+        message = {
+            "message_id": self._update_id,
+            "date": int(time.time()),
+            "chat": {"id": uid, "type": "private", "first_name": f"user{uid}"},
+            "from": {"id": uid, "is_bot": False, "first_name": f"user{uid}"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": self._update_id, "message": message}
+
+    async def deliver(self, update: dict):
+        self.sent += 1
+        if self._client is None:
+            self.api.push(update)
+            return
+        url = f"http://127.0.0.1:{self.args.webhook_port}/telegram"
+        while True:
+            response = await self._client.post(url, json=update)
+            if response.status_code != 503:
+                return
+            self.rejected += 1
+            await asyncio.sleep(WEBHOOK_RETRY_SECONDS)
+
+    # === משתמש אחד ===
+
+    def pick(self, rng: random.Random, buckets: Dict[str, list]) -> Tuple[Action, float]:
+        """פעולה שהבוט יאשר עכשיו, או (None, כמה לחכות) אם אין כזאת."""
+        pool = self.commands if rng.random() < COMMAND_SHARE else self.menu
+        now = time.monotonic()
+        wait = float("inf")
+        for action in rng.sample(pool, len(pool)):
+            rate, burst = self.limits[action.limit]
+            tokens, stamp = buckets.get(action.bucket, (float(burst), now))
+            tokens = min(burst, tokens + (now - stamp) * rate)
+            if tokens >= 1:
+                buckets[action.bucket] = [tokens - 1, now]
+                return action, 0.0
+            wait = min(wait, (1 - tokens) / rate)
+        return None, wait
+
+    async def user(self, uid: int, deadline: float):
+        rng = random.Random(uid)
+        loop = asyncio.get_running_loop()
+        buckets: Dict[str, list] = {}
+        await asyncio.sleep(rng.uniform(0, self.args.ramp))
+        while time.perf_counter() < deadline:
+            action, wait = self.pick(rng, buckets)
+            if action is None:
+                await asyncio.sleep(wait)
+                continue
+
+            future = loop.create_future()
+            self._waiting[uid] = future
+            started = time.perf_counter()
+            await self.deliver(self.make_update(uid, action.text))
+            try:
+                finished, text = await asyncio.wait_for(future, self.args.timeout)
+            except asyncio.TimeoutError:
+                self._waiting.pop(uid, None)
+                self.timeouts[action.name] += 1
+            else:
+                self.samples.append(Sample(action.name, finished - started, finished))
+                if text.startswith(self.limit_texts):
+                    self.limited += 1
+            await asyncio.sleep(max(MIN_THINK, rng.expovariate(1 / self.args.think)))
+
+    async def run(self) -> float:
+        start = time.perf_counter()
+        deadline = start + self.args.duration
+        users = [self.user(FIRST_USER_ID + i, deadline) for i in range(self.args.users)]
+        await asyncio.gather(*users)
+        if self._client is not None:
+            await self._client.aclose()
+        return start
+
+    # === דוח ===
+
+    def report(self, start: float) -> dict:
+        steady_from = start + self.args.ramp
+        steady = [s for s in self.samples if s.finished >= steady_from]
+        window = max((s.finished for s in steady), default=steady_from) - steady_from or 1e-9
+        by_action: Dict[str, List[float]] = {}
+        for sample in steady:
+            by_action.setdefault(sample.action, []).append(sample.latency)
+
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "output"},
+            "sent": self.sent,
+            "replies": len(self.samples),
+            "timeouts": sum(self.timeouts.values()),
+            "timeouts_by_action": dict(self.timeouts),
+            "extra_messages": self.extra,
+            "limited_replies": self.limited,
+            "webhook_503": self.rejected,
+            "steady_seconds": window,
+            "throughput_rps": len(steady) / window,
+            "latency": summarize([s.latency for s in steady]),
+            "latency_by_action": {name: summarize(values) for name, values in sorted(by_action.items())},
+            "api_calls": dict(self.api.calls),
+        }
+
+
+def summarize(latencies: List[float]) -> dict:
+    if not latencies:
+        return {"count": 0}
+    values = np.asarray(latencies) * 1e3
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"count": len(values), "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": values.max()}
+
+
+def print_report(report: dict):
+    config = report["config"]
+    print(
+        f"\n{config['users']} users, {config['mode']}, think {config['think']}s, "
+        f"outbound {config['outbound_rate'] or 'unlimited'} msg/s, "
+        f"steady {report['steady_seconds']:.1f}s"
+    )
+    print(f"{'action':34} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    rows = list(report["latency_by_action"].items()) + [("ALL", report["latency"])]
+    for name, s in rows:
+        if not s["count"]:
+            continue
+        print(
+            f"{name:34} {s['count']:7d} {s['p50_ms']:7.1f}ms {s['p95_ms']:7.1f}ms "
+            f"{s['p99_ms']:7.1f}ms {s['max_ms']:7.1f}ms"
+        )
+    print(
+        f"\nthroughput {report['throughput_rps']:.1f} replies/s | sent {report['sent']} | "
+        f"timeouts {report['timeouts']} | limited {report['limited_replies']} | "
+        f"extra {report['extra_messages']} | webhook 503 {report['webhook_503']}"
+    )
+
+
+# === הרצת הבוט ===
+
+def prepare(work: Path, args):
+    """Chance.csv סינתטי ומנויים ב־STATE_DB של תיקיית העבודה. מחזיר את המודול bot."""
+    generate(work / "Chance.csv", args.draws, seed=args.seed)
+    os.environ["STATE_DB"] = str(work / "state.db")
+    os.chdir(work)
+    import bot
+
+    rng = random.Random(args.seed)
+    expiry = int(time.time()) + 30 * 86_400
+    subscribed = {
+        FIRST_USER_ID + i: expiry for i in range(args.users) if rng.random() < args.subscribers
+    }
+    bot.shared_state.open()
+    bot.shared_state.import_subscribers(subscribed)
+    bot.shared_state.close()
+    return bot
+
+
+def bot_environment(work: Path, api: FakeBotAPI, args) -> dict:
+    env = dict(os.environ)
+    env.update(
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_API_URL=api.url,
+        STATE_DB=str(work / "state.db"),
+        BOT_MODE=args.mode,
+        PORT=str(args.webhook_port),
+        WEBHOOK_URL=f"http://127.0.0.1:{args.webhook_port}/telegram" if args.mode == "webhook" else "",
+        # 0 = בלי תקרה משלנו – מודדים את הבוט עצמו ולא את המגבלה של טלגרם
+        OUTBOUND_RATE=str(args.outbound_rate or 1e9),
+        PYTHONUNBUFFERED="1",
+    )
+    return env
+
+
+async def wait_ready(api: FakeBotAPI, process, args):
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.returncode is not None:
+                raise SystemExit(f"bot exited with code {process.returncode} during startup")
+            if args.mode == "polling" and api.polls:
+                return
+            if args.mode == "webhook" and api.webhook_url:
+                try:
+                    response = await client.get(f"http://127.0.0.1:{args.webhook_port}/healthz")
+                    if response.status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+            await asyncio.sleep(0.1)
+    raise SystemExit("bot did not become ready in time")
+
+
+async def stop(process):
+    if process.returncode is not None:
+        return
+    process.send_signal(signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def load_test(work: Path, bot, args) -> dict:
+    api = FakeBotAPI(port=args.api_port)
+    await api.start()
+    log = open(work / "bot.log", "wb")
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, str(BOT_SCRIPT),
+        cwd=work, env=bot_environment(work, api, args), stdout=log, stderr=asyncio.subprocess.STDOUT,
+    )
+    try:
+        await wait_ready(api, process, args)
+        driver = Driver(api, bot, args)
+        print(f"bot ready, releasing {args.users} users for {args.duration}s", flush=True)
+        start = await driver.run()
+        return driver.report(start)
+    finally:
+        await stop(process)
+        log.close()
+        await api.close()
+        if args.keep_log:
+            print(f"bot log: {work / 'bot.log'}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="end-to-end load test against a local fake Bot API")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=60, help="seconds, including the ramp")
+    parser.add_argument("--ramp", type=float, default=10, help="users start spread over this many seconds")
+    parser.add_argument("--think", type=float, default=3.0, help="mean think time between clicks (s)")
+    parser.add_argument("--timeout", type=float, default=30, help="give up on a reply after this many seconds")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--outbound-rate", type=float, default=30, help="bot's own send budget; 0 = unlimited")
+    parser.add_argument("--subscribers", type=float, default=0.2, help="share of users with a subscription")
+    parser.add_argument("--draws", type=parse_size, default="10k", help="size of the synthetic Chance.csv")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-port", type=int, default=8443)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-log", action="store_true", help="keep the work dir with bot.log")
+    parser.add_argument("--output", type=Path, help="write the report as JSON")
+    args = parser.parse_args(argv)
+
+    cwd = os.getcwd()
+    work = Path(tempfile.mkdtemp(prefix="bot-loadtest-"))
+    try:
+        bot = prepare(work, args)
+        report = asyncio.run(load_test(work, bot, args))
+    finally:
+        os.chdir(cwd)
+        if not args.keep_log:
+            shutil.rmtree(work, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return 0 if report["replies"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import random
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from telegram import Update
+
+# הבדיקות מייבאות את bot.py ישירות מתיקיית הפרויקט
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import bot  # noqa: E402
+
+
+def make_draw_lines(numbers, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    return "".join(
+        f"01/01/2020,{number},{','.join(rng.choice(bot.RANKS) for _ in range(4))},\n" for number in numbers
+    )
+
+
+@pytest.fixture
+def draw_lines():
+    """draw_lines(numbers, seed) – שורות Chance.csv עם מספרי ההגרלה האלה וקלפים אקראיים."""
+    return make_draw_lines
+
+
+def make_random_cards(n: int, seed: int = 1, p=None) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.choice(bot.NUM_RANKS, size=(n, bot.NUM_COLUMNS), p=p).astype(np.uint8)
+
+
+@pytest.fixture
+def random_cards():
+    """random_cards(n, seed, p) – מטריצת (n, 4) של דרגות; p – התפלגות הדרגות (ברירת מחדל אחידה)."""
+    return make_random_cards
+
+
+def make_update_data(text: str = "x", chat_id: int = 42, update_id: int = 1) -> dict:
+    chat = {"id": chat_id, "type": "private"}
+    user = {"id": chat_id, "is_bot": False, "first_name": "u"}
+    message = {"message_id": update_id, "date": 0, "chat": chat, "from": user, "text": text}
+    return {"update_id": update_id, "message": message}
+
+
+def make_message(text: str = "x", chat_id: int = 42, update_id: int = 1) -> Update:
+    return Update.de_json(make_update_data(text, chat_id, update_id), None)
+
+
+@pytest.fixture
+def update_data():
+    """update_data(text, chat_id, update_id) – גוף העדכון כמו ש־Telegram שולח אותו (dict)."""
+    return make_update_data
+
+
+@pytest.fixture
+def message():
+    """message(text, chat_id, update_id) – Update של הודעת טקסט בצ'אט פרטי (המשתמש = הצ'אט)."""
+    return make_message
+
+
+@pytest.fixture
+def open_state():
+    """open_state(path) – SharedState פתוח על הקובץ; כולם נסגרים בסוף הבדיקה."""
+    opened = []
+
+    def open_state(path: Path) -> bot.SharedState:
+        state = bot.SharedState(path)
+        state.open()
+        opened.append(state)
+        return state
+
+    yield open_state
+    for state in opened:
+        state.close()
@@ -0,0 +1,13 @@
+import argparse
+import tempfile
+
+from backtest.run import load_history
+
+
+def test_synthetic_history_leaves_no_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    cards, numbers = load_history(argparse.Namespace(synthetic=2_000, seed=3, csv=None))
+    assert cards.shape == (2_000, 4) and len(numbers) == 2_000
+    # כרונולוגי: המספרים עולים
+    assert (numbers[1:] > numbers[:-1]).all()
+    assert list(tmp_path.iterdir()) == []
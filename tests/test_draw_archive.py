@@ -0,0 +1,49 @@
+import numpy as np
+
+import bot
+
+
+def assert_same_draws(a: bot.DrawSnapshot, b: bot.DrawSnapshot):
+    assert a.count == b.count
+    assert np.array_equal(a.numbers, b.numbers)
+    assert np.array_equal(a.cards, b.cards)
+    assert np.array_equal(a.column_counts, b.column_counts)
+
+
+def test_pack_roundtrip(random_cards):
+    cards = random_cards(1000)
+    assert np.array_equal(bot.unpack_cards(bot.pack_cards(cards)), cards)
+
+
+def test_archive_serves_the_same_draws_and_appends(tmp_path, draw_lines):
+    csv_path, archive = tmp_path / "Chance.csv", tmp_path / "Chance.bin"
+    csv_path.write_text(draw_lines(range(1, 301)))
+    built = bot.DrawStore(csv_path, archive).snapshot()
+    assert_same_draws(bot.DrawStore(csv_path, archive).snapshot(), built)
+
+    with csv_path.open("a") as f:
+        f.write(draw_lines(range(301, 321), seed=2))
+    extended = bot.DrawStore(csv_path, archive).snapshot()
+    assert extended.count == 320
+    # בלי ה־CSV – רק מה שבארכיון (כולל ההוספה)
+    csv_path.unlink()
+    assert_same_draws(bot.DrawStore(csv_path, archive).snapshot(), extended)
+
+
+def test_archive_write_failure_does_not_break_reads(tmp_path, capsys, draw_lines):
+    csv_path = tmp_path / "Chance.csv"
+    archive = tmp_path / "missing" / "Chance.bin"      # התיקייה לא קיימת – הכתיבה נכשלת
+    csv_path.write_text(draw_lines(range(1, 101)))
+    store = bot.DrawStore(csv_path, archive)
+    assert store.snapshot().count == 100
+    assert isinstance(store.archive_error, OSError)
+    assert "draw archive write failed" in capsys.readouterr().out
+
+    # כשאפשר שוב לכתוב – בנייה מלאה, לא הוספה לקובץ שלא ידוע מה יש בו
+    archive.parent.mkdir()
+    with csv_path.open("a") as f:
+        f.write(draw_lines(range(101, 111), seed=2))
+    assert store.snapshot().count == 110
+    assert store.archive_error is None
+    csv_path.unlink()
+    assert bot.DrawStore(csv_path, archive).snapshot().count == 110
@@ -0,0 +1,158 @@
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import bot
+
+
+def append(path, text: str):
+    with path.open("a") as f:
+        f.write(text)
+
+
+def numbers(snapshot: bot.DrawSnapshot):
+    return snapshot.numbers.tolist()
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """כמה בתים כל קריאה ל־_parse_draw_lines קיבלה – כדי לוודא שרק הזנב נקרא."""
+    sizes = []
+    parse = bot._parse_draw_lines
+
+    def spy(data):
+        sizes.append(len(data))
+        return parse(data)
+
+    monkeypatch.setattr(bot, "_parse_draw_lines", spy)
+    return sizes
+
+
+def test_unchanged_file_is_not_reread(tmp_path, parsed, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 51)))
+    store = bot.DrawStore(path)
+    first = store.snapshot()
+    assert store.snapshot() is first
+    assert len(parsed) == 1
+
+
+def test_appended_rows_are_read_from_the_tail(tmp_path, parsed, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 101)))
+    store = bot.DrawStore(path)
+    first = store.snapshot()
+    tail = draw_lines(range(101, 111), seed=2)
+    append(path, tail)
+    second = store.snapshot()
+    assert parsed[-1] == len(tail.encode())
+    assert second.count == 110 and second.version == first.version + 1
+    # טעינה מלאה מאפס – מה שהמאגר אמור להכיל
+    assert numbers(second) == numbers(bot.DrawStore(path).snapshot())
+    # ה־snapshot הקודם לא השתנה
+    assert first.count == 100
+
+
+def test_partial_last_line_waits_for_the_rest(tmp_path, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 11)))
+    store = bot.DrawStore(path)
+    store.snapshot()
+    line = draw_lines([11], seed=3)
+    append(path, line[:12])
+    assert store.snapshot().count == 10
+    append(path, line[12:])
+    assert store.snapshot().last_number == 11
+
+
+def test_duplicates_in_the_tail_are_skipped(tmp_path, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 21)))
+    store = bot.DrawStore(path)
+    store.snapshot()
+    append(path, draw_lines([19, 20, 21, 21, 22], seed=4))
+    assert numbers(store.snapshot()) == list(range(1, 23))
+
+
+def shorten(path, draw_lines):
+    path.write_text(draw_lines(range(1, 31)))
+
+
+def same_length(path, draw_lines):
+    # תוכן אחר באותו אורך – טביעת האצבע של ההתחלה / הזנב משתנה
+    path.write_text(draw_lines(range(1, 51), seed=9))
+
+
+def old_draw_at_the_end(path, draw_lines):
+    # הגרלה ישנה שנוספה בסוף – באמצע ההיסטוריה
+    path.write_text(draw_lines([n for n in range(1, 51) if n != 25]))
+    append(path, draw_lines([25]))
+
+
+def new_inode(path, draw_lines):
+    # קובץ חדש שנכנס במקום הקודם
+    path.with_name("new.csv").write_text(draw_lines(range(1, 61), seed=5))
+    os.replace(path.with_name("new.csv"), path)
+
+
+@pytest.mark.parametrize("rewrite", [shorten, same_length, old_draw_at_the_end, new_inode])
+def test_rewritten_file_is_rebuilt_from_scratch(tmp_path, rewrite, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 51)))
+    store = bot.DrawStore(path)
+    store.snapshot()
+    rewrite(path, draw_lines)
+    os.utime(path, ns=(1, 1))     # mtime אחר, גם אם הכתיבה נפלה באותו tick
+    snapshot = store.snapshot()
+    fresh = bot.DrawStore(path).snapshot()
+    assert np.array_equal(snapshot.numbers, fresh.numbers)
+    assert np.array_equal(snapshot.cards, fresh.cards)
+    assert np.array_equal(snapshot.column_counts, fresh.column_counts)
+    assert snapshot.window_mismatches() == []
+
+
+def test_newest_first_file_is_served_in_draw_order(tmp_path, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text("date,draw_number,card1,card2,card3,card4,\n" + draw_lines(range(30, 0, -1)))
+    snapshot = bot.DrawStore(path).snapshot()
+    assert numbers(snapshot) == list(range(1, 31))
+    assert snapshot.latest(3) == [bot.decode_draw(row) for row in snapshot.cards[::-1][:3].tolist()]
+
+
+def test_missing_file_keeps_serving_the_last_snapshot(tmp_path, draw_lines):
+    path = tmp_path / "Chance.csv"
+    path.write_text(draw_lines(range(1, 11)))
+    store = bot.DrawStore(path)
+    store.snapshot()
+    path.unlink()
+    assert store.snapshot().count == 10
+
+
+@pytest.mark.parametrize("shuffled", [False, True])
+def test_date_range_pages_match_a_full_scan(tmp_path, shuffled):
+    rng = np.random.default_rng(3)
+    days = np.sort(rng.integers(0, 60, size=200))
+    if shuffled:
+        # תאריכים שלא עולים יחד עם מספרי ההגרלה – דרך האינדקס הממוין
+        rng.shuffle(days)
+    first = date(2020, 1, 1)
+    path = tmp_path / "Chance.csv"
+    path.write_text("".join(
+        f"{first + timedelta(days=int(day)):%d/%m/%Y},{number},7,8,9,J,\n" for number, day in enumerate(days, 1)
+    ))
+    snapshot = bot.DrawStore(path).snapshot()
+    start, end = first + timedelta(days=10), first + timedelta(days=40)
+
+    lo, hi = start.toordinal() - bot.EPOCH_ORDINAL, end.toordinal() - bot.EPOCH_ORDINAL
+    order = np.argsort(snapshot.days, kind="stable")
+    expected = [int(pos) for pos in order[::-1] if lo <= snapshot.days[pos] <= hi]
+
+    _, total = snapshot.date_range(start, end, limit=0)
+    assert total == len(expected)
+    pages = [snapshot.date_range(start, end, offset, 7)[0].tolist() for offset in range(0, total, 7)]
+    assert all(len(page) == 7 for page in pages[:-1])
+    assert sum(pages, []) == expected
+    assert snapshot.date_range(start, end, total, 7)[0].tolist() == []
+    assert snapshot.date_range(end, start)[1] == 0
@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+import pytest
+
+import bot
+
+# דרגות לא אחידות, כדי שיהיו גם קלפים נדירים עם פערים ארוכים (ואולי בלי הופעה בכלל)
+SKEWED = [0.3, 0.25, 0.2, 0.12, 0.08, 0.04, 0.01, 0.0]
+
+
+def brute_gaps(cards: np.ndarray):
+    shape = (bot.NUM_COLUMNS, bot.NUM_RANKS)
+    last = np.full(shape, -1)
+    count, total, longest = np.zeros(shape, int), np.zeros(shape, int), np.zeros(shape, int)
+    for pos, row in enumerate(cards.tolist()):
+        for col, rank in enumerate(row):
+            if last[col, rank] >= 0:
+                gap = pos - last[col, rank]
+                count[col, rank] += 1
+                total[col, rank] += gap
+                longest[col, rank] = max(longest[col, rank], gap)
+            last[col, rank] = pos
+    return last, count, total, longest
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_gap_index_matches_brute_force(seed, random_cards):
+    cards = random_cards(600, seed, p=SKEWED)
+    index = bot.GapIndex()
+    rng = random.Random(seed)
+    start = 0
+    while start < len(cards):
+        # שורות בודדות (push) וגושים גדולים מ־32 (המסלול הווקטורי), לסירוגין
+        end = start + rng.choice([1, 5, 33, 200])
+        index.extend(cards[start:end])
+        start = end
+        stats = index.export()
+        last, count, total, longest = brute_gaps(cards[:min(end, len(cards))])
+        assert np.array_equal(stats.last_seen, last)
+        assert np.array_equal(stats.gap_count, count)
+        assert np.array_equal(stats.gap_sum, total)
+        assert np.array_equal(stats.gap_max, longest)
+
+
+def test_coldest_and_streak(random_cards):
+    cards = random_cards(400, seed=4, p=SKEWED)
+    index = bot.GapIndex()
+    index.extend(cards)
+    gaps = index.export()
+    for col in range(bot.NUM_COLUMNS):
+        for rank in range(bot.NUM_RANKS):
+            seen = np.flatnonzero(cards[:, col] == rank)
+            expected = len(cards) - 1 - seen[-1] if len(seen) else len(cards)
+            assert gaps.streak[col, rank] == expected
+
+    cold = gaps.coldest(5)
+    streaks = [card.streak for card in cold]
+    assert streaks == sorted(gaps.streak.ravel().tolist(), reverse=True)[:5]
+    # הדרגה שלא יוצאת אף פעם – הכי קרה, עם כל ההיסטוריה כרצף
+    assert cold[0].rank == bot.RANKS[7] and cold[0].streak == len(cards) and cold[0].max_gap == 0
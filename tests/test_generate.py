@@ -0,0 +1,28 @@
+import argparse
+
+import pytest
+
+from benchmarks.generate import parse_size
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1k", 1_000), ("5k", 5_000), ("20K", 20_000), ("100k", 100_000),
+    ("1m", 1_000_000), ("2.5m", 2_500_000), ("1_000", 1_000), ("750", 750), (" 3k ", 3_000),
+])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "k", "abc", "5x", "0", "-3k", "1.5", "0.0001k", "nan", "infk"])
+def test_parse_size_rejects(text):
+    with pytest.raises(argparse.ArgumentTypeError, match="invalid size"):
+        parse_size(text)
+
+
+def test_parse_size_as_argparse_type(capsys):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--synthetic", type=parse_size)
+    assert parser.parse_args(["--synthetic", "5k"]).synthetic == 5_000
+    with pytest.raises(SystemExit):
+        parser.parse_args(["--synthetic", "5q"])
+    assert "invalid size '5q'" in capsys.readouterr().err
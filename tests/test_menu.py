@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+import telegram
+
+import bot
+
+BUTTONS = [value for name, value in vars(bot).items() if name.startswith("BTN_")]
+
+
+def without_emoji(label: str) -> str:
+    return label.split(" ", 1)[1]
+
+
+def test_every_button_is_routed():
+    assert set(BUTTONS) == set(bot.MENU_ROUTES)
+
+
+@pytest.mark.parametrize("label", BUTTONS)
+def test_label_with_and_without_emoji(label):
+    route = bot.MENU_ROUTES[label]
+    assert bot.resolve_menu(label) is route
+    assert bot.resolve_menu(without_emoji(label)) is route
+    assert bot.resolve_menu("  " + without_emoji(label).rstrip("?") + "  ") is route
+
+
+@pytest.mark.parametrize("label", BUTTONS)
+def test_normalized_label_has_no_symbols(label):
+    assert bot.normalize_label(label) == without_emoji(label).rstrip("?")
+
+
+@pytest.mark.parametrize("text, label", [
+    ("10 ההגרלות האחרונות", bot.BTN_LAST_10),           # מקלדת ישנה בלי אימוג׳י
+    ("🎰 10 ההגרלות", bot.BTN_LAST_10),                 # רק תחילת התווית
+    ("  💳   רכישת   מנוי ", bot.BTN_BUY),
+    ("מה היתרון של הבוט", bot.BTN_ADVANTAGE),
+])
+def test_old_labels_resolve_by_prefix(text, label):
+    assert bot.resolve_menu(text) is bot.MENU_ROUTES[label]
+
+
+@pytest.mark.parametrize("text", ["", "שלום", "מה", "🎰", "ℹ️", "/start"])
+def test_unrelated_text_falls_through(text):
+    assert bot.resolve_menu(text) is None
+
+
+@pytest.mark.parametrize("text, handler", [(bot.BTN_INFO, "handle_info"), ("שלום", "fallback")])
+def test_each_message_is_measured_once(text, handler, message, monkeypatch):
+    monkeypatch.setattr(bot, "TOKEN", "123:abc")
+    monkeypatch.setattr(bot, "metrics", bot.Metrics())
+    monkeypatch.setattr(bot, "is_subscriber", lambda uid: False)
+    replies = []
+
+    async def reply_text(self, text, **kwargs):
+        replies.append(text)
+
+    monkeypatch.setattr(telegram.Message, "reply_text", reply_text)
+    update = message(text)
+    app = bot.build_application()
+    matched = [h for h in app.handlers[0] if h.check_update(update)]
+    assert len(matched) == 1
+    asyncio.run(matched[0].callback(update, None))
+
+    assert len(replies) == 1
+    calls = {dict(labels)["handler"]: h.count for labels, h in bot.metrics.series("handler_seconds")}
+    assert calls == {handler: 1}
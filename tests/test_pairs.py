@@ -0,0 +1,53 @@
+import numpy as np
+
+import bot
+
+
+def brute_pairs(cards: np.ndarray) -> np.ndarray:
+    pairs = np.zeros((bot.NUM_COLUMNS, bot.NUM_COLUMNS, bot.NUM_RANKS, bot.NUM_RANKS), dtype=np.int64)
+    for row in cards.tolist():
+        for i in range(bot.NUM_COLUMNS):
+            for j in range(bot.NUM_COLUMNS):
+                pairs[i, j, row[i], row[j]] += 1
+    return pairs
+
+
+def test_count_pairs_matches_brute_force(random_cards):
+    cards = random_cards(500)
+    pairs = bot.count_pairs(cards)
+    assert np.array_equal(pairs, brute_pairs(cards))
+    # האלכסון של כל עמודה מול עצמה הוא בדיוק הספירה של העמודה
+    for col in range(bot.NUM_COLUMNS):
+        assert np.array_equal(np.diag(pairs[col, col]), bot.count_columns(cards)[col])
+
+
+def test_pair_lift(random_cards):
+    cards = random_cards(400, seed=2)
+    stats = bot.calc_card_stats(cards)
+    n = len(cards)
+    a, b = bot.RANK_INDEX["J"], bot.RANK_INDEX["7"]
+    together = int(np.sum((cards[:, 0] == a) & (cards[:, 2] == b)))
+    p_a = (np.sum(cards[:, 0] == a) + 1) / (n + bot.NUM_RANKS)
+    p_b = (np.sum(cards[:, 2] == b) + 1) / (n + bot.NUM_RANKS)
+    joint = (together + 1) / (n + bot.NUM_RANKS ** 2)
+    assert np.isclose(stats.pair_lift("J", 0, "7", 2), joint / (p_a * p_b))
+    assert np.isclose(stats.pair_lift("J", 0, "7", 2), stats.pair_lift("7", 2, "J", 0))
+
+
+def test_top_partners_matches_brute_force(random_cards):
+    cards = random_cards(300, seed=3)
+    stats = bot.calc_card_stats(cards)
+    for column in range(bot.NUM_COLUMNS):
+        for rank in bot.RANKS:
+            a = bot.RANK_INDEX[rank]
+            together = []
+            for col in range(bot.NUM_COLUMNS):
+                if col == column:
+                    continue
+                for b, other in enumerate(bot.RANKS):
+                    count = int(np.sum((cards[:, column] == a) & (cards[:, col] == b)))
+                    together.append((-count, -stats.pair_lift(rank, column, other, col), col, b))
+            expected = [(bot.RANKS[b], col, -count) for count, _, col, b in sorted(together)[:3]]
+            partners = stats.top_partners(rank, column, top_n=3)
+            assert [(p.rank, p.column, p.count) for p in partners] == expected
+            assert all(p.column != column for p in partners)
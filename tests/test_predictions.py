@@ -0,0 +1,48 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def service(tmp_path, open_state):
+    return lambda csv_path: bot.PredictionService(bot.DrawStore(csv_path), open_state(tmp_path / "state.db"))
+
+
+def test_nothing_is_computed_on_read(tmp_path, draw_lines, monkeypatch, service):
+    csv_path = tmp_path / "Chance.csv"
+    csv_path.write_text(draw_lines(range(1, 501)))
+    predictions = service(csv_path)
+    calls = []
+    monkeypatch.setattr(bot, "compute_predictions", lambda *args: calls.append(args))
+    assert predictions.current is None
+    assert predictions.current is None
+    assert calls == []
+
+
+def test_refresh_publishes_a_snapshot_per_draws_version(tmp_path, draw_lines, service):
+    csv_path = tmp_path / "Chance.csv"
+    csv_path.write_text(draw_lines(range(1, 501)))
+    predictions = service(csv_path)
+    computed = predictions.refresh()
+    assert predictions.current is computed
+    assert len(computed.sets) == 3 and computed.predict_text and computed.hot_text
+    # אותן הגרלות – אותו snapshot, בלי לחשב שוב
+    assert predictions.refresh() is computed
+    assert predictions.refresh(force=True).version == computed.version + 1
+
+    with csv_path.open("a") as f:
+        f.write(draw_lines(range(501, 511), seed=2))
+    fresh = predictions.refresh()
+    assert fresh is predictions.current and fresh.draws_version == computed.draws_version + 1
+
+
+def test_other_workers_adopt_the_shared_snapshot(tmp_path, draw_lines, monkeypatch, service):
+    csv_path = tmp_path / "Chance.csv"
+    csv_path.write_text(draw_lines(range(1, 501)))
+    computed = service(csv_path).refresh()
+
+    def fail(*args):
+        raise AssertionError("should be loaded from STATE_DB")
+
+    monkeypatch.setattr(bot, "compute_predictions", fail)
+    assert service(csv_path).refresh().sets == computed.sets
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import bot
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bot.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_refill(clock):
+    limiter = bot.ActionLimiter({"menu": (1.0, 3)})
+    assert [limiter.hit(1, "menu")[0] for _ in range(4)] == [True, True, True, False]
+    clock.now += 1.0
+    assert limiter.hit(1, "menu")[0]
+    assert not limiter.hit(1, "menu")[0]
+
+
+def test_notifies_once_per_streak(clock):
+    limiter = bot.ActionLimiter({"auto_card": (0.2, 1)})
+    assert limiter.hit(1, "auto_card") == (True, False)
+    assert limiter.hit(1, "auto_card") == (False, True)
+    assert limiter.hit(1, "auto_card") == (False, False)
+    clock.now += 5
+    assert limiter.hit(1, "auto_card") == (True, False)
+    assert limiter.hit(1, "auto_card") == (False, True)
+
+
+def test_buckets_are_per_user_and_action(clock):
+    limiter = bot.ActionLimiter({"menu": (1.0, 1), "page": (1.0, 1)})
+    assert limiter.hit(1, "menu")[0]
+    assert limiter.hit(1, "page")[0]
+    assert limiter.hit(2, "menu")[0]
+    assert not limiter.hit(1, "menu")[0]
+
+
+def test_evicts_least_recently_used(clock):
+    limiter = bot.ActionLimiter({"menu": (1.0, 1)}, max_keys=2)
+    limiter.hit(1, "menu")
+    limiter.hit(2, "menu")
+    limiter.hit(1, "menu")          # 1 הוא עכשיו האחרון שנגעו בו
+    limiter.hit(3, "menu")
+    assert len(limiter) == 2
+    assert not limiter.hit(1, "menu")[0]    # עדיין ריק – לא נזרק
+    assert limiter.hit(2, "menu")[0]        # נזרק ומתחיל מלא
+
+
+def test_take_spent_and_merge(clock):
+    limiter = bot.ActionLimiter({"command": (0.5, 4)})
+    limiter.hit(1, "/draws", "command")
+    limiter.hit(1, "/draws", "command")
+    assert limiter.take_spent() == [(1, "/draws", 0.5, 4, 2)]
+    assert limiter.take_spent() == []
+    # תהליך אחר ניצל את השאר
+    limiter.merge([(1, "/draws", 0.0)])
+    assert not limiter.hit(1, "/draws", "command")[0]
+
+
+@pytest.mark.parametrize("text, action", [
+    ("/draws 10", ("/draws", "command")),
+    ("/Start", ("/start", "command")),
+    ("/draw@chance_bot 52000", ("/draw", "command")),
+    ("/x0", ("command", "command")),
+    (bot.BTN_AUTO_CARD, ("auto_card", "auto_card")),
+    (bot.BTN_LAST_10, ("menu", "menu")),
+    ("סתם טקסט", ("menu", "menu")),
+])
+def test_update_action(text, action, message):
+    assert bot.update_action(message(text)) == action
+
+
+def test_rotating_unknown_commands_share_one_bucket(clock, message):
+    limiter = bot.ActionLimiter(bot.RATE_LIMITS)
+    allowed = [limiter.hit(42, *bot.update_action(message(f"/x{i}")))[0] for i in range(20)]
+    assert sum(allowed) == bot.RATE_LIMITS["command"][1]
+    assert len(limiter) == 1
+
+
+def test_admin_commands_are_not_limited(clock, message, monkeypatch):
+    limiter = bot.ActionLimiter(bot.RATE_LIMITS)
+    monkeypatch.setattr(bot, "limiter", limiter)
+    admin = bot.ADMIN_IDS[0]
+
+    async def grant_many():
+        for uid in range(20):
+            await bot.rate_limit_gate(message(f"/grant {uid} 1", chat_id=admin), None)
+
+    asyncio.run(grant_many())      # ApplicationHandlerStop היה עוצר כאן
+    assert len(limiter) == 0
+    # אותה פקודה ממשתמש רגיל – נחסמת אחרי ה־burst
+    user = message("/grant 1 1", chat_id=admin + 1)
+    allowed = [limiter.hit(user.effective_user.id, *bot.update_action(user))[0] for _ in range(5)]
+    assert allowed == [True] * bot.RATE_LIMITS["command"][1] + [False]
@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+
+import bot
+
+
+def test_remote_change_during_local_write_does_not_win(tmp_path, open_state):
+    """שינוי של תהליך אחר שנכתב לפני הכתיבה שלנו לא דורס את השינוי המקומי."""
+    path = tmp_path / "state.db"
+    local, remote = bot.SubscriberStore(open_state(path)), open_state(path)
+    local.load()
+    uid = 111
+    ours, theirs = 2_000_000_000, 1_900_000_000
+    writing, synced = threading.Event(), threading.Event()
+    write = local.state.write_subscribers
+
+    def slow_write(changes):
+        # תהליך אחר כותב לפנינו, ואנחנו עוד באמצע הכתיבה כש־sync רץ
+        remote.write_subscribers([(uid, theirs)])
+        writing.set()
+        synced.wait(0.5)
+        return write(changes)
+
+    local.state.write_subscribers = slow_write
+
+    async def scenario():
+        local.grant(uid, ours)
+        await asyncio.get_running_loop().run_in_executor(None, writing.wait)
+        try:
+            await local.sync()
+        finally:
+            synced.set()
+        await local.flushed()
+        await local.sync()
+
+    asyncio.run(scenario())
+    uids, expiries, _ = remote.load_subscribers()
+    assert dict(zip(uids.tolist(), expiries.tolist())) == {uid: ours}
+    assert local.get(uid) == ours
+
+
+def test_spend_tokens_shares_balance_between_workers(tmp_path, open_state):
+    path = tmp_path / "state.db"
+    first, second = open_state(path), open_state(path)
+    now = time.time()
+    assert first.spend_tokens([(1, "/draws", 0.5, 4, 3)], now) == [(1, "/draws", 1.0)]
+    # אותו משתמש בתהליך אחר – היתרה כבר כוללת את מה שנוצל בראשון
+    assert second.spend_tokens([(1, "/draws", 0.5, 4, 1)], now) == [(1, "/draws", 0.0)]
+    [(_, _, refilled)] = first.spend_tokens([(1, "/draws", 0.5, 4, 0)], now + 2)
+    assert refilled == 1.0
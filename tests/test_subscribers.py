@@ -0,0 +1,200 @@
+import asyncio
+import heapq
+import json
+import random
+import sqlite3
+import time
+
+import numpy as np
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch, open_state):
+    # הפורמט הקודם נקרא מהתיקייה הנוכחית – שלא ייקרא subscribers.json אמיתי
+    monkeypatch.setattr(bot, "SUBSCRIBERS_FILE", tmp_path / "subscribers.json")
+    monkeypatch.setattr(bot, "SUBSCRIBERS_JOURNAL", tmp_path / "subscribers.journal")
+    return open_state(tmp_path / "state.db")
+
+
+def open_store(state: bot.SharedState) -> bot.SubscriberStore:
+    store = bot.SubscriberStore(state)
+    store.load()
+    return store
+
+
+def contents(store: bot.SubscriberStore) -> dict:
+    return dict(store.table.items())
+
+
+def test_subscription_table_matches_dict():
+    rng = random.Random(1)
+    table, reference = bot.SubscriptionTable(8), {}
+    for _ in range(20_000):
+        uid = rng.randrange(1, 3000)
+        op = rng.random()
+        if op < 0.5:
+            expiry = rng.randrange(1, 2**32)
+            table.set(uid, expiry)
+            reference[uid] = expiry
+        elif op < 0.8:
+            assert table.pop(uid) == reference.pop(uid, None)
+        else:
+            assert table.get(uid) == reference.get(uid)
+            assert (uid in table) == (uid in reference)
+    assert len(table) == len(reference)
+    assert dict(table.items()) == reference
+    assert sorted(table.keys()) == sorted(reference)
+
+
+def test_subscription_table_from_entries():
+    rng = np.random.default_rng(2)
+    uids = np.unique(rng.integers(1, 10**12, size=5000))
+    expiries = rng.integers(1, 2**32, size=len(uids), dtype=np.uint32)
+    table = bot.SubscriptionTable.from_entries(uids, expiries)
+    assert len(table) == len(uids)
+    assert dict(table.items()) == dict(zip(uids.tolist(), expiries.tolist()))
+    # אחרי בנייה וקטורית – הכנסה ומחיקה רגילות ממשיכות לעבוד על אותם מסלולים
+    uid = int(uids[0])
+    assert table.pop(uid) == int(expiries[0])
+    assert table.get(uid) is None
+    table.set(uid, 7)
+    assert table.get(uid) == 7
+
+
+def test_expiry_heap_pops_in_order():
+    rng = random.Random(3)
+    heap, reference = bot.ExpiryHeap(), []
+    for i in range(5000):
+        if reference and rng.random() < 0.4:
+            assert heap.pop() == heapq.heappop(reference)
+        else:
+            entry = (rng.randrange(2**32), i)
+            heap.push(*entry)
+            heapq.heappush(reference, entry)
+        assert heap.peek() == (reference[0][0] if reference else None)
+    assert [heap.pop() for _ in range(len(heap))] == sorted(reference)
+
+
+def test_expiry_heap_from_entries():
+    expiries = np.array([50, 10, 30, 10, 20], dtype=np.uint32)
+    uids = np.array([1, 2, 3, 4, 5], dtype=np.int64)
+    heap = bot.ExpiryHeap.from_entries(expiries, uids)
+    heap.push(15, 6)
+    assert [heap.pop()[0] for _ in range(len(heap))] == [10, 10, 15, 20, 30, 50]
+
+
+def test_changes_survive_a_restart(state):
+    store = open_store(state)
+    store.grant(1, 100)
+    store.grant(2, 200)
+    store.grant(2, 250)
+    store.revoke(1)
+    assert contents(open_store(state)) == {2: 250}
+
+
+def test_legacy_files_are_imported(state, tmp_path):
+    (tmp_path / "subscribers.json").write_text(json.dumps({"1": 100.5, "2": 200}))
+    with (tmp_path / "subscribers.journal").open("w") as f:
+        f.write('["grant","3",300]\n["revoke","1"]\n["grant","2",2')     # שורה אחרונה חלקית
+    assert contents(open_store(state)) == {2: 200, 3: 300}
+
+
+def test_legacy_files_are_imported_only_once(state, tmp_path, open_state):
+    (tmp_path / "subscribers.json").write_text(json.dumps({"111": 2_000_000_000, "222": 100}))
+    store = open_store(state)
+    assert contents(store) == {111: 2_000_000_000, 222: 100}
+    store.revoke(111)
+    assert asyncio.run(store.expire_due(now=200)) == [222]
+    # עלייה מחדש עם טבלה ריקה – הקבצים הישנים עדיין שם, אבל כבר יובאו
+    restarted = open_store(open_state(tmp_path / "state.db"))
+    assert contents(restarted) == {}
+    assert asyncio.run(restarted.expire_due(now=200)) == []
+    assert not state.import_subscribers({333: 300})
+
+
+def test_legacy_files_are_not_imported_into_a_used_database(state, tmp_path):
+    # מסד מלפני legacy_imported: כבר היו בו שינויים, והטבלה התרוקנה
+    state.write_subscribers([(1, 100), (1, None)])
+    (tmp_path / "subscribers.json").write_text(json.dumps({"111": 2_000_000_000}))
+    assert contents(open_store(state)) == {}
+
+
+def test_expire_due_removes_only_what_is_due(state):
+    store = open_store(state)
+    store.grant(1, 100)
+    store.grant(2, 200)
+    store.grant(3, 300)
+    store.revoke(3)
+    store.grant(2, 250)          # חידוש – הרשומה הישנה ב־heap כבר לא תואמת
+    assert asyncio.run(store.expire_due(now=260, limit=1)) == [1]
+    assert asyncio.run(store.expire_due(now=260)) == [2]
+    assert asyncio.run(store.expire_due(now=260)) == []
+    assert len(store) == 0
+    assert contents(open_store(state)) == {}
+
+
+def test_expire_due_keeps_subscribers_when_the_write_fails(state, monkeypatch):
+    store = open_store(state)
+    store.grant(1, 100)
+    store.grant(2, 200)
+
+    def locked(candidates):
+        raise sqlite3.OperationalError("database is locked")
+
+    write = state.expire_subscribers
+    monkeypatch.setattr(state, "expire_subscribers", locked)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(store.expire_due(now=300))
+    assert store.get(1) == 100 and store.get(2) == 200
+    assert len(store.expiries) == 2
+
+    monkeypatch.setattr(state, "expire_subscribers", write)
+    assert sorted(asyncio.run(store.expire_due(now=300))) == [1, 2]
+    assert len(store) == 0
+
+
+def test_changes_are_written_in_one_batch(state, monkeypatch):
+    store = open_store(state)
+    writes = []
+    write = state.write_subscribers
+
+    def counted(changes):
+        writes.append(len(changes))
+        return write(changes)
+
+    monkeypatch.setattr(state, "write_subscribers", counted)
+
+    async def scenario():
+        for uid in range(1, 101):
+            store.grant(uid, 1000 + uid)
+        store.revoke(5)
+        store.grant(6, 2000)
+        # הכל כבר בזיכרון, עוד לפני שנכתב
+        assert store.get(7) == 1007 and 5 not in store
+        await store.flushed()
+
+    asyncio.run(scenario())
+    # שינוי אחרון לכל משתמש, בטרנזקציה אחת
+    assert writes == [100]
+    assert len(contents(open_store(state))) == 99
+
+
+def test_sync_pulls_changes_from_another_worker(state, tmp_path, monkeypatch, open_state):
+    other = open_state(tmp_path / "state.db")
+    ours, theirs = open_store(state), open_store(other)
+    theirs.grant(1, 100)
+    theirs.grant(2, 200)
+    theirs.revoke(1)
+    asyncio.run(ours.sync())
+    assert contents(ours) == {2: 200}
+    # היומן כבר קוצר מעבר למה שראינו – טעינה מלאה
+    monkeypatch.setattr(bot, "STATE_CHANGES_KEEP", 1)
+    theirs.grant(3, 300)
+    theirs.grant(4, 400)
+    other.prune(time.time())
+    assert other.subscriber_changes(ours.seq) is None
+    asyncio.run(ours.sync())
+    assert contents(ours) == {2: 200, 3: 300, 4: 400}
@@ -0,0 +1,66 @@
+import asyncio
+import random
+from collections import defaultdict
+
+from telegram import Update
+
+import bot
+
+
+def test_per_chat_order_with_bounded_concurrency(message):
+    rng = random.Random(1)
+    updates = [message(chat_id=rng.randrange(8), update_id=i) for i in range(300)]
+    delays = [rng.random() * 0.003 for _ in updates]
+    started, finished = defaultdict(list), defaultdict(list)
+    active = peak = 0
+
+    async def handle(update: Update, delay: float):
+        nonlocal active, peak
+        chat = update.effective_chat.id
+        started[chat].append(update.update_id)
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(delay)
+        active -= 1
+        finished[chat].append(update.update_id)
+
+    async def scenario():
+        processor = bot.ChatOrderedProcessor(max_concurrent=4)
+        # כמו PTB: משימה לכל עדכון, לפי סדר ההגעה
+        tasks = [asyncio.create_task(processor.process_update(u, handle(u, d))) for u, d in zip(updates, delays)]
+        await asyncio.gather(*tasks)
+        return processor
+
+    processor = asyncio.run(scenario())
+    for chat in started:
+        expected = [u.update_id for u in updates if u.effective_chat.id == chat]
+        assert started[chat] == expected
+        assert finished[chat] == expected
+    assert 1 < peak <= 4
+    assert processor.processed == len(updates)
+    assert processor.pending == 0 and processor._chats == {}
+
+
+def test_waiting_chat_does_not_take_a_slot(message):
+    """צ'אט עם עדכון איטי לא חוסם צ'אט אחר, גם כשיש לו עוד עדכונים בתור."""
+    order = []
+
+    async def handle(name: str, delay: float):
+        await asyncio.sleep(delay)
+        order.append(name)
+
+    async def scenario():
+        processor = bot.ChatOrderedProcessor(max_concurrent=2)
+        slow = [
+            processor.process_update(message(chat_id=1, update_id=i), handle(f"slow{i}", 0.05)) for i in range(3)
+        ]
+        fast = processor.process_update(message(chat_id=2, update_id=10), handle("fast", 0))
+        await asyncio.gather(*slow, fast)
+
+    asyncio.run(scenario())
+    assert order == ["fast", "slow0", "slow1", "slow2"]
+
+
+def test_updates_without_a_chat_are_not_serialized(message):
+    assert bot.ChatOrderedProcessor.order_key(object()) is None
+    assert bot.ChatOrderedProcessor.order_key(message(chat_id=5)) == 5
@@ -0,0 +1,71 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def body(update_data):
+    return lambda update_id: json.dumps(update_data("/start", update_id, update_id)).encode()
+
+
+def server(pending: int = 0, secret: str = "") -> bot.WebhookServer:
+    app = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+    processor = SimpleNamespace(pending=pending)
+    return bot.WebhookServer(app, processor, "127.0.0.1", 0, "/telegram", secret)
+
+
+def request(webhook: bot.WebhookServer, method: str, target: str, body: bytes = b"", headers: dict = None):
+    return asyncio.run(webhook._handle(method, target, headers or {}, body))
+
+
+def post(webhook: bot.WebhookServer, body: bytes, headers: dict = None) -> int:
+    return request(webhook, "POST", "/telegram", body, headers)[0]
+
+
+def test_accepts_and_deduplicates(body):
+    webhook = server()
+    assert post(webhook, body(1)) == 200
+    assert post(webhook, body(1)) == 200
+    assert webhook.app.update_queue.qsize() == 1
+    assert webhook.duplicates == 1
+
+
+def test_rejects_when_the_queue_is_full(body):
+    webhook = server()
+    for update_id in range(bot.WEBHOOK_QUEUE_SIZE):
+        webhook.app.update_queue.put_nowait(update_id)
+    assert post(webhook, body(1)) == 503
+    webhook.app.update_queue.get_nowait()
+    assert post(webhook, body(1)) == 200
+
+
+def test_rejects_when_the_processor_is_backed_up(body):
+    # התור של PTB ריק (הוא מתרוקן מיד למשימות), אבל בעיבוד כבר יש WEBHOOK_QUEUE_SIZE עדכונים
+    webhook = server(pending=bot.WEBHOOK_QUEUE_SIZE)
+    assert post(webhook, body(1)) == 503
+    assert webhook.app.update_queue.qsize() == 0
+    webhook.processor.pending -= 1
+    assert post(webhook, body(1)) == 200
+
+
+def test_checks_the_secret_and_the_body(body):
+    webhook = server(secret="s3cret")
+    assert post(webhook, body(1)) == 403
+    assert post(webhook, b"{", {"x-telegram-bot-api-secret-token": "s3cret"}) == 400
+    assert post(webhook, body(1), {"x-telegram-bot-api-secret-token": "s3cret"}) == 200
+
+
+def test_healthz_and_draining(body):
+    webhook = server()
+    post(webhook, body(1))
+    status, payload = request(webhook, "GET", "/healthz")
+    assert status == 200 and json.loads(payload)["received"] == 1
+    assert json.loads(payload)["backlog"] == 1
+    webhook.draining = True
+    assert request(webhook, "GET", "/healthz")[0] == 503
+    assert post(webhook, body(2)) == 503
+    assert request(webhook, "GET", "/other")[0] == 404
@@ -0,0 +1,66 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+import bot
+
+
+def chunks(cards: np.ndarray, seed: int):
+    """אותה היסטוריה בגושים אקראיים – שורה בודדת, גוש קטן מהחלון וגוש גדול ממנו."""
+    rng = random.Random(seed)
+    start = 0
+    while start < len(cards):
+        end = start + rng.choice([1, 3, 40, 250])
+        yield cards[start:end]
+        start = end
+
+
+@pytest.mark.parametrize("size", [1, 10, 50, 200])
+def test_sliding_window_matches_full_recount(size, random_cards):
+    cards = random_cards(700, seed=size)
+    window = bot.SlidingWindowCounts(size)
+    seen = 0
+    for block in chunks(cards, seed=size):
+        window.extend(block)
+        seen += len(block)
+        expected = cards[max(0, seen - size):seen]
+        assert window.n_draws == len(expected)
+        assert np.array_equal(window.counts, bot.count_columns(expected))
+        assert np.array_equal(window.pairs, bot.count_pairs(expected))
+
+
+def test_push_and_extend_agree(random_cards):
+    cards = random_cards(300, seed=7)
+    pushed, extended = bot.SlidingWindowCounts(50), bot.SlidingWindowCounts(50)
+    for row in cards.tolist():
+        pushed.push(row)
+    extended.extend(cards)
+    assert np.array_equal(pushed.counts, extended.counts)
+    assert np.array_equal(pushed.pairs, extended.pairs)
+
+
+def test_live_windows_stay_consistent_through_incremental_ingest(tmp_path, draw_lines):
+    csv_path = tmp_path / "Chance.csv"
+    csv_path.write_text(draw_lines(range(1, 121)))
+    store = bot.DrawStore(csv_path)
+    assert store.snapshot().window_mismatches() == []
+    first = 121
+    for step, count in enumerate([1, 5, 300, 2, 1000]):
+        with csv_path.open("a") as f:
+            f.write(draw_lines(range(first, first + count), seed=step + 2))
+        first += count
+        snapshot = store.snapshot()
+        assert snapshot.count == first - 1
+        assert snapshot.window_mismatches() == []
+
+
+def test_window_mismatches_reports_a_bad_window(tmp_path, draw_lines):
+    csv_path = tmp_path / "Chance.csv"
+    csv_path.write_text(draw_lines(range(1, 301)))
+    snapshot = bot.DrawStore(csv_path).snapshot()
+    stale = dict(snapshot.windows)
+    stale[50] = bot.calc_card_stats(snapshot.cards[-51:-1])
+    broken = dataclasses.replace(snapshot, windows=stale)
+    assert broken.window_mismatches() == [50]